@@ -1,6 +1,7 @@
 import atexit
 import base64
 import glob
+import json
 import logging
 import os
 import threading
@@ -21,14 +22,21 @@ import time
 import signal
 from flask_socketio import SocketIO
 import flask
-from flask import Flask, request, jsonify, abort, send_file, send_from_directory
+from flask import Flask, Response, request, jsonify, abort, send_file, send_from_directory, stream_with_context
 from sqlalchemy.testing import db
 from sympy.physics.vector.printing import params
 
 from backend.dbInterface.db_interface import DatabaseInterface
 from backend.queryFilter.query_filter import QueryFilter
-from backend.reidentification.reidentification import ReIDProcessor
-from backend.spatiotemporalAnalysis.spatiotemporal_analysis import SpatiotemporalAnalysis
+from backend.reidentification.embedding import decode_vector, encode_vector
+from backend.reidentification.embedding_cache import EmbeddingCache
+from backend.reidentification.feature_session import FeatureSessionStore
+from backend.reidentification.gallery_index import GalleryIndex
+from backend.reidentification.inference_backends import configure_threads
+from backend.reidentification.model_registry import model_registry, yolo_model_name
+from backend.reidentification.reidentification import ReIDProcessor, set_reid_backend
+from backend.spatiotemporalAnalysis.spatiotemporal_analysis import FILTER_MODES, SpatiotemporalAnalysis
+from backend.spatiotemporalAnalysis.travel_matrix import CameraTravelMatrix
 from backend.track.person_tracker import PersonTracker
 from flask_cors import CORS, cross_origin
 
@@ -96,6 +104,10 @@ db_config = {
     'user': 'root',
     'password': '123456',
     'database': 'trajectory',
+    # 连接池配置：Flask请求线程、Socket.IO处理器共享同一个连接池
+    'pool_min_size': 2,
+    'pool_max_size': 10,
+    'pool_timeout': 30,
 }
 
 # 应用退出时清理所有进程
@@ -111,6 +123,21 @@ def cleanup_resources():
                 logger.error(f"终止摄像头 {camera_id} 进程失败: {str(e)}")
 
 
+# 启动时预热的模型：默认的 MGN 重识别模型和检测用的 YOLO
+MODEL_WARMUP = True
+MODEL_WARMUP_NAMES = ['reid:mgn', yolo_model_name()]
+# 各重识别模型的推理后端（'eager'、'torchscript'、'int8'），用 benchmark_reid_backends 在部署机器上选择
+REID_BACKENDS = {'mgn': 'eager', 'agw': 'eager', 'sbs': 'eager'}
+# PyTorch 线程数：intra-op 为 0 时使用全部 CPU 核；inter-op 为 1 避免与 Flask 请求线程争抢
+TORCH_INTRA_OP_THREADS = 0
+TORCH_INTER_OP_THREADS = 1
+# 视频裁剪图特征缓存的大小上限，相同视频窗口再次提取特征时跳过解码、检测和前向计算
+EMBEDDING_CACHE_MAX_BYTES = 1 << 30
+# 特征提取结果保存在服务端的会话中：内存上限、溢出文件上限、最后一次使用后的有效期
+FEATURE_SESSION_MAX_BYTES = 256 << 20
+FEATURE_SESSION_MAX_SPILL_BYTES = 2 << 30
+FEATURE_SESSION_TTL_SECONDS = 2 * 3600
+
 # 视频文件存储路径
 VIDEO_STORAGE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), './resources/videos')
 if not os.path.exists(VIDEO_STORAGE_PATH):
@@ -120,9 +147,65 @@ if not os.path.exists(VIDEO_STORAGE_PATH):
 db_interface = DatabaseInterface(db_config)
 # 使用初始化后的数据库接口创建查询过滤器
 query_filter = QueryFilter(db_interface)
-reid_processor = ReIDProcessor()
+reid_processor = ReIDProcessor(db_interface, embedding_cache=EmbeddingCache(max_bytes=EMBEDDING_CACHE_MAX_BYTES))
+feature_sessions = FeatureSessionStore(max_bytes=FEATURE_SESSION_MAX_BYTES,
+                                       max_spill_bytes=FEATURE_SESSION_MAX_SPILL_BYTES,
+                                       ttl_seconds=FEATURE_SESSION_TTL_SECONDS)
+atexit.register(feature_sessions.clear)
+configure_threads(TORCH_INTRA_OP_THREADS, TORCH_INTER_OP_THREADS)
+for _algorithm, _backend in REID_BACKENDS.items():
+    set_reid_backend(_algorithm, _backend)
+# 启动时在后台线程中加载并预热模型，/models/status 返回就绪状态
+if MODEL_WARMUP:
+    model_registry.warmup_async(MODEL_WARMUP_NAMES)
+# student_records.feature_vector 的 FAISS 检索库：启动时后台加载（没有缓存时从数据库重建）并同步
+# 保存之后的变化；之后每隔 GALLERY_SYNC_SECONDS 按 feature_changes 变更日志同步其他进程写入或修改的特征，
+# 每隔 GALLERY_PRUNE_SECONDS 删除数据库中已不存在的记录；应用内保存特征时立即加入，退出时保存
+GALLERY_SYNC_SECONDS = 30
+GALLERY_PRUNE_SECONDS = 600
+gallery_index = GalleryIndex('mgn')
+gallery_ready = threading.Event()
+
+
+def _load_gallery():
+    try:
+        gallery_index.load_or_rebuild(db_interface)
+    except Exception as e:
+        logger.error(f"加载特征检索库失败: {e}", exc_info=True)
+    finally:
+        gallery_ready.set()
+
+    last_prune = time.monotonic()
+    while True:
+        time.sleep(GALLERY_SYNC_SECONDS)
+        try:
+            gallery_index.sync(db_interface)
+            if time.monotonic() - last_prune >= GALLERY_PRUNE_SECONDS:
+                gallery_index.prune(db_interface)
+                last_prune = time.monotonic()
+        except Exception as e:
+            logger.error(f"同步特征检索库失败: {e}", exc_info=True)
+
+
+def _on_feature_saved(record_id, feature_vector, algorithm):
+    if algorithm == gallery_index.algorithm:
+        gallery_index.add_from_db(db_interface, record_id, feature_vector)
+
+
+db_interface.feature_listeners.append(_on_feature_saved)
+threading.Thread(target=_load_gallery, name='gallery-sync', daemon=True).start()
+
+
+@atexit.register
+def save_gallery():
+    if gallery_ready.is_set():
+        gallery_index.save()
+
+
 campus_map = nx.Graph()  # 可以从文件或数据库加载校园地图
-spatiotemporal_analyzer = SpatiotemporalAnalysis(campus_map)
+# 摄像头两两之间的步行时间矩阵，摄像头缓存刷新或校园图变化时重新加载/计算
+travel_matrix = CameraTravelMatrix(campus_map, walking_speed=1.4, camera_registry=db_interface.camera_registry)
+spatiotemporal_analyzer = SpatiotemporalAnalysis(campus_map, travel_matrix=travel_matrix)
 # 创建全局跟踪器实例
 person_tracker = None
 
@@ -178,6 +261,7 @@ def track_by_video():
 
         # 处理文件上传或视频URL
         video_path = None
+        video_url = None
 
         if 'file' in request.files:
             # 处理文件上传
@@ -292,12 +376,19 @@ def track_by_video():
             )
 
             logger.info(f"开始处理视频: {video_path}")
+            # 录像目录中的元数据（首次访问时探测并保存）
+            try:
+                video_metadata = db_interface.video_catalog.get(video_url or video_path, video_path)
+            except Exception as e:
+                logger.warning(f"读取录像元数据失败: {e}")
+                video_metadata = None
             # 执行跟踪
             tracked_video_path = person_tracker.track_people(
                 source=video_path,
                 show=params['show'],
                 max_trace_length=max_trace_length,
-                save_dir=output_dir
+                save_dir=output_dir,
+                metadata=video_metadata
             )
 
             # 重命名结果文件以匹配原始视频名称
@@ -371,7 +462,7 @@ def get_video_path(camera_id):
 
         # 查询数据库检查是否存在跟踪结果
         query = """
-            SELECT tracking_video_path FROM camera_videos 
+            SELECT video_path, tracking_video_path FROM camera_videos 
             WHERE camera_id = %s AND id = %s AND tracking_video_path != ''
         """
         result = db_interface.execute_query(query, (camera_id, video_time_id))
@@ -386,10 +477,16 @@ def get_video_path(camera_id):
         if not tracking_video_path.startswith('http'):
             video_url = f"/api{tracking_video_path}"
 
+        # 原始录像的元数据（时长、帧率、开始时间等）来自录像目录，不需要打开视频
+        metadata = None
+        if result[0]['video_path']:
+            metadata = db_interface.video_catalog.get(result[0]['video_path'])
+
         return jsonify({
             'status': 'success',
             'data': {
-                'tracking_video_url': video_url
+                'tracking_video_url': video_url,
+                'video_metadata': metadata.to_dict() if metadata else None
             }
         })
 
@@ -449,6 +546,12 @@ def open_folder():
         logger.error(f"打开文件夹失败: {str(e)}")
         return jsonify({'status': 'error', 'message': f'打开文件夹失败: {str(e)}'})
 
+# /filter 只需要渲染这些列，摄像头名称由 enhance_filter_results 补充
+FILTER_COLUMNS = ['id', 'student_id', 'camera_id', 'timestamp', 'has_backpack', 'has_umbrella', 'clothing_color']
+# 多天的时间范围会匹配大量记录，分块流式读取以限制内存峰值
+FILTER_CHUNK_SIZE = 5000
+
+
 @app.route('/filter', methods=['POST'])
 def filter_records():
     try:
@@ -478,30 +581,50 @@ def filter_records():
         # 解析属性
         features = data.get('attributes', {})
 
-        # 调用过滤器
-        filter_results = query_filter.filter_process(
+        # 流式过滤：块按时间顺序到达，逐块转换为JSON写入流式响应，内存中只保留当前块
+        chunks = query_filter.iter_filtered_records(
             student_id=student_id,
             features=features,
             time_range=time_range,
-            camera_ids=None
-        )
-
-        # 转换为JSON友好格式
-        results = []
-        for _, row in filter_results['sorted_records'].iterrows():  # 使用已排序的记录
-            record = {
-                'id': int(row.get('id', 0)),
-                'student_id': row.get('student_id', ''),
-                'camera_id': int(row.get('camera_id', 0)),
-                'timestamp': row.get('timestamp', '').strftime("%Y-%m-%d %H:%M:%S"),  # 格式化时间戳
-                'name': row.get('name', ''),
-                'has_backpack': bool(row.get('has_backpack', False)),
-                'has_umbrella': bool(row.get('has_umbrella', False)),
-                'clothing_color': row.get('clothing_color', '')  # 替换 has_bicycle 为 clothing_color
-            }
-            results.append(record)
-
-        return jsonify({'status': 'success', 'data': results})
+            camera_ids=None,
+            columns=FILTER_COLUMNS,
+            chunk_size=FILTER_CHUNK_SIZE)
+        # 先读取第一块，查询出错时仍能返回错误响应
+        first_chunk = next(chunks, None)
+
+        def generate():
+            # status 放在 data 之后，发送过程中出错时仍能标记为失败
+            yield '{"data": ['
+            separator = ''
+            chunk = first_chunk
+            try:
+                while chunk is not None:
+                    for _, row in chunk.iterrows():
+                        record = {
+                            'id': int(row.get('id', 0)),
+                            'student_id': row.get('student_id', ''),
+                            'camera_id': int(row.get('camera_id', 0)),
+                            'timestamp': row.get('timestamp', '').strftime("%Y-%m-%d %H:%M:%S"),  # 格式化时间戳
+                            'name': row.get('name', ''),
+                            'has_backpack': bool(row.get('has_backpack', False)),
+                            'has_umbrella': bool(row.get('has_umbrella', False)),
+                            'clothing_color': row.get('clothing_color', '')  # 替换 has_bicycle 为 clothing_color
+                        }
+                        # 空值（NaN）在 JSON 中写为 null，浏览器的 JSON.parse 不接受 NaN
+                        record = {k: None if isinstance(v, float) and v != v else v for k, v in record.items()}
+                        yield separator + json.dumps(record, ensure_ascii=False, default=str)
+                        separator = ', '
+                    chunk = next(chunks, None)
+            except Exception as e:
+                # 响应已经开始发送，无法再返回错误状态码
+                logger.error(f"流式过滤记录时发生错误: {str(e)}", exc_info=True)
+                yield '], "status": "error", "message": ' + json.dumps(str(e), ensure_ascii=False) + '}'
+                return
+            finally:
+                chunks.close()
+            yield '], "status": "success"}'
+
+        return Response(stream_with_context(generate()), mimetype='application/json')
     except Exception as e:
         logger.error(f"过滤记录时发生错误: {str(e)}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
@@ -515,6 +638,11 @@ def analyze_spatiotemporal():
         if not data or 'records' not in data:
             return jsonify({'status': 'error', 'message': '缺少必要的记录数据'}), 400
 
+        # 过滤模式：greedy（默认）或 optimal
+        mode = data.get('mode', 'greedy')
+        if mode not in FILTER_MODES:
+            return jsonify({'status': 'error', 'message': f'不支持的过滤模式: {mode}'}), 400
+
         # 将前端传来的记录转换为DataFrame
         records_data = data.get('records', [])
         if not records_data:
@@ -554,44 +682,51 @@ def analyze_spatiotemporal():
                     'message': '记录缺少位置信息或摄像头ID'
                 }), 400
 
-        # 调用时空约束分析
-        filtered_records = spatiotemporal_analyzer.filter_by_spatiotemporal_constraints(records_df)
-
-        # 如果过滤后记录没有name字段，尝试重新关联摄像头信息
-        if 'camera_id' in filtered_records.columns and (
-                'name' not in filtered_records.columns or filtered_records['name'].isnull().any()):
-            cameras = db_interface.get_camera_locations()
-            camera_dict = cameras.set_index('camera_id')['name'].to_dict()
-
-            # 直接应用camera_id对应的name，而不是使用merge
-            filtered_records['name'] = filtered_records['camera_id'].apply(
-                lambda x: camera_dict.get(x, f"摄像头{x}")
+        # 调用时空约束分析：greedy 模式按时间顺序分块增量过滤，optimal 模式需要整条序列求最优子序列
+        if mode == 'greedy':
+            records_df = records_df.sort_values('timestamp', kind='stable').reset_index(drop=True)
+            filtered_chunks = spatiotemporal_analyzer.iter_spatiotemporal_filter(
+                records_df.iloc[start:start + FILTER_CHUNK_SIZE]
+                for start in range(0, len(records_df), FILTER_CHUNK_SIZE)
             )
+        else:
+            filtered_chunks = [spatiotemporal_analyzer.filter_by_spatiotemporal_constraints(records_df, mode=mode)]
 
-            # 清理多余列
-            for col in filtered_records.columns:
-                if col.endswith('_x') or col.endswith('_y'):
-                    filtered_records.drop(col, axis=1, inplace=True, errors='ignore')
-
-            logger.info("重新关联摄像头名称信息")
-
-        # 将结果转换为JSON友好的格式
+        # 逐块将结果转换为JSON友好的格式
         result = []
-        for _, row in filtered_records.iterrows():
-            # 确保所有字段都存在，提供默认值
-            record = {
-                'id': int(row.get('id', 0)),
-                'student_id': row.get('student_id', ''),
-                'camera_id': int(row.get('camera_id', 0)),
-                'timestamp': row.get('timestamp', '').strftime("%Y-%m-%d %H:%M:%S"),
-                'name': str(row.get('name', f"摄像头{row.get('camera_id', 0)}")),  # 确保名称是字符串
-                'has_backpack': bool(row.get('has_backpack', False)),
-                'has_umbrella': bool(row.get('has_umbrella', False)),
-                'clothing_color': str(row.get('clothing_color', '')),
-                'location_x': float(row.get('location_x', 0.0)),
-                'location_y': float(row.get('location_y', 0.0))
-            }
-            result.append(record)
+        for filtered_records in filtered_chunks:
+            # 如果过滤后记录没有name字段，尝试重新关联摄像头信息
+            if 'camera_id' in filtered_records.columns and (
+                    'name' not in filtered_records.columns or filtered_records['name'].isnull().any()):
+                camera_dict = db_interface.camera_registry.names
+
+                # 直接应用camera_id对应的name，而不是使用merge
+                filtered_records['name'] = filtered_records['camera_id'].apply(
+                    lambda x: camera_dict.get(x, f"摄像头{x}")
+                )
+
+                # 清理多余列
+                for col in filtered_records.columns:
+                    if col.endswith('_x') or col.endswith('_y'):
+                        filtered_records.drop(col, axis=1, inplace=True, errors='ignore')
+
+                logger.info("重新关联摄像头名称信息")
+
+            for _, row in filtered_records.iterrows():
+                # 确保所有字段都存在，提供默认值
+                record = {
+                    'id': int(row.get('id', 0)),
+                    'student_id': row.get('student_id', ''),
+                    'camera_id': int(row.get('camera_id', 0)),
+                    'timestamp': row.get('timestamp', '').strftime("%Y-%m-%d %H:%M:%S"),
+                    'name': str(row.get('name', f"摄像头{row.get('camera_id', 0)}")),  # 确保名称是字符串
+                    'has_backpack': bool(row.get('has_backpack', False)),
+                    'has_umbrella': bool(row.get('has_umbrella', False)),
+                    'clothing_color': str(row.get('clothing_color', '')),
+                    'location_x': float(row.get('location_x', 0.0)),
+                    'location_y': float(row.get('location_y', 0.0))
+                }
+                result.append(record)
 
         # 输出处理后的结果样例，用于调试
         logger.info(f"返回的结果数量: {len(result)}")
@@ -609,6 +744,47 @@ def analyze_spatiotemporal():
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 
+@app.route('/models/status', methods=['GET'])
+def get_models_status():
+    """获取模型加载/预热状态，ready 为 True 表示启动预热已完成"""
+    return jsonify({
+        'status': 'success',
+        'data': model_registry.status()
+    })
+
+
+def _json_safe_vector(vector):
+    """特征向量编码为 encode_vector 格式的字符串（float16），已编码的字符串原样返回"""
+    if vector is None or isinstance(vector, str):
+        return vector
+    return encode_vector(vector)
+
+
+def _json_safe(item, skip_keys=()):
+    """
+    把一条记录中的 NumPy 值转换为可 JSON 序列化的值
+
+    Args:
+        item: 记录字典
+        skip_keys: 跳过的键（图像等大型数据）
+    """
+    json_safe_item = {}
+    for key, value in item.items():
+        if key in skip_keys:
+            continue
+        if key == 'feature_vector':
+            json_safe_item[key] = _json_safe_vector(value)
+        elif isinstance(value, np.integer):
+            json_safe_item[key] = int(value)
+        elif isinstance(value, np.floating):
+            json_safe_item[key] = float(value)
+        elif isinstance(value, np.ndarray):
+            json_safe_item[key] = value.tolist()
+        else:
+            json_safe_item[key] = value
+    return json_safe_item
+
+
 @app.route('/feature_extraction', methods=['POST'])
 def feature_extraction():
     try:
@@ -618,12 +794,13 @@ def feature_extraction():
 
         records = data['records']
         algorithm = data.get('algorithm', 'mgn')
+        # 默认只返回会话ID和记录信息，include_features 为 True 时同时返回所有特征向量
+        include_features = bool(data.get('include_features', False))
 
         def progress_callback(stage, percentage):
             socketio.emit('reid_progress', {'stage': stage, 'percentage': percentage})
 
-        # 执行特征提取
-        reid_processor = ReIDProcessor()
+        # 执行特征提取（使用全局的 ReIDProcessor，模型只加载一次）
         result = reid_processor.extract_features(
             records,
             algorithm,
@@ -648,57 +825,33 @@ def feature_extraction():
                     query_feature = record['feature_vector']
                     break
 
-        # 处理记录，确保JSON安全
-        json_safe_records = []
-        for record in features_records:
-            json_safe_record = {}
-            for key, value in record.items():
-                # 跳过图像数据，这些不应该通过JSON返回
-                if key in ['image', 'processed_image', 'extracted_frames']:
-                    continue
-                # 确保feature_vector是列表而非NumPy数组
-                elif key == 'feature_vector' and isinstance(value, np.ndarray):
-                    json_safe_record[key] = value.tolist()
-                # 处理其他NumPy类型
-                elif isinstance(value, np.integer):
-                    json_safe_record[key] = int(value)
-                elif isinstance(value, np.floating):
-                    json_safe_record[key] = float(value)
-                elif isinstance(value, np.ndarray):
-                    json_safe_record[key] = value.tolist()
-                else:
-                    json_safe_record[key] = value
-            json_safe_records.append(json_safe_record)
-
-        # 处理帧特征，确保JSON安全
-        json_safe_frames = {}
-        for camera_id, frames in all_frames_features.items():
-            json_safe_frames[camera_id] = []
-            for frame in frames:
-                json_safe_frame = {}
-                for key, value in frame.items():
-                    if key == 'feature_vector' and isinstance(value, np.ndarray):
-                        json_safe_frame[key] = value.tolist()
-                    elif isinstance(value, np.integer):
-                        json_safe_frame[key] = int(value)
-                    elif isinstance(value, np.floating):
-                        json_safe_frame[key] = float(value)
-                    elif isinstance(value, np.ndarray):
-                        json_safe_frame[key] = value.tolist()
-                    else:
-                        json_safe_frame[key] = value
-                json_safe_frames[camera_id].append(json_safe_frame)
-
-        # 处理查询特征向量
-        json_safe_query = None
-        if query_feature is not None:
-            if isinstance(query_feature, np.ndarray):
-                json_safe_query = query_feature.tolist()
-            else:
-                json_safe_query = query_feature
+        # 特征保存在服务端会话中，匹配时只需提交会话ID
+        session_id = feature_sessions.create({
+            'records': features_records,
+            'all_frames_features': all_frames_features,
+            'query_feature': query_feature,
+        }, algorithm)
+
+        if not include_features:
+            return jsonify({
+                'status': 'success',
+                'session_id': session_id,
+                'features_records': [_json_safe(record, ('image', 'processed_image', 'extracted_frames',
+                                                         'feature_vector'))
+                                     for record in features_records],
+                'frame_counts': {camera_id: len(frames) for camera_id, frames in all_frames_features.items()}
+            })
+
+        # 处理记录和帧特征，确保JSON安全（特征向量编码为 float16 base64 字符串，不转换为列表）
+        json_safe_records = [_json_safe(record, ('image', 'processed_image', 'extracted_frames'))
+                             for record in features_records]
+        json_safe_frames = {camera_id: [_json_safe(frame) for frame in frames]
+                            for camera_id, frames in all_frames_features.items()}
+        json_safe_query = _json_safe_vector(query_feature)
 
         return jsonify({
             'status': 'success',
+            'session_id': session_id,
             'features_records': json_safe_records,
             'all_frames_features': json_safe_frames,
             'query_feature': json_safe_query
@@ -717,7 +870,13 @@ def feature_matching():
             return jsonify({'status': 'error', 'message': '缺少请求数据'})
 
         # 检查数据结构
-        if 'features_records' in data:
+        if data.get('session_id'):
+            # 特征提取结果保存在服务端会话中
+            session = feature_sessions.get(data['session_id'])
+            if session is None:
+                return jsonify({'status': 'error', 'message': '特征会话不存在或已过期，请重新提取特征'}), 404
+            features_data = session.to_features_data()
+        elif 'features_records' in data:
             # 旧的数据结构，只有记录列表
             features_data = {'records': data['features_records']}
         elif 'records' in data:
@@ -727,52 +886,27 @@ def feature_matching():
             return jsonify({'status': 'error', 'message': '缺少特征记录数据'})
 
         threshold = data.get('threshold', 0.75)
+        # 可选：只返回相似度最高的 top_k 条主记录
+        top_k = data.get('top_k')
 
         def progress_callback(stage, percentage):
             socketio.emit('reid_progress', {'stage': stage, 'percentage': percentage})
 
         # 执行特征匹配
-        reid_processor = ReIDProcessor()
         matched_records = reid_processor.match_features(
             features_data,
             threshold=threshold,
             callback=progress_callback,
-            save_dir=os.path.join("matching_results", datetime.now().strftime("%Y%m%d_%H%M%S"))
+            save_dir=os.path.join("matching_results", datetime.now().strftime("%Y%m%d_%H%M%S")),
+            top_k=int(top_k) if top_k is not None else None
         )
 
-        # 处理NumPy数组和其他不可JSON序列化的对象
+        # 处理NumPy数组和其他不可JSON序列化的对象，跳过不应该通过JSON返回的大型数据
         json_safe_matches = []
         for match in matched_records:
-            json_safe_match = {}
-            for key, value in match.items():
-                # 跳过不应该通过JSON返回的大型数据
-                if key in ['image', 'processed_image']:
-                    continue
-                # 处理嵌套的matched_frames列表
-                elif key == 'matched_frames' and isinstance(value, list):
-                    json_safe_frames = []
-                    for frame in value:
-                        json_safe_frame = {}
-                        for frame_key, frame_value in frame.items():
-                            if isinstance(frame_value, np.integer):
-                                json_safe_frame[frame_key] = int(frame_value)
-                            elif isinstance(frame_value, np.floating):
-                                json_safe_frame[frame_key] = float(frame_value)
-                            elif isinstance(frame_value, np.ndarray):
-                                json_safe_frame[frame_key] = frame_value.tolist()
-                            else:
-                                json_safe_frame[frame_key] = frame_value
-                        json_safe_frames.append(json_safe_frame)
-                    json_safe_match[key] = json_safe_frames
-                # 处理NumPy类型
-                elif isinstance(value, np.integer):
-                    json_safe_match[key] = int(value)
-                elif isinstance(value, np.floating):
-                    json_safe_match[key] = float(value)
-                elif isinstance(value, np.ndarray):
-                    json_safe_match[key] = value.tolist()
-                else:
-                    json_safe_match[key] = value
+            json_safe_match = _json_safe(match, ('image', 'processed_image'))
+            if isinstance(match.get('matched_frames'), list):
+                json_safe_match['matched_frames'] = [_json_safe(frame) for frame in match['matched_frames']]
             json_safe_matches.append(json_safe_match)
 
         return jsonify({
@@ -785,6 +919,92 @@ def feature_matching():
         return jsonify({'status': 'error', 'message': f'特征匹配错误: {str(e)}'})
 
 
+@app.route('/feature_sessions', methods=['GET'])
+def get_feature_sessions():
+    """获取特征会话存储的使用情况"""
+    return jsonify({'status': 'success', 'data': feature_sessions.stats()})
+
+
+@app.route('/feature_sessions/<session_id>', methods=['DELETE'])
+def delete_feature_session(session_id):
+    """删除特征会话，释放内存和溢出文件"""
+    if not feature_sessions.delete(session_id):
+        return jsonify({'status': 'error', 'message': '特征会话不存在或已过期'}), 404
+    return jsonify({'status': 'success'})
+
+
+@app.route('/reid/search', methods=['POST'])
+def reid_search():
+    """
+    在检索库中查找与查询图像（或特征向量）最相似的记录
+
+    请求参数: image_base64 或 feature_vector，algorithm（默认 mgn），top_k（默认 10），
+    start_time / end_time（可选，格式 %Y-%m-%d %H:%M:%S）
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'status': 'error', 'message': '缺少请求数据'}), 400
+        algorithm = data.get('algorithm', 'mgn')
+        if algorithm != gallery_index.algorithm:
+            return jsonify({'status': 'error', 'message': f'检索库只支持 {gallery_index.algorithm} 特征'}), 400
+        if not gallery_ready.is_set():
+            return jsonify({'status': 'error', 'message': '检索库正在加载，请稍后重试'}), 503
+
+        if data.get('feature_vector') is not None:
+            query_vector = decode_vector(data['feature_vector'])
+            if query_vector is None:
+                return jsonify({'status': 'error', 'message': '无法解析 feature_vector'}), 400
+        elif data.get('image_base64'):
+            image = reid_processor.decode_base64_image(data['image_base64'])
+            if image is None:
+                return jsonify({'status': 'error', 'message': '无法解码查询图像'}), 400
+            query_vector = reid_processor.extract_feature_batch([image], algorithm)[0]
+        else:
+            return jsonify({'status': 'error', 'message': '缺少 image_base64 或 feature_vector'}), 400
+
+        time_range = None
+        if data.get('start_time') or data.get('end_time'):
+            time_range = (data.get('start_time'), data.get('end_time'))
+        top_k = int(data.get('top_k', 10))
+        records = {}
+        for _ in range(2):
+            hits = gallery_index.search(query_vector, k=top_k, time_range=time_range)
+            if not hits:
+                return jsonify({'status': 'success', 'data': []})
+
+            ids = [record_id for record_id, _ in hits]
+            query = ("SELECT id, student_id, camera_id, timestamp, location_x, location_y, has_backpack, "
+                     "has_umbrella, clothing_color FROM student_records WHERE id IN ({})").format(
+                ', '.join(['%s'] * len(ids)))
+            if db_config['type'].lower() == 'sqlite':
+                query = query.replace("%s", "?")
+            records = {row['id']: row for row in db_interface.execute_query(query, tuple(ids))}
+            # 检索库中还有已被删除的记录（定期清理之前）：立即移除后重新检索一次，补足 top_k
+            missing = [record_id for record_id in ids if record_id not in records]
+            if not missing:
+                break
+            gallery_index.remove(missing)
+        camera_names = db_interface.camera_registry.names
+
+        results = []
+        for record_id, score in hits:
+            record = records.get(record_id)
+            if record is None:
+                continue
+            record = dict(record)
+            if isinstance(record['timestamp'], datetime):
+                record['timestamp'] = record['timestamp'].strftime("%Y-%m-%d %H:%M:%S")
+            record['camera_name'] = camera_names.get(record['camera_id'])
+            record['similarity'] = float(score)
+            results.append(record)
+        return jsonify({'status': 'success', 'data': results})
+
+    except Exception as e:
+        logger.error(f"特征检索错误: {str(e)}", exc_info=True)
+        return jsonify({'status': 'error', 'message': f'特征检索错误: {str(e)}'}), 500
+
+
 # 保存学生轨迹API
 @app.route('/trajectories', methods=['POST'])
 @token_required
@@ -915,11 +1135,11 @@ def add_camera():
         if db_config['type'].lower() == 'sqlite':
             insert_query = insert_query.replace("%s", "?")
 
-        db_interface.execute_query(insert_query, (
+        db_interface.execute_update(insert_query, (
             new_id, name, location_x, location_y,
             ip_address, port, protocol, username, password, rtsp_url
         ))
-        db_interface.conn.commit()
+        db_interface.camera_registry.invalidate()
 
         return jsonify({
             'status': 'success',
@@ -939,7 +1159,6 @@ def add_camera():
         })
     except Exception as e:
         logger.error(f"添加摄像头失败: {e}")
-        db_interface.conn.rollback()
         return jsonify({
             'status': 'error',
             'message': str(e)
@@ -992,13 +1211,13 @@ def update_camera(camera_id):
         if db_config['type'].lower() == 'sqlite':
             update_query = update_query.replace("%s", "?")
 
-        db_interface.execute_query(update_query, (
+        db_interface.execute_update(update_query, (
             name, location_x, location_y,
             ip_address, port, protocol,
             username, password, rtsp_url,
             camera_id
         ))
-        db_interface.conn.commit()
+        db_interface.camera_registry.invalidate()
 
         return jsonify({
             'status': 'success',
@@ -1018,7 +1237,6 @@ def update_camera(camera_id):
         })
     except Exception as e:
         logger.error(f"更新摄像头失败: {e}")
-        db_interface.conn.rollback()
         return jsonify({
             'status': 'error',
             'message': str(e)
@@ -1045,8 +1263,8 @@ def delete_camera(camera_id):
         if db_config['type'].lower() == 'sqlite':
             delete_query = delete_query.replace("%s", "?")
 
-        db_interface.execute_query(delete_query, (camera_id,))
-        db_interface.conn.commit()
+        db_interface.execute_update(delete_query, (camera_id,))
+        db_interface.camera_registry.invalidate()
 
         return jsonify({
             'status': 'success',
@@ -1054,7 +1272,6 @@ def delete_camera(camera_id):
         })
     except Exception as e:
         logger.error(f"删除摄像头失败: {e}")
-        db_interface.conn.rollback()
         return jsonify({
             'status': 'error',
             'message': str(e)
@@ -1151,8 +1368,9 @@ def add_video():
         if db_config['type'].lower() == 'sqlite':
             insert_query = insert_query.replace("%s", "?")
 
-        db_interface.execute_query(insert_query, (camera_id, date, start_time, end_time, video_path))
-        db_interface.conn.commit()
+        db_interface.execute_update(insert_query, (camera_id, date, start_time, end_time, video_path))
+        # 新录像的 id 大于索引水位线，立即增量同步
+        db_interface.video_index.refresh(force=True)
 
         return jsonify({
             'status': 'success',
@@ -1160,7 +1378,6 @@ def add_video():
         })
     except Exception as e:
         logger.error(f"添加视频记录失败: {e}")
-        db_interface.conn.rollback()
         return jsonify({
             'status': 'error',
             'message': str(e)
@@ -1193,8 +1410,9 @@ def delete_video(video_id):
         if db_config['type'].lower() == 'sqlite':
             delete_query = delete_query.replace("%s", "?")
 
-        db_interface.execute_query(delete_query, (video_id,))
-        db_interface.conn.commit()
+        db_interface.execute_update(delete_query, (video_id,))
+        db_interface.video_index.remove(video_id)
+        db_interface.video_catalog.invalidate(video_path)
 
         return jsonify({
             'status': 'success',
@@ -1202,7 +1420,6 @@ def delete_video(video_id):
         })
     except Exception as e:
         logger.error(f"删除视频记录失败: {e}")
-        db_interface.conn.rollback()
         return jsonify({
             'status': 'error',
             'message': str(e)
@@ -1235,12 +1452,12 @@ def get_students():
         offset = (page - 1) * page_size
 
         # 获取总数
-        with db_interface.conn.cursor() as cursor:
+        with db_interface.connection() as conn, conn.cursor() as cursor:
             cursor.execute("SELECT COUNT(*) FROM students")
             total = cursor.fetchone()[0]
 
         # 分页查询
-        with db_interface.conn.cursor() as cursor:
+        with db_interface.connection() as conn, conn.cursor() as cursor:
             cursor.execute(
                 "SELECT * FROM students LIMIT %s OFFSET %s",
                 (page_size, offset)
@@ -1276,7 +1493,7 @@ def search_students():
         search_term = f"%{keyword}%"
 
         # 获取符合条件的总数
-        with db_interface.conn.cursor() as cursor:
+        with db_interface.connection() as conn, conn.cursor() as cursor:
             cursor.execute(
                 """SELECT COUNT(*) FROM students 
                 WHERE student_id LIKE %s 
@@ -1288,7 +1505,7 @@ def search_students():
             total = cursor.fetchone()[0]
 
         # 分页查询
-        with db_interface.conn.cursor() as cursor:
+        with db_interface.connection() as conn, conn.cursor() as cursor:
             cursor.execute(
                 """SELECT * FROM students 
                 WHERE student_id LIKE %s 
@@ -1327,7 +1544,7 @@ def add_student():
                 return jsonify({'error': f'Missing required field: {field}'}), 400
 
         # 检查学号是否已存在
-        with db_interface.conn.cursor() as cursor:
+        with db_interface.connection() as conn, conn.cursor() as cursor:
             cursor.execute("SELECT COUNT(*) FROM students WHERE student_id = %s", (data['student_id'],))
             if cursor.fetchone()[0] > 0:
                 return jsonify({'error': 'Student ID already exists'}), 409
@@ -1336,10 +1553,10 @@ def add_student():
         fields = ', '.join(data.keys())
         placeholders = ', '.join(['%s'] * len(data))
 
-        with db_interface.conn.cursor() as cursor:
+        with db_interface.connection() as conn, conn.cursor() as cursor:
             sql = f"INSERT INTO students ({fields}) VALUES ({placeholders})"
             cursor.execute(sql, list(data.values()))
-            db_interface.conn.commit()
+            conn.commit()
 
         return jsonify({'message': 'Student added successfully', 'student_id': data['student_id']}), 201
     except Exception as e:
@@ -1354,7 +1571,7 @@ def update_student(student_id):
         data = request.json
 
         # 检查学生是否存在
-        with db_interface.conn.cursor() as cursor:
+        with db_interface.connection() as conn, conn.cursor() as cursor:
             cursor.execute("SELECT COUNT(*) FROM students WHERE student_id = %s", (student_id,))
             if cursor.fetchone()[0] == 0:
                 return jsonify({'error': 'Student not found'}), 404
@@ -1373,10 +1590,10 @@ def update_student(student_id):
 
         values.append(student_id)  # WHERE条件的参数
 
-        with db_interface.conn.cursor() as cursor:
+        with db_interface.connection() as conn, conn.cursor() as cursor:
             sql = f"UPDATE students SET {', '.join(update_fields)} WHERE student_id = %s"
             cursor.execute(sql, values)
-            db_interface.conn.commit()
+            conn.commit()
 
         return jsonify({'message': 'Student updated successfully'}), 200
     except Exception as e:
@@ -1389,15 +1606,15 @@ def delete_student(student_id):
     """删除单个学生"""
     try:
         # 检查学生是否存在
-        with db_interface.conn.cursor() as cursor:
+        with db_interface.connection() as conn, conn.cursor() as cursor:
             cursor.execute("SELECT COUNT(*) FROM students WHERE student_id = %s", (student_id,))
             if cursor.fetchone()[0] == 0:
                 return jsonify({'error': 'Student not found'}), 404
 
         # 删除学生
-        with db_interface.conn.cursor() as cursor:
+        with db_interface.connection() as conn, conn.cursor() as cursor:
             cursor.execute("DELETE FROM students WHERE student_id = %s", (student_id,))
-            db_interface.conn.commit()
+            conn.commit()
 
         return jsonify({'message': 'Student deleted successfully'}), 200
     except Exception as e:
@@ -1418,10 +1635,10 @@ def batch_delete_students():
         # 构建SQL删除语句
         placeholders = ', '.join(['%s'] * len(student_ids))
 
-        with db_interface.conn.cursor() as cursor:
+        with db_interface.connection() as conn, conn.cursor() as cursor:
             sql = f"DELETE FROM students WHERE student_id IN ({placeholders})"
             cursor.execute(sql, student_ids)
-            db_interface.conn.commit()
+            conn.commit()
             deleted_count = cursor.rowcount
 
         return jsonify({
@@ -1460,12 +1677,12 @@ def import_students():
                     continue
 
                 # 检查学生是否已存在，存在则更新，不存在则插入
-                with db_interface.conn.cursor() as cursor:
+                with db_interface.connection() as conn, conn.cursor() as cursor:
                     cursor.execute("SELECT COUNT(*) FROM students WHERE student_id = %s",
                                    (student['student_id'],))
                     exists = cursor.fetchone()[0] > 0
 
-                with db_interface.conn.cursor() as cursor:
+                with db_interface.connection() as conn, conn.cursor() as cursor:
                     if exists:
                         # 构建更新语句
                         update_fields = []
@@ -1488,8 +1705,8 @@ def import_students():
                         placeholders = ', '.join(['%s'] * len(filtered_student))
                         sql = f"INSERT INTO students ({fields}) VALUES ({placeholders})"
                         cursor.execute(sql, list(filtered_student.values()))
+                    conn.commit()
 
-                db_interface.conn.commit()
                 success_count += 1
             except Exception as e:
                 error_count += 1
@@ -1514,7 +1731,7 @@ def get_student_trajectories(student_id):
     """获取指定学生的轨迹信息"""
     try:
         # 查询该学生的所有轨迹记录
-        with db_interface.conn.cursor() as cursor:
+        with db_interface.connection() as conn, conn.cursor() as cursor:
             query = """
                 SELECT id, tracking_session_id, start_time, end_time, 
                        camera_sequence, total_distance, average_speed, created_at
@@ -1573,36 +1790,28 @@ def register():
         if not username or not password:
             return jsonify({'message': '用户名和密码不能为空', 'success': False}), 400
 
-        # 确保数据库连接有效
-        if db_interface.conn.open is False:
-            db_interface.reconnect()
-
-        cursor = db_interface.conn.cursor()
-
-        # 检查用户名是否已存在
-        cursor.execute("SELECT username FROM users WHERE username = %s", (username,))
-        if cursor.fetchone():
-            return jsonify({'message': '用户名已存在', 'success': False}), 400
-
-        # 加密密码
+        # 加密密码（在借出连接之前完成，避免占用连接）
         hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
-        # 插入新用户 - 注意字段名为 password_hash
-        cursor.execute(
-            "INSERT INTO users (username, password_hash, real_name, email, phone, role) VALUES (%s, %s, %s, %s, %s, %s)",
-            (username, hashed_password, real_name, email, phone, 'user')
-        )
-        db_interface.conn.commit()
+        with db_interface.connection() as conn, conn.cursor() as cursor:
+            # 检查用户名是否已存在
+            cursor.execute("SELECT username FROM users WHERE username = %s", (username,))
+            if cursor.fetchone():
+                return jsonify({'message': '用户名已存在', 'success': False}), 400
 
-        return jsonify({'message': '注册成功', 'success': True}), 201
+            # 插入新用户 - 注意字段名为 password_hash
+            cursor.execute(
+                "INSERT INTO users (username, password_hash, real_name, email, phone, role) VALUES (%s, %s, %s, %s, %s, %s)",
+                (username, hashed_password, real_name, email, phone, 'user')
+            )
+            conn.commit()
+
+            return jsonify({'message': '注册成功', 'success': True}), 201
 
     except Exception as e:
         logger.error(f"注册出错: {str(e)}")
         logger.error(traceback.format_exc())
         return jsonify({'message': f'注册错误: {str(e)}', 'success': False}), 500
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
 
 
 # 用户登录
@@ -1616,17 +1825,12 @@ def login():
         if not username or not password:
             return jsonify({'message': '用户名和密码不能为空', 'success': False}), 400
 
-        # 确保数据库连接有效
-        if db_interface.conn.open is False:
-            db_interface.reconnect()  # 确保有重连方法
-
-        cursor = db_interface.conn.cursor()
+        with db_interface.connection() as conn, conn.cursor() as cursor:
+            # 修改SQL查询以匹配你的表结构
+            cursor.execute("SELECT * FROM users WHERE username = %s", (username,))
 
-        # 修改SQL查询以匹配你的表结构
-        cursor.execute("SELECT * FROM users WHERE username = %s", (username,))
-
-        columns = [desc[0] for desc in cursor.description]
-        user_data = cursor.fetchone()
+            columns = [desc[0] for desc in cursor.description]
+            user_data = cursor.fetchone()
 
         if not user_data:
             return jsonify({'message': '用户不存在', 'success': False}), 401
@@ -1659,9 +1863,6 @@ def login():
         logger.error(f"登录出错: {str(e)}")
         logger.error(traceback.format_exc())
         return jsonify({'message': f'登录错误: {str(e)}', 'success': False}), 500
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
 
 
 # 获取当前用户信息
@@ -1685,13 +1886,12 @@ def get_profile(current_user):
     try:
         username = current_user.get('username')
 
-        cursor = db_interface.conn.cursor()
-        cursor.execute(
-            "SELECT username, real_name, email, phone FROM users WHERE username = %s",
-            (username,)
-        )
-        user_data = cursor.fetchone()
-        cursor.close()
+        with db_interface.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT username, real_name, email, phone FROM users WHERE username = %s",
+                (username,)
+            )
+            user_data = cursor.fetchone()
 
         if not user_data:
             return jsonify({
@@ -1730,18 +1930,17 @@ def update_profile(current_user):
         email = data.get('email', '')
         phone = data.get('phone', '')
 
-        cursor = db_interface.conn.cursor()
-        cursor.execute(
-            "UPDATE users SET real_name = %s, email = %s, phone = %s WHERE username = %s",
-            (real_name, email, phone, username)
-        )
-        db_interface.conn.commit()
-        cursor.close()
+        with db_interface.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                "UPDATE users SET real_name = %s, email = %s, phone = %s WHERE username = %s",
+                (real_name, email, phone, username)
+            )
+            conn.commit()
 
-        return jsonify({
-            'success': True,
-            'message': '个人信息更新成功'
-        })
+            return jsonify({
+                'success': True,
+                'message': '个人信息更新成功'
+            })
     except Exception as e:
         logger.error(f"更新个人信息失败: {str(e)}")
         return jsonify({
@@ -1762,40 +1961,39 @@ def change_password(current_user):
         new_password = data.get('newPassword', '')
 
         # 验证当前密码是否正确
-        cursor = db_interface.conn.cursor()
-        cursor.execute("SELECT password_hash FROM users WHERE username = %s", (username,))
-        result = cursor.fetchone()
+        with db_interface.connection() as conn, conn.cursor() as cursor:
+            cursor.execute("SELECT password_hash FROM users WHERE username = %s", (username,))
+            result = cursor.fetchone()
 
-        if not result:
-            return jsonify({
-                'success': False,
-                'message': '用户不存在'
-            }), 404
+            if not result:
+                return jsonify({
+                    'success': False,
+                    'message': '用户不存在'
+                }), 404
 
-        stored_password = result[0]
+            stored_password = result[0]
 
-        # 验证原密码
-        if not bcrypt.checkpw(old_password.encode('utf-8'), stored_password.encode('utf-8')):
-            return jsonify({
-                'success': False,
-                'message': '原密码不正确'
-            }), 400
+            # 验证原密码
+            if not bcrypt.checkpw(old_password.encode('utf-8'), stored_password.encode('utf-8')):
+                return jsonify({
+                    'success': False,
+                    'message': '原密码不正确'
+                }), 400
 
-        # 生成新密码的哈希值
-        hashed_password = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+            # 生成新密码的哈希值
+            hashed_password = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
-        # 更新密码
-        cursor.execute(
-            "UPDATE users SET password_hash = %s WHERE username = %s",
-            (hashed_password, username)
-        )
-        db_interface.conn.commit()
-        cursor.close()
+            # 更新密码
+            cursor.execute(
+                "UPDATE users SET password_hash = %s WHERE username = %s",
+                (hashed_password, username)
+            )
+            conn.commit()
 
-        return jsonify({
-            'success': True,
-            'message': '密码更新成功'
-        })
+            return jsonify({
+                'success': True,
+                'message': '密码更新成功'
+            })
     except Exception as e:
         logger.error(f"修改密码失败: {str(e)}")
         return jsonify({
@@ -1830,13 +2028,13 @@ def get_users(current_user):
             params = [search_term, search_term, search_term]
 
         # 获取总数
-        with db_interface.conn.cursor() as cursor:
+        with db_interface.connection() as conn, conn.cursor() as cursor:
             count_sql = f"SELECT COUNT(*) FROM users {search_condition}"
             cursor.execute(count_sql, params if params else None)
             total = cursor.fetchone()[0]
 
         # 分页查询用户列表，排除密码字段
-        with db_interface.conn.cursor() as cursor:
+        with db_interface.connection() as conn, conn.cursor() as cursor:
             query_sql = f"""
                 SELECT user_id, username, role, real_name, email, phone, created_at, updated_at 
                 FROM users {search_condition}
@@ -1895,43 +2093,35 @@ def add_user(current_user):
         if role not in ['admin', 'user']:
             return jsonify({'message': '无效的角色类型', 'success': False}), 400
 
-        # 确保数据库连接有效
-        if db_interface.conn.open is False:
-            db_interface.reconnect()
-
-        cursor = db_interface.conn.cursor()
-
-        # 检查用户名是否已存在
-        cursor.execute("SELECT username FROM users WHERE username = %s", (username,))
-        if cursor.fetchone():
-            return jsonify({'message': '用户名已存在', 'success': False}), 400
-
-        # 加密密码
+        # 加密密码（在借出连接之前完成，避免占用连接）
         hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
-        # 插入新用户
-        cursor.execute(
-            "INSERT INTO users (username, password_hash, role, real_name, email, phone) VALUES (%s, %s, %s, %s, %s, %s)",
-            (username, hashed_password, role, real_name, email, phone)
-        )
-        db_interface.conn.commit()
+        with db_interface.connection() as conn, conn.cursor() as cursor:
+            # 检查用户名是否已存在
+            cursor.execute("SELECT username FROM users WHERE username = %s", (username,))
+            if cursor.fetchone():
+                return jsonify({'message': '用户名已存在', 'success': False}), 400
 
-        # 获取新创建的用户ID
-        user_id = cursor.lastrowid
+            # 插入新用户
+            cursor.execute(
+                "INSERT INTO users (username, password_hash, role, real_name, email, phone) VALUES (%s, %s, %s, %s, %s, %s)",
+                (username, hashed_password, role, real_name, email, phone)
+            )
+            conn.commit()
 
-        return jsonify({
-            'message': '用户创建成功',
-            'success': True,
-            'userId': user_id
-        }), 201
+            # 获取新创建的用户ID
+            user_id = cursor.lastrowid
+
+            return jsonify({
+                'message': '用户创建成功',
+                'success': True,
+                'userId': user_id
+            }), 201
 
     except Exception as e:
         logger.error(f"添加用户出错: {str(e)}")
         logger.error(traceback.format_exc())
         return jsonify({'message': f'添加用户出错: {str(e)}', 'success': False}), 500
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
 
 
 # 更新用户信息（仅管理员可用）
@@ -1955,72 +2145,64 @@ def update_user(current_user, user_id):
         if not any([username, role, real_name, email, phone, password]):
             return jsonify({'message': '没有提供要更新的字段', 'success': False}), 400
 
-        # 确保数据库连接有效
-        if db_interface.conn.open is False:
-            db_interface.reconnect()
-
-        cursor = db_interface.conn.cursor()
-
-        # 检查用户是否存在
-        cursor.execute("SELECT user_id FROM users WHERE user_id = %s", (user_id,))
-        if not cursor.fetchone():
-            return jsonify({'message': '用户不存在', 'success': False}), 404
-
-        # 如果要更新用户名，检查是否与其他用户冲突
-        if username:
-            cursor.execute("SELECT user_id FROM users WHERE username = %s AND user_id != %s", (username, user_id))
-            if cursor.fetchone():
-                return jsonify({'message': '用户名已被使用', 'success': False}), 400
-
-        # 构建更新语句
-        update_fields = []
-        params = []
+        with db_interface.connection() as conn, conn.cursor() as cursor:
+            # 检查用户是否存在
+            cursor.execute("SELECT user_id FROM users WHERE user_id = %s", (user_id,))
+            if not cursor.fetchone():
+                return jsonify({'message': '用户不存在', 'success': False}), 404
+
+            # 如果要更新用户名，检查是否与其他用户冲突
+            if username:
+                cursor.execute("SELECT user_id FROM users WHERE username = %s AND user_id != %s", (username, user_id))
+                if cursor.fetchone():
+                    return jsonify({'message': '用户名已被使用', 'success': False}), 400
+
+            # 构建更新语句
+            update_fields = []
+            params = []
+
+            if username:
+                update_fields.append("username = %s")
+                params.append(username)
+
+            if role:
+                if role not in ['admin', 'user']:
+                    return jsonify({'message': '无效的角色类型', 'success': False}), 400
+                update_fields.append("role = %s")
+                params.append(role)
+
+            if real_name:
+                update_fields.append("real_name = %s")
+                params.append(real_name)
+
+            if email:
+                update_fields.append("email = %s")
+                params.append(email)
+
+            if phone:
+                update_fields.append("phone = %s")
+                params.append(phone)
+
+            if password:
+                hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+                update_fields.append("password_hash = %s")
+                params.append(hashed_password)
+
+            if update_fields:
+                params.append(user_id)  # WHERE条件参数
+                update_sql = f"UPDATE users SET {', '.join(update_fields)} WHERE user_id = %s"
+                cursor.execute(update_sql, params)
+                conn.commit()
 
-        if username:
-            update_fields.append("username = %s")
-            params.append(username)
-
-        if role:
-            if role not in ['admin', 'user']:
-                return jsonify({'message': '无效的角色类型', 'success': False}), 400
-            update_fields.append("role = %s")
-            params.append(role)
-
-        if real_name:
-            update_fields.append("real_name = %s")
-            params.append(real_name)
-
-        if email:
-            update_fields.append("email = %s")
-            params.append(email)
-
-        if phone:
-            update_fields.append("phone = %s")
-            params.append(phone)
-
-        if password:
-            hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-            update_fields.append("password_hash = %s")
-            params.append(hashed_password)
-
-        if update_fields:
-            params.append(user_id)  # WHERE条件参数
-            update_sql = f"UPDATE users SET {', '.join(update_fields)} WHERE user_id = %s"
-            cursor.execute(update_sql, params)
-            db_interface.conn.commit()
-
-        return jsonify({
-            'message': '用户信息更新成功',
-            'success': True
-        })
+            return jsonify({
+                'message': '用户信息更新成功',
+                'success': True
+            })
 
     except Exception as e:
         logger.error(f"更新用户信息出错: {str(e)}")
         logger.error(traceback.format_exc())
         return jsonify({'message': f'更新用户信息出错: {str(e)}', 'success': False}), 500
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
 
 
 # 删除用户（仅管理员可用）
@@ -2032,37 +2214,29 @@ def delete_user(current_user, user_id):
         if current_user.get('role') != 'admin':
             return jsonify({'message': '权限不足，只有管理员可以删除用户', 'success': False}), 403
 
-        # 确保数据库连接有效
-        if db_interface.conn.open is False:
-            db_interface.reconnect()
-
-        cursor = db_interface.conn.cursor()
+        with db_interface.connection() as conn, conn.cursor() as cursor:
+            # 检查用户是否存在
+            cursor.execute("SELECT user_id FROM users WHERE user_id = %s", (user_id,))
+            if not cursor.fetchone():
+                return jsonify({'message': '用户不存在', 'success': False}), 404
 
-        # 检查用户是否存在
-        cursor.execute("SELECT user_id FROM users WHERE user_id = %s", (user_id,))
-        if not cursor.fetchone():
-            return jsonify({'message': '用户不存在', 'success': False}), 404
+            # 防止管理员删除自己
+            if int(current_user.get('user_id')) == user_id:
+                return jsonify({'message': '不能删除自己的账户', 'success': False}), 400
 
-        # 防止管理员删除自己
-        if int(current_user.get('user_id')) == user_id:
-            return jsonify({'message': '不能删除自己的账户', 'success': False}), 400
+            # 删除用户
+            cursor.execute("DELETE FROM users WHERE user_id = %s", (user_id,))
+            conn.commit()
 
-        # 删除用户
-        cursor.execute("DELETE FROM users WHERE user_id = %s", (user_id,))
-        db_interface.conn.commit()
-
-        return jsonify({
-            'message': '用户删除成功',
-            'success': True
-        })
+            return jsonify({
+                'message': '用户删除成功',
+                'success': True
+            })
 
     except Exception as e:
         logger.error(f"删除用户出错: {str(e)}")
         logger.error(traceback.format_exc())
         return jsonify({'message': f'删除用户出错: {str(e)}', 'success': False}), 500
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
 
 
 # 批量删除用户（仅管理员可用）
@@ -2080,45 +2254,37 @@ def batch_delete_users(current_user):
         if not user_ids:
             return jsonify({'message': '未提供要删除的用户ID', 'success': False}), 400
 
-        # 确保数据库连接有效
-        if db_interface.conn.open is False:
-            db_interface.reconnect()
+        with db_interface.connection() as conn, conn.cursor() as cursor:
+            # 防止管理员删除自己
+            current_user_id = int(current_user.get('user_id'))
+            if current_user_id in user_ids:
+                return jsonify({'message': '不能删除自己的账户', 'success': False}), 400
 
-        cursor = db_interface.conn.cursor()
+            # 构建SQL删除语句
+            placeholders = ', '.join(['%s'] * len(user_ids))
+            delete_sql = f"DELETE FROM users WHERE user_id IN ({placeholders})"
 
-        # 防止管理员删除自己
-        current_user_id = int(current_user.get('user_id'))
-        if current_user_id in user_ids:
-            return jsonify({'message': '不能删除自己的账户', 'success': False}), 400
-
-        # 构建SQL删除语句
-        placeholders = ', '.join(['%s'] * len(user_ids))
-        delete_sql = f"DELETE FROM users WHERE user_id IN ({placeholders})"
-
-        cursor.execute(delete_sql, user_ids)
-        db_interface.conn.commit()
-        deleted_count = cursor.rowcount
+            cursor.execute(delete_sql, user_ids)
+            conn.commit()
+            deleted_count = cursor.rowcount
 
-        return jsonify({
-            'message': f'成功删除 {deleted_count} 个用户',
-            'success': True,
-            'count': deleted_count
-        })
+            return jsonify({
+                'message': f'成功删除 {deleted_count} 个用户',
+                'success': True,
+                'count': deleted_count
+            })
 
     except Exception as e:
         logger.error(f"批量删除用户出错: {str(e)}")
         logger.error(traceback.format_exc())
         return jsonify({'message': f'批量删除用户出错: {str(e)}', 'success': False}), 500
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
 
 
 @app.route('/cameras/<int:camera_id>/stream', methods=['GET'])
 def stream_camera(camera_id):
     try:
         # 查询摄像头信息
-        with db_interface.conn.cursor() as cursor:
+        with db_interface.connection() as conn, conn.cursor() as cursor:
             cursor.execute(
                 "SELECT camera_id, name, ip_address, port, protocol, username, password, rtsp_url FROM cameras WHERE camera_id = %s",
                 (camera_id,))
@@ -0,0 +1,155 @@
+"""
+对 filter_process 的典型查询做 EXPLAIN 和计时，比较建立索引前后的执行计划与耗时
+
+用法:
+    python -m backend.dbInterface.benchmark_queries --days 7 --repeat 5 --compare
+"""
+import argparse
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from backend.dbInterface.db_interface import DatabaseInterface
+from backend.dbInterface.schema_migrations import drop_indexes, ensure_indexes
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 与 app.py 中 /filter 使用的列一致
+FILTER_COLUMNS = ['id', 'student_id', 'camera_id', 'timestamp', 'has_backpack', 'has_umbrella', 'clothing_color']
+
+
+def build_scenarios(db_interface: DatabaseInterface, end: datetime, days: int) -> List[Dict[str, Any]]:
+    """构造有代表性的 filter_process 查询"""
+    time_range = (end - timedelta(days=days), end)
+    rows = db_interface.execute_query(
+        "SELECT student_id, camera_id FROM student_records WHERE student_id IS NOT NULL LIMIT 1")
+    sample = rows[0] if rows else {'student_id': '', 'camera_id': 1}
+
+    return [
+        {'name': f'/filter {days}天时间范围', 'time_range': time_range},
+        {'name': '/filter 时间范围 + 属性', 'time_range': time_range,
+         'features': {'has_backpack': True, 'has_umbrella': False}, 'clothing_color': 'red'},
+        {'name': '学号 + 时间范围', 'time_range': time_range, 'student_id': sample['student_id']},
+        {'name': '摄像头 + 时间范围', 'time_range': time_range, 'camera_ids': [sample['camera_id']]},
+    ]
+
+
+def explain(db_interface: DatabaseInterface, query: str, params: List[Any]) -> List[str]:
+    """返回查询计划的文本行"""
+    prefix = "EXPLAIN QUERY PLAN " if db_interface.db_config['type'].lower() == 'sqlite' else "EXPLAIN "
+    plan = db_interface.execute_query(prefix + query, params)
+    return [", ".join(f"{k}={v}" for k, v in row.items() if v is not None) for row in plan]
+
+
+def time_query(db_interface: DatabaseInterface, query: str, params: List[Any], repeat: int) -> Dict[str, float]:
+    """执行查询并取回全部结果，返回耗时统计（毫秒）"""
+    timings = []
+    rows = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with db_interface.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            rows = len(cursor.fetchall())
+            cursor.close()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {'rows': rows, 'min_ms': timings[0], 'median_ms': timings[len(timings) // 2]}
+
+
+def run_benchmark(db_interface: DatabaseInterface,
+                  end: Optional[datetime] = None,
+                  days: int = 7,
+                  repeat: int = 5) -> List[Dict[str, Any]]:
+    """
+    对每个查询场景输出执行计划和耗时
+
+    Args:
+        db_interface: 数据库接口实例
+        end: 时间范围的结束时间，默认为表中最新的记录时间
+        days: 时间范围天数
+        repeat: 每个查询的执行次数
+
+    Returns:
+        每个场景的结果列表
+    """
+    if end is None:
+        rows = db_interface.execute_query("SELECT MAX(timestamp) AS last_ts FROM student_records")
+        end = rows[0]['last_ts'] if rows and rows[0]['last_ts'] else datetime.now()
+        if isinstance(end, str):
+            end = datetime.fromisoformat(end)
+
+    results = []
+    for scenario in build_scenarios(db_interface, end, days):
+        query, params, _ = db_interface._build_record_query(
+            columns=FILTER_COLUMNS,
+            student_id=scenario.get('student_id'),
+            features=scenario.get('features'),
+            time_range=scenario.get('time_range'),
+            camera_ids=scenario.get('camera_ids'),
+            clothing_color=scenario.get('clothing_color'),
+            order_by_time=True)
+        if db_interface.db_config['type'].lower() == 'sqlite':
+            # SQLite 中时间以文本存储，按相同格式比较
+            params = [p.strftime('%Y-%m-%d %H:%M:%S') if isinstance(p, datetime) else p for p in params]
+
+        result = {'name': scenario['name'], 'plan': explain(db_interface, query, params)}
+        result.update(time_query(db_interface, query, params, repeat))
+        results.append(result)
+
+        print(f"\n== {result['name']} ==")
+        for line in result['plan']:
+            print(f"  {line}")
+        print(f"  rows={result['rows']}  min={result['min_ms']:.1f}ms  median={result['median_ms']:.1f}ms")
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='student_records 查询计划与耗时基准测试')
+    parser.add_argument('--type', default='mysql', choices=['mysql', 'sqlite'])
+    parser.add_argument('--sqlite-path', default='')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=3306)
+    parser.add_argument('--user', default='root')
+    parser.add_argument('--password', default='123456')
+    parser.add_argument('--database', default='trajectory')
+    parser.add_argument('--days', type=int, default=7, help='查询的时间范围天数')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--compare', action='store_true',
+                        help='先删除索引测一遍，再建立索引测一遍（会修改数据库结构）')
+    args = parser.parse_args()
+
+    db_interface = DatabaseInterface({
+        'type': args.type,
+        'sqlite_path': args.sqlite_path,
+        'host': args.host,
+        'port': args.port,
+        'user': args.user,
+        'password': args.password,
+        'database': args.database,
+    })
+    try:
+        if args.compare:
+            print("######## 无复合索引 ########")
+            drop_indexes(db_interface)
+            before = run_benchmark(db_interface, days=args.days, repeat=args.repeat)
+
+            print("\n######## 建立复合索引后 ########")
+            ensure_indexes(db_interface)
+            after = run_benchmark(db_interface, days=args.days, repeat=args.repeat)
+
+            print("\n######## 对比（中位数） ########")
+            for b, a in zip(before, after):
+                speedup = b['median_ms'] / a['median_ms'] if a['median_ms'] > 0 else float('inf')
+                print(f"  {b['name']}: {b['median_ms']:.1f}ms -> {a['median_ms']:.1f}ms ({speedup:.1f}x)")
+        else:
+            run_benchmark(db_interface, days=args.days, repeat=args.repeat)
+    finally:
+        db_interface.disconnect()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class CameraSnapshot:
+    """某一时刻 cameras 表的只读快照，ids 按升序排列"""
+
+    __slots__ = ('ids', 'lon', 'lat', 'names', 'loaded_at')
+
+    def __init__(self, rows: Iterable[Tuple]):
+        rows = sorted((int(r[0]), r[1], r[2], r[3]) for r in rows)
+        self.ids = np.array([r[0] for r in rows], dtype=np.int64)
+        self.lon = np.array([np.nan if r[1] is None else float(r[1]) for r in rows], dtype=np.float64)
+        self.lat = np.array([np.nan if r[2] is None else float(r[2]) for r in rows], dtype=np.float64)
+        self.names: Dict[int, str] = {r[0]: r[3] for r in rows}
+        self.loaded_at = time.monotonic()
+
+    def positions(self, camera_ids) -> Tuple[np.ndarray, np.ndarray]:
+        """返回各摄像头在数组中的位置以及是否存在"""
+        camera_ids = np.asarray(camera_ids, dtype=np.int64)
+        pos = np.searchsorted(self.ids, camera_ids)
+        pos = np.minimum(pos, max(len(self.ids) - 1, 0))
+        found = (self.ids[pos] == camera_ids) if len(self.ids) else np.zeros(camera_ids.shape, dtype=bool)
+        return pos, found
+
+
+class CameraRegistry:
+    """摄像头信息的读穿缓存
+
+    cameras 表很小且很少修改，但几乎每个请求都需要摄像头的位置和名称。
+    缓存以 NumPy 数组保存 id/经度/纬度，另以字典保存名称；摄像头增删改后调用 invalidate()，
+    其他进程的修改依靠 TTL 过期后重新加载。
+    """
+
+    def __init__(self, fetch_func: Callable[[], Iterable[Tuple]], ttl: float = 300.0):
+        """
+        初始化摄像头缓存
+
+        Args:
+            fetch_func: 返回 (camera_id, location_x, location_y, name) 行的函数
+            ttl: 缓存有效期（秒）
+        """
+        self._fetch = fetch_func
+        self.ttl = ttl
+        self._snapshot: Optional[CameraSnapshot] = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """使缓存失效，下次访问时重新加载"""
+        self._snapshot = None
+        logger.info("摄像头缓存已失效")
+
+    def snapshot(self) -> CameraSnapshot:
+        """获取当前有效的快照，过期或失效时重新加载"""
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - snapshot.loaded_at < self.ttl:
+            return snapshot
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or time.monotonic() - snapshot.loaded_at >= self.ttl:
+                snapshot = CameraSnapshot(self._fetch())
+                self._snapshot = snapshot
+                logger.info(f"摄像头缓存已加载: {len(snapshot.ids)} 个摄像头")
+        return snapshot
+
+    def get(self, camera_id: int) -> Optional[Tuple[float, float, str]]:
+        """
+        获取单个摄像头的信息
+
+        Returns:
+            (location_x, location_y, name)，坐标为空时对应项为 None，摄像头不存在时返回 None
+        """
+        snapshot = self.snapshot()
+        pos, found = snapshot.positions([camera_id])
+        if not found[0]:
+            return None
+        i = pos[0]
+        lon, lat = snapshot.lon[i], snapshot.lat[i]
+        return (None if np.isnan(lon) else float(lon),
+                None if np.isnan(lat) else float(lat),
+                snapshot.names.get(int(camera_id)))
+
+    def locations(self, camera_ids: Sequence[int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        批量获取摄像头坐标
+
+        Args:
+            camera_ids: 摄像头ID序列
+
+        Returns:
+            (location_x, location_y, found)，不存在的摄像头坐标为 NaN
+        """
+        snapshot = self.snapshot()
+        pos, found = snapshot.positions(camera_ids)
+        lon = np.where(found, snapshot.lon[pos] if len(snapshot.ids) else np.nan, np.nan)
+        lat = np.where(found, snapshot.lat[pos] if len(snapshot.ids) else np.nan, np.nan)
+        return lon, lat, found
+
+    def name(self, camera_id: int, default: Optional[str] = None) -> Optional[str]:
+        """获取摄像头名称"""
+        return self.snapshot().names.get(int(camera_id), default)
+
+    @property
+    def names(self) -> Dict[int, str]:
+        """摄像头ID到名称的映射（只读，请勿修改）"""
+        return self.snapshot().names
+
+    def to_frame(self) -> pd.DataFrame:
+        """以 get_camera_locations 的格式返回摄像头信息"""
+        snapshot = self.snapshot()
+        return pd.DataFrame({
+            'camera_id': snapshot.ids,
+            'location_x': snapshot.lon,
+            'location_y': snapshot.lat,
+            'name': [snapshot.names[i] for i in snapshot.ids.tolist()],
+        })
@@ -0,0 +1,185 @@
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Optional
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(Exception):
+    """在超时时间内无法从连接池借出连接"""
+
+
+class ConnectionPool:
+    """线程安全的数据库连接池
+
+    每个线程通过 connection() 借出独占连接，使用完毕后自动归还，
+    因此并发请求可以真正并行地访问 MySQL 或 SQLite，而不会在同一连接上交错执行。
+    """
+
+    def __init__(self,
+                 connect_func: Callable[[], Any],
+                 min_size: int = 1,
+                 max_size: int = 10,
+                 timeout: float = 30.0,
+                 health_check: Optional[Callable[[Any], None]] = None,
+                 name: str = 'db'):
+        """
+        初始化连接池
+
+        Args:
+            connect_func: 创建新连接的函数
+            min_size: 启动时预先建立的连接数
+            max_size: 最大连接数（同时借出的连接上限）
+            timeout: 借出连接的等待超时（秒）
+            health_check: 借出前对连接做健康检查的函数，失败时应抛出异常
+            name: 连接池名称，用于日志
+        """
+        if max_size < 1:
+            raise ValueError(f"max_size 必须大于0: {max_size}")
+        if min_size < 0 or min_size > max_size:
+            raise ValueError(f"min_size 必须在 0 到 max_size 之间: {min_size}")
+
+        self._connect = connect_func
+        self._health_check = health_check
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.name = name
+
+        # 后进先出，优先复用最近使用过的连接
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._size = 0
+        self._closed = False
+
+        for _ in range(min_size):
+            self._idle.put(self._create())
+
+        logger.info(f"连接池 {name} 已初始化: min_size={min_size}, max_size={max_size}, timeout={timeout}s")
+
+    @property
+    def size(self) -> int:
+        """当前已建立的连接数（空闲 + 借出）"""
+        return self._size
+
+    @property
+    def idle(self) -> int:
+        """当前空闲连接数"""
+        return self._idle.qsize()
+
+    def _create(self):
+        conn = self._connect()
+        with self._lock:
+            self._size += 1
+        return conn
+
+    def _discard(self, conn):
+        with self._lock:
+            self._size -= 1
+        try:
+            conn.close()
+        except Exception as e:
+            logger.debug(f"关闭连接时出错: {e}")
+
+    def _check(self, conn):
+        """健康检查，失败时丢弃旧连接并透明重连"""
+        if self._health_check is None:
+            return conn
+        try:
+            self._health_check(conn)
+            return conn
+        except Exception as e:
+            logger.warning(f"连接池 {self.name} 中的连接健康检查失败，重新建立连接: {e}")
+            self._discard(conn)
+            return self._create()
+
+    def acquire(self, timeout: Optional[float] = None):
+        """
+        借出一个连接
+
+        Args:
+            timeout: 等待超时（秒），默认使用连接池配置
+
+        Returns:
+            数据库连接
+        """
+        if self._closed:
+            raise RuntimeError(f"连接池 {self.name} 已关闭")
+
+        wait = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        if not self._slots.acquire(timeout=wait):
+            raise PoolTimeoutError(f"连接池 {self.name} 在 {wait} 秒内没有可用连接 (max_size={self.max_size})")
+
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._create()
+            conn = self._check(conn)
+        except Exception:
+            self._slots.release()
+            raise
+
+        waited = time.monotonic() - start
+        if waited > 1:
+            logger.warning(f"连接池 {self.name} 借出连接等待了 {waited:.2f} 秒")
+        return conn
+
+    def release(self, conn, broken: bool = False):
+        """
+        归还连接
+
+        Args:
+            conn: 借出的连接
+            broken: 连接是否已损坏，损坏的连接直接关闭
+        """
+        try:
+            if not broken:
+                try:
+                    # 结束未提交的事务，避免下一个使用者看到旧的快照或残留的修改
+                    conn.rollback()
+                except Exception as e:
+                    logger.warning(f"归还连接时回滚失败，丢弃该连接: {e}")
+                    broken = True
+
+            if broken or self._closed:
+                self._discard(conn)
+            else:
+                self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        """
+        以上下文管理器的形式借出连接，退出时自动归还
+
+        Args:
+            timeout: 等待超时（秒）
+
+        Yields:
+            数据库连接
+        """
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            # release 会回滚未提交的事务，回滚失败时直接丢弃连接
+            self.release(conn)
+
+    def close(self):
+        """关闭连接池中所有空闲连接，借出的连接归还时会被关闭"""
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+        logger.info(f"连接池 {self.name} 已关闭")
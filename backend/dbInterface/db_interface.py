@@ -1,16 +1,33 @@
 import sqlite3
 import pymysql
 import pandas as pd
-from typing import Dict, List, Any, Tuple, Optional
+from typing import Callable, Dict, Iterator, List, Any, Tuple, Optional
 import os
 import logging
 import numpy as np
 import pickle
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 
+from backend.dbInterface.camera_registry import CameraRegistry
+from backend.dbInterface.connection_pool import ConnectionPool
+from backend.dbInterface.feature_codec import FeatureMatrix, decode_feature_matrix, encode_feature
+from backend.dbInterface.lazy_blob import BlobLoader, LazyBlob
+from backend.dbInterface.video_catalog import VideoCatalog
+from backend.dbInterface.video_index import VideoIntervalIndex
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# student_records 表的全部列，用于校验列投影和特征过滤条件
+STUDENT_RECORD_COLUMNS = (
+    'id', 'student_id', 'camera_id', 'timestamp', 'location_x', 'location_y',
+    'has_backpack', 'has_umbrella', 'has_bicycle', 'feature_vector', 'image_frame',
+    'confidence_east', 'confidence_south', 'confidence_west', 'confidence_north', 'clothing_color'
+)
+# 体积较大的BLOB列，列投影时默认惰性加载
+BLOB_COLUMNS = ('feature_vector', 'image_frame')
+
 
 class DatabaseInterface:
     """数据库接口类，处理与数据库的所有交互"""
@@ -28,47 +45,188 @@ class DatabaseInterface:
                     'port': 端口 (仅mysql),
                     'user': 用户名 (仅mysql),
                     'password': 密码 (仅mysql),
-                    'database': 数据库名 (仅mysql)
+                    'database': 数据库名 (仅mysql),
+                    'pool_min_size': 连接池最小连接数，默认1,
+                    'pool_max_size': 连接池最大连接数，默认10,
+                    'pool_timeout': 借出连接的等待超时（秒），默认30,
+                    'camera_cache_ttl': 摄像头信息缓存的有效期（秒），默认300
                 }
         """
         self.db_config = db_config
-        self.conn = None
+        self.pool = None
+        self._video_index = None
+        self._video_catalog = None
+        self.camera_registry = CameraRegistry(self._fetch_camera_rows, ttl=db_config.get('camera_cache_ttl', 300))
+        # 特征保存成功后的回调 (record_id, feature_vector, algorithm)，用于同步检索库等
+        self.feature_listeners: List[Callable[[int, Any, str], None]] = []
+        self._feature_log_ready = False
         self.connect()
 
+    def _create_connection(self):
+        """创建一个新的数据库连接，供连接池调用"""
+        if self.db_config['type'].lower() == 'sqlite':
+            # 连接会在不同线程间借出，需要关闭sqlite的同线程检查
+            return sqlite3.connect(self.db_config['sqlite_path'], check_same_thread=False)
+        elif self.db_config['type'].lower() == 'mysql':
+            return pymysql.connect(
+                host=self.db_config['host'],
+                port=self.db_config['port'],
+                user=self.db_config['user'],
+                password=self.db_config['password'],
+                database=self.db_config['database'],
+                charset='utf8mb4'
+            )
+        else:
+            raise ValueError(f"Unsupported database type: {self.db_config['type']}")
+
+    def _check_connection(self, conn):
+        """借出连接前的健康检查，失败时抛出异常由连接池重连"""
+        if self.db_config['type'].lower() == 'mysql':
+            conn.ping(reconnect=True)
+        else:
+            conn.execute("SELECT 1")
+
     def connect(self):
-        """建立数据库连接"""
+        """建立数据库连接池"""
         try:
+            self.pool = ConnectionPool(
+                self._create_connection,
+                min_size=self.db_config.get('pool_min_size', 1),
+                max_size=self.db_config.get('pool_max_size', 10),
+                timeout=self.db_config.get('pool_timeout', 30),
+                health_check=self._check_connection,
+                name=self.db_config['type'].lower()
+            )
             if self.db_config['type'].lower() == 'sqlite':
-                self.conn = sqlite3.connect(self.db_config['sqlite_path'])
                 logger.info(f"Connected to SQLite database at {self.db_config['sqlite_path']}")
-            elif self.db_config['type'].lower() == 'mysql':
-                self.conn = pymysql.connect(
-                    host=self.db_config['host'],
-                    port=self.db_config['port'],
-                    user=self.db_config['user'],
-                    password=self.db_config['password'],
-                    database=self.db_config['database'],
-                    charset='utf8mb4'
-                )
-                logger.info(f"Connected to MySQL database at {self.db_config['host']}")
             else:
-                raise ValueError(f"Unsupported database type: {self.db_config['type']}")
+                logger.info(f"Connected to MySQL database at {self.db_config['host']}")
         except Exception as e:
             logger.error(f"Failed to connect to database: {e}")
             raise
 
     def disconnect(self):
-        """关闭数据库连接"""
-        if self.conn:
-            self.conn.close()
+        """关闭数据库连接池"""
+        if self.pool:
+            self.pool.close()
             logger.info("Database connection closed")
 
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        """
+        从连接池借出一个连接，退出上下文时自动归还（未提交的事务会被回滚）
+
+        Args:
+            timeout: 等待超时（秒），默认使用连接池配置
+
+        Yields:
+            数据库连接
+        """
+        with self.pool.connection(timeout) as conn:
+            yield conn
+
+    def _build_record_query(self,
+                            columns: Optional[List[str]] = None,
+                            student_id: Optional[str] = None,
+                            features: Optional[Dict[str, bool]] = None,
+                            time_range: Optional[Tuple[datetime, datetime]] = None,
+                            camera_ids: Optional[List[int]] = None,
+                            clothing_color: Optional[str] = None,
+                            lazy_blobs: bool = True,
+                            order_by_time: bool = False) -> Tuple[str, List[Any], List[str]]:
+        """
+        组装 student_records 查询语句
+
+        Returns:
+            (query, params, lazy_columns)，lazy_columns 为未在SQL中选取、需要惰性加载的BLOB列
+        """
+        lazy_columns = []
+        if columns is None:
+            select = "*"
+        else:
+            unknown = [c for c in columns if c not in STUDENT_RECORD_COLUMNS]
+            if unknown:
+                raise ValueError(f"Unknown student_records columns: {unknown}")
+            if lazy_blobs:
+                lazy_columns = [c for c in columns if c in BLOB_COLUMNS]
+            selected = [c for c in columns if c not in lazy_columns]
+            # 惰性加载需要记录ID
+            if lazy_columns and 'id' not in selected:
+                selected.insert(0, 'id')
+            select = ", ".join(selected)
+
+        query_parts = [f"SELECT {select} FROM student_records WHERE 1=1"]
+        params = []
+
+        # 添加过滤条件
+        if student_id:
+            query_parts.append("AND student_id = %s")
+            params.append(student_id)
+
+        # 特征过滤
+        if features:
+            for feature, value in features.items():
+                if feature not in STUDENT_RECORD_COLUMNS:
+                    raise ValueError(f"Unknown feature column: {feature}")
+                query_parts.append(f"AND {feature} = %s")
+                params.append(value)
+
+        # 衣服颜色过滤
+        if clothing_color:
+            query_parts.append("AND clothing_color = %s")
+            params.append(clothing_color)
+
+        # 时间范围过滤
+        if time_range:
+            query_parts.append("AND timestamp BETWEEN %s AND %s")
+            params.extend([time_range[0], time_range[1]])
+
+        # 摄像头ID过滤
+        if camera_ids:
+            placeholders = ', '.join(['%s'] * len(camera_ids))
+            query_parts.append(f"AND camera_id IN ({placeholders})")
+            params.extend(camera_ids)
+
+        # 流式读取时按时间输出，下游可以逐块增量处理
+        if order_by_time:
+            query_parts.append("ORDER BY timestamp, id")
+
+        # 组装最终查询语句
+        query = " ".join(query_parts)
+
+        if self.db_config['type'].lower() == 'sqlite':
+            # SQLite 使用 ? 作为参数占位符，而不是 %s
+            query = query.replace("%s", "?")
+
+        return query, params, lazy_columns
+
+    def _attach_blob_columns(self, df: pd.DataFrame, lazy_columns: List[str], batch_size: int = 256):
+        """将未选取的BLOB列填充为惰性句柄，并把加载器放到 df.attrs['blob_loaders']"""
+        loaders = {}
+        for column in lazy_columns:
+            loader = BlobLoader(self, column, df['id'].tolist(), batch_size=batch_size)
+            df[column] = [LazyBlob(loader, record_id) for record_id in loader.record_ids]
+            loaders[column] = loader
+        if loaders:
+            df.attrs['blob_loaders'] = loaders
+
+    @staticmethod
+    def _decode_feature_column(df: pd.DataFrame):
+        """批量解码特征数据为一个连续的 (n, d) float32 矩阵"""
+        if 'feature_vector' in df.columns:
+            matrix, valid = decode_feature_matrix(df['feature_vector'].to_numpy())
+            df.attrs['feature_matrix'] = FeatureMatrix(matrix, valid)
+            # 每行保留指向矩阵的视图，不复制数据
+            df['feature_vector'] = [row if ok else None for row, ok in zip(matrix, valid)]
+
     def query_student_records(self,
                               student_id: Optional[str] = None,
                               features: Optional[Dict[str, bool]] = None,
                               time_range: Optional[Tuple[datetime, datetime]] = None,
                               camera_ids: Optional[List[int]] = None,
-                              clothing_color: Optional[str] = None) -> pd.DataFrame:
+                              clothing_color: Optional[str] = None,
+                              columns: Optional[List[str]] = None,
+                              lazy_blobs: bool = True) -> pd.DataFrame:
         """
         查询学生记录
 
@@ -78,65 +236,22 @@ class DatabaseInterface:
             time_range: 时间范围(开始时间, 结束时间)，可选
             camera_ids: 摄像头ID列表，可选
             clothing_color: 衣服颜色，可选
+            columns: 需要返回的列，默认返回全部列（包括BLOB列）
+            lazy_blobs: 指定 columns 时，其中的BLOB列（feature_vector、image_frame）是否以
+                LazyBlob 句柄返回，访问时才分批从数据库加载
 
         Returns:
             包含学生记录的DataFrame
         """
         try:
-            query_parts = ["SELECT * FROM student_records WHERE 1=1"]
-            params = []
-
-            # 添加过滤条件
-            if student_id:
-                query_parts.append("AND student_id = %s")
-                params.append(student_id)
-
-            # 特征过滤
-            if features:
-                for feature, value in features.items():
-                    query_parts.append(f"AND {feature} = %s")
-                    params.append(value)
-
-            # 衣服颜色过滤
-            if clothing_color:
-                query_parts.append("AND clothing_color = %s")
-                params.append(clothing_color)
-
-            # 时间范围过滤
-            if time_range:
-                query_parts.append("AND timestamp BETWEEN %s AND %s")
-                params.extend([time_range[0], time_range[1]])
-
-            # 摄像头ID过滤
-            if camera_ids:
-                placeholders = ', '.join(['%s'] * len(camera_ids))
-                query_parts.append(f"AND camera_id IN ({placeholders})")
-                params.extend(camera_ids)
-
-            # 组装最终查询语句
-            query = " ".join(query_parts)
-
-            # 执行查询
-            if self.db_config['type'].lower() == 'sqlite':
-                # SQLite 使用 ? 作为参数占位符，而不是 %s
-                query = query.replace("%s", "?")
-
-            df = pd.read_sql(query, self.conn, params=params)
+            query, params, lazy_columns = self._build_record_query(
+                columns, student_id, features, time_range, camera_ids, clothing_color, lazy_blobs)
 
-            def safe_unpickle(x):
-                try:
-                    if x is not None and len(x) > 0:
-                        return pickle.loads(x)
-                    else:
-                        return None
-                except Exception as e:
-                    logger.warning(f"Failed to unpickle feature_vector: {e}")
-                    return None  # 失败时返回None而不是抛出异常
+            with self.connection() as conn:
+                df = pd.read_sql(query, conn, params=params)
 
-            # 处理特征数据
-            if 'feature_vector' in df.columns:
-                # 假设特征向量是以二进制格式存储的
-                df['feature_vector'] = df['feature_vector'].apply(safe_unpickle)
+            self._decode_feature_column(df)
+            self._attach_blob_columns(df, lazy_columns)
 
             logger.info(f"Retrieved {len(df)} records from database")
             return df
@@ -145,16 +260,80 @@ class DatabaseInterface:
             logger.error(f"Error querying student records: {e}")
             raise
 
+    def iter_student_records(self,
+                             student_id: Optional[str] = None,
+                             features: Optional[Dict[str, bool]] = None,
+                             time_range: Optional[Tuple[datetime, datetime]] = None,
+                             camera_ids: Optional[List[int]] = None,
+                             clothing_color: Optional[str] = None,
+                             columns: Optional[List[str]] = None,
+                             lazy_blobs: bool = True,
+                             chunk_size: int = 5000) -> Iterator[pd.DataFrame]:
+        """
+        流式查询学生记录，按时间顺序分块返回
+
+        MySQL 使用服务端游标（SSCursor），SQLite 使用普通游标的 fetchmany，
+        结果集不会在客户端一次性物化，内存占用只与 chunk_size 有关。
+        迭代期间会一直占用一个连接池连接，直到迭代结束或生成器被关闭。
+
+        Args:
+            student_id、features、time_range、camera_ids、clothing_color、columns、lazy_blobs:
+                与 query_student_records 相同
+            chunk_size: 每块的记录数
+
+        Yields:
+            按 (timestamp, id) 排序的记录DataFrame块，格式与 query_student_records 的返回值一致
+        """
+        if chunk_size < 1:
+            raise ValueError(f"chunk_size 必须大于0: {chunk_size}")
+
+        query, params, lazy_columns = self._build_record_query(
+            columns, student_id, features, time_range, camera_ids, clothing_color, lazy_blobs,
+            order_by_time=True)
+
+        total = 0
+        with self.connection() as conn:
+            if self.db_config['type'].lower() == 'mysql':
+                cursor = conn.cursor(pymysql.cursors.SSCursor)
+            else:
+                cursor = conn.cursor()
+            try:
+                cursor.execute(query, params)
+                names = [d[0] for d in cursor.description]
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    df = pd.DataFrame.from_records(rows, columns=names)
+                    self._decode_feature_column(df)
+                    self._attach_blob_columns(df, lazy_columns)
+                    total += len(df)
+                    yield df
+            finally:
+                # SSCursor 关闭时会丢弃服务端剩余的结果，连接才能被归还复用
+                cursor.close()
+
+        logger.info(f"Streamed {total} records from database")
+
+    def _fetch_camera_rows(self) -> List[Tuple]:
+        """从数据库读取全部摄像头的 (camera_id, location_x, location_y, name)，供摄像头缓存调用"""
+        query = "SELECT camera_id, location_x, location_y, name FROM cameras"
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query)
+            rows = cursor.fetchall()
+            cursor.close()
+        return rows
+
     def get_camera_locations(self) -> pd.DataFrame:
         """
-        获取所有摄像头位置信息
+        获取所有摄像头位置信息（读取摄像头缓存）
 
         Returns:
             包含摄像头ID、位置坐标的DataFrame
         """
         try:
-            query = "SELECT camera_id, location_x, location_y, name FROM cameras"
-            df = pd.read_sql(query, self.conn)
+            df = self.camera_registry.to_frame()
             logger.info(f"Retrieved {len(df)} camera locations")
             return df
         except Exception as e:
@@ -176,10 +355,11 @@ class DatabaseInterface:
             if self.db_config['type'].lower() == 'sqlite':
                 query = query.replace("%s", "?")
 
-            cursor = self.conn.cursor()
-            cursor.execute(query, (record_id,))
-            result = cursor.fetchone()
-            cursor.close()
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(query, (record_id,))
+                result = cursor.fetchone()
+                cursor.close()
 
             if result:
                 return result[0]  # 图像二进制数据
@@ -190,6 +370,20 @@ class DatabaseInterface:
             logger.error(f"Error retrieving image frame: {e}")
             raise
 
+    @property
+    def video_index(self) -> VideoIntervalIndex:
+        """camera_videos 的内存区间索引，首次访问时加载"""
+        if self._video_index is None:
+            self._video_index = VideoIntervalIndex(self)
+        return self._video_index
+
+    @property
+    def video_catalog(self) -> VideoCatalog:
+        """录像元数据与关键帧索引目录"""
+        if self._video_catalog is None:
+            self._video_catalog = VideoCatalog(self)
+        return self._video_catalog
+
     def get_video_path(self, camera_id: int, timestamp: datetime) -> str:
         """
         获取与特定摄像头和时间相关的视频路径
@@ -202,27 +396,9 @@ class DatabaseInterface:
             视频文件路径
         """
         try:
-            # 格式化日期和时间
-            date_str = timestamp.strftime('%Y%m%d')
-
-            # 查询视频文件信息
-            query = """
-            SELECT video_path FROM camera_videos 
-            WHERE camera_id = %s AND date = %s 
-            AND start_time <= %s AND end_time >= %s 
-            LIMIT 1
-            """
-
-            if self.db_config['type'].lower() == 'sqlite':
-                query = query.replace("%s", "?")
-
-            cursor = self.conn.cursor()
-            cursor.execute(query, (camera_id, date_str, timestamp, timestamp))
-            result = cursor.fetchone()
-            cursor.close()
-
-            if result:
-                return result[0]  # 视频路径
+            video = self.video_index.lookup(camera_id, timestamp)
+            if video:
+                return video['video_path']  # 视频路径
             else:
                 logger.warning(f"No video found for camera {camera_id} at {timestamp}")
                 return None
@@ -242,30 +418,31 @@ class DatabaseInterface:
             查询结果的字典列表
         """
         try:
-            cursor = self.conn.cursor()
+            with self.connection() as conn:
+                cursor = conn.cursor()
 
-            if params:
-                cursor.execute(query, params)
-            else:
-                cursor.execute(query)
+                if params:
+                    cursor.execute(query, params)
+                else:
+                    cursor.execute(query)
 
-            # 获取列名
-            if self.db_config['type'].lower() == 'sqlite':
-                columns = [desc[0] for desc in cursor.description] if cursor.description else []
-            else:  # MySQL
-                columns = [desc[0] for desc in cursor.description] if cursor.description else []
+                # 获取列名
+                if self.db_config['type'].lower() == 'sqlite':
+                    columns = [desc[0] for desc in cursor.description] if cursor.description else []
+                else:  # MySQL
+                    columns = [desc[0] for desc in cursor.description] if cursor.description else []
 
-            # 获取结果并转换为字典列表
-            results = cursor.fetchall()
-            result_dicts = []
+                # 获取结果并转换为字典列表
+                results = cursor.fetchall()
+                cursor.close()
 
+            result_dicts = []
             for row in results:
                 result_dict = {}
                 for i, col_name in enumerate(columns):
                     result_dict[col_name] = row[i]
                 result_dicts.append(result_dict)
 
-            cursor.close()
             logger.info(f"查询执行成功，返回 {len(result_dicts)} 条结果")
             return result_dicts
 
@@ -289,18 +466,94 @@ class DatabaseInterface:
             if self.db_config['type'].lower() == 'sqlite':
                 query = query.replace("%s", "?")
 
-            cursor = self.conn.cursor()
-            cursor.execute(query, (student_id, record_id))
-            self.conn.commit()
-            cursor.close()
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(query, (student_id, record_id))
+                conn.commit()
+                cursor.close()
 
             logger.info(f"Updated student_id to {student_id} for record {record_id}")
             return True
         except Exception as e:
             logger.error(f"Error updating student ID: {e}")
-            self.conn.rollback()
             return False
 
+    def ensure_feature_change_log(self):
+        """
+        创建 feature_changes 表（已存在时跳过）
+
+        写入或清空 student_records.feature_vector 时在同一事务中追加一行（record_id），
+        seq 单调递增，检索库等按 seq 水位线增量同步特征的变化。
+        """
+        if self._feature_log_ready:
+            return
+        if self.db_config['type'].lower() == 'sqlite':
+            seq = 'INTEGER PRIMARY KEY AUTOINCREMENT'
+        else:
+            seq = 'BIGINT AUTO_INCREMENT PRIMARY KEY'
+        self.execute_update(f"""
+            CREATE TABLE IF NOT EXISTS feature_changes (
+                seq        {seq},
+                record_id  INT NOT NULL
+            )
+        """)
+        self._feature_log_ready = True
+
+    def record_feature_changes(self, cursor, record_ids: List[int]):
+        """
+        在调用方的事务中记录特征发生变化的记录ID，由调用方提交
+
+        Args:
+            cursor: 更新 feature_vector 所用连接的游标
+            record_ids: 记录ID列表
+        """
+        if not record_ids:
+            return
+        query = "INSERT INTO feature_changes (record_id) VALUES (%s)"
+        if self.db_config['type'].lower() == 'sqlite':
+            query = query.replace("%s", "?")
+        cursor.executemany(query, [(int(record_id),) for record_id in record_ids])
+
+    def save_feature_vector(self, record_id: int, feature_vector, algorithm: str = 'mgn',
+                            dtype: str = 'float32') -> bool:
+        """
+        以二进制格式保存记录的特征向量
+
+        Args:
+            record_id: 记录ID
+            feature_vector: 特征向量
+            algorithm: 提取特征所用算法
+            dtype: 存储精度，'float32' 或 'float16'
+
+        Returns:
+            保存是否成功
+        """
+        try:
+            self.ensure_feature_change_log()
+            blob = encode_feature(feature_vector, algorithm=algorithm, dtype=dtype)
+            query = "UPDATE student_records SET feature_vector = %s WHERE id = %s"
+            if self.db_config['type'].lower() == 'sqlite':
+                query = query.replace("%s", "?")
+
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(query, (blob, record_id))
+                self.record_feature_changes(cursor, [record_id])
+                conn.commit()
+                cursor.close()
+
+            logger.info(f"Saved feature vector for record {record_id} ({algorithm}, {dtype})")
+        except Exception as e:
+            logger.error(f"Error saving feature vector: {e}")
+            return False
+
+        for listener in self.feature_listeners:
+            try:
+                listener(record_id, feature_vector, algorithm)
+            except Exception as e:
+                logger.error(f"Feature listener failed for record {record_id}: {e}")
+        return True
+
     def save_trajectory(self, student_id: str, trajectory_data: Dict[str, Any]) -> int:
         """
         保存学生轨迹数据
@@ -325,29 +578,29 @@ class DatabaseInterface:
             if self.db_config['type'].lower() == 'sqlite':
                 query = query.replace("%s", "?")
 
-            cursor = self.conn.cursor()
-            cursor.execute(query, (student_id, trajectory_json, timestamp))
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(query, (student_id, trajectory_json, timestamp))
 
-            if self.db_config['type'].lower() == 'sqlite':
-                trajectory_id = cursor.lastrowid
-            else:  # MySQL
-                trajectory_id = cursor.lastrowid
+                if self.db_config['type'].lower() == 'sqlite':
+                    trajectory_id = cursor.lastrowid
+                else:  # MySQL
+                    trajectory_id = cursor.lastrowid
 
-            self.conn.commit()
-            cursor.close()
+                conn.commit()
+                cursor.close()
 
             logger.info(f"Saved trajectory for student {student_id}, ID: {trajectory_id}")
             return trajectory_id
         except Exception as e:
             logger.error(f"Error saving trajectory: {e}")
-            self.conn.rollback()
             return -1
 
     def reconnect(self):
-        """重新连接数据库"""
+        """重建数据库连接池"""
         try:
-            if self.conn:
-                self.conn.close()
+            if self.pool:
+                self.pool.close()
             self.connect()
             logger.info("Reconnected to database")
         except Exception as e:
@@ -366,29 +619,29 @@ class DatabaseInterface:
             受影响的行数
         """
         try:
-            cursor = self.conn.cursor()
-
             # 检查数据库类型，调整SQL语法
             if self.db_config['type'].lower() == 'sqlite':
                 query = query.replace("%s", "?")
 
-            if params:
-                cursor.execute(query, params)
-            else:
-                cursor.execute(query)
+            with self.connection() as conn:
+                cursor = conn.cursor()
 
-            # 获取受影响的行数
-            affected_rows = cursor.rowcount
+                if params:
+                    cursor.execute(query, params)
+                else:
+                    cursor.execute(query)
 
-            # 提交更改
-            self.conn.commit()
-            cursor.close()
+                # 获取受影响的行数
+                affected_rows = cursor.rowcount
+
+                # 提交更改
+                conn.commit()
+                cursor.close()
 
             logger.info(f"更新操作成功，影响了 {affected_rows} 行数据")
             return affected_rows
 
         except Exception as e:
             logger.error(f"执行更新操作时发生错误: {e}")
-            self.conn.rollback()  # 出错时回滚事务
             raise
 
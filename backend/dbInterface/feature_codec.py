@@ -0,0 +1,172 @@
+import logging
+import pickle
+import struct
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 二进制特征向量格式（student_records.feature_vector）:
+#   | magic 'FVEC' | version u8 | dtype u8 | algorithm u8 | reserved u8 | dim u32 | reserved 4B | payload |
+# 头部固定16字节（小端），payload 为 dim 个 float32/float16，按头部长度对齐以便 np.frombuffer 直接映射。
+FEATURE_MAGIC = b'FVEC'
+FEATURE_VERSION = 1
+_HEADER = struct.Struct('<4sBBBBI4x')
+HEADER_SIZE = _HEADER.size
+
+DTYPE_CODES = {1: np.dtype('<f4'), 2: np.dtype('<f2')}
+_DTYPE_TO_CODE = {'float32': 1, 'float16': 2}
+
+ALGORITHM_CODES = {0: 'unknown', 1: 'mgn', 2: 'agw', 3: 'sbs'}
+_ALGORITHM_TO_CODE = {name: code for code, name in ALGORITHM_CODES.items()}
+
+
+def is_encoded(blob) -> bool:
+    """判断数据是否为新的二进制特征格式"""
+    return blob is not None and len(blob) >= HEADER_SIZE and bytes(blob[:4]) == FEATURE_MAGIC
+
+
+def parse_header(blob) -> Tuple[int, np.dtype, str, int]:
+    """
+    解析特征向量头部
+
+    Args:
+        blob: 编码后的二进制数据
+
+    Returns:
+        (version, dtype, algorithm, dim)
+    """
+    magic, version, dtype_code, algorithm_code, _, dim = _HEADER.unpack_from(blob, 0)
+    if magic != FEATURE_MAGIC:
+        raise ValueError("不是有效的特征向量数据")
+    if version != FEATURE_VERSION:
+        raise ValueError(f"不支持的特征向量格式版本: {version}")
+    if dtype_code not in DTYPE_CODES:
+        raise ValueError(f"不支持的特征向量数据类型: {dtype_code}")
+    return version, DTYPE_CODES[dtype_code], ALGORITHM_CODES.get(algorithm_code, 'unknown'), dim
+
+
+def encode_feature(vector, algorithm: str = 'mgn', dtype: str = 'float32') -> bytes:
+    """
+    将特征向量编码为带头部的二进制格式
+
+    Args:
+        vector: 一维特征向量（列表或numpy数组）
+        algorithm: 提取特征所用算法，'mgn'、'agw' 或 'sbs'
+        dtype: 存储精度，'float32' 或 'float16'
+
+    Returns:
+        编码后的二进制数据
+    """
+    if dtype not in _DTYPE_TO_CODE:
+        raise ValueError(f"不支持的存储精度: {dtype}")
+    dtype_code = _DTYPE_TO_CODE[dtype]
+    array = np.asarray(vector, dtype=DTYPE_CODES[dtype_code]).ravel()
+    header = _HEADER.pack(FEATURE_MAGIC, FEATURE_VERSION, dtype_code,
+                          _ALGORITHM_TO_CODE.get(algorithm, 0), 0, array.shape[0])
+    return header + array.tobytes()
+
+
+def decode_feature(blob) -> Optional[np.ndarray]:
+    """
+    解码单个特征向量，兼容旧的 pickle 格式
+
+    Args:
+        blob: 数据库中的二进制数据
+
+    Returns:
+        float32 特征向量，无法解码时返回 None
+    """
+    if blob is None or len(blob) == 0:
+        return None
+    try:
+        if is_encoded(blob):
+            _, dtype, _, dim = parse_header(blob)
+            vector = np.frombuffer(blob, dtype=dtype, count=dim, offset=HEADER_SIZE)
+            return vector.astype(np.float32, copy=dtype != np.float32)
+
+        # 旧数据：pickle 序列化的列表或数组
+        legacy = pickle.loads(blob)
+        if legacy is None:
+            return None
+        return np.asarray(legacy, dtype=np.float32).ravel()
+    except Exception as e:
+        logger.warning(f"Failed to decode feature_vector: {e}")
+        return None
+
+
+class FeatureMatrix:
+    """批量解码得到的 (n, d) 特征矩阵及有效行掩码
+
+    作为 DataFrame.attrs 中的共享只读结果使用；pandas 在每次运算时都会深拷贝 attrs，
+    因此深拷贝时直接返回自身，避免复制整个矩阵。
+    """
+
+    __slots__ = ('matrix', 'valid')
+
+    def __init__(self, matrix: np.ndarray, valid: np.ndarray):
+        self.matrix = matrix
+        self.valid = valid
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+
+def decode_feature_matrix(blobs: Iterable) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    批量解码结果集中的特征向量为一个连续的 (n, d) float32 矩阵
+
+    所有行格式一致时（迁移后的常见情况），直接把拼接后的缓冲区按行步长映射为
+    (n, d) 视图再一次性转换，不为每一行创建 Python 对象；否则逐行回退解码。
+
+    Args:
+        blobs: 二进制数据序列（可以包含 None）
+
+    Returns:
+        (matrix, valid)，matrix 形状为 (n, d)，valid 为布尔数组，标记哪些行解码成功；
+        无效行在 matrix 中为全零
+    """
+    blobs = list(blobs)
+    n = len(blobs)
+    if n == 0:
+        return np.zeros((0, 0), dtype=np.float32), np.zeros(0, dtype=bool)
+
+    valid_idx = [i for i, b in enumerate(blobs) if b is not None and len(b) > 0]
+    if valid_idx:
+        first = blobs[valid_idx[0]]
+        if is_encoded(first):
+            _, dtype, _, dim = parse_header(first)
+            row_size = HEADER_SIZE + dim * dtype.itemsize
+            raw = b''.join(blobs[i] for i in valid_idx)
+            if len(raw) == row_size * len(valid_idx):
+                rows = np.frombuffer(raw, dtype=np.uint8).reshape(len(valid_idx), row_size)
+                # 所有头部与第一行一致才能走快速路径
+                if (rows[:, :HEADER_SIZE] == rows[0, :HEADER_SIZE]).all():
+                    view = np.ndarray(shape=(len(valid_idx), dim), dtype=dtype, buffer=raw,
+                                      offset=HEADER_SIZE, strides=(row_size, dtype.itemsize))
+                    if len(valid_idx) == n:
+                        return np.ascontiguousarray(view, dtype=np.float32), np.ones(n, dtype=bool)
+                    matrix = np.zeros((n, dim), dtype=np.float32)
+                    matrix[valid_idx] = view
+                    valid = np.zeros(n, dtype=bool)
+                    valid[valid_idx] = True
+                    return matrix, valid
+
+    # 回退：格式混合或仍为旧的 pickle 数据
+    vectors = [decode_feature(b) for b in blobs]
+    dims = {v.shape[0] for v in vectors if v is not None}
+    if len(dims) > 1:
+        logger.warning(f"特征向量维度不一致: {sorted(dims)}，按最大维度补零")
+    dim = max(dims) if dims else 0
+    matrix = np.zeros((n, dim), dtype=np.float32)
+    valid = np.zeros(n, dtype=bool)
+    for i, v in enumerate(vectors):
+        if v is not None:
+            matrix[i, :v.shape[0]] = v
+            valid[i] = True
+    return matrix, valid
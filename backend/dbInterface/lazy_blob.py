@@ -0,0 +1,125 @@
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from backend.dbInterface.feature_codec import decode_feature_matrix
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class BlobLoader:
+    """按需批量加载 student_records 中某个BLOB列的数据
+
+    查询时不传输BLOB内容，只记录结果集中的记录ID；第一次访问某条记录时，
+    连同同一批次的其他记录一起用 WHERE id IN (...) 取回并缓存。
+    """
+
+    def __init__(self, db_interface, column: str, record_ids: List[int], batch_size: int = 256):
+        """
+        初始化BLOB加载器
+
+        Args:
+            db_interface: 数据库接口实例
+            column: BLOB列名，'feature_vector' 或 'image_frame'
+            record_ids: 结果集中的记录ID列表（按结果集顺序）
+            batch_size: 每次从数据库加载的记录数
+        """
+        self.db = db_interface
+        self.column = column
+        self.record_ids = [int(i) for i in record_ids]
+        self.batch_size = batch_size
+        self._position = {record_id: i for i, record_id in enumerate(self.record_ids)}
+        self._cache: Dict[int, Any] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.record_ids)
+
+    def __deepcopy__(self, memo):
+        # 加载器放在 DataFrame.attrs 中，pandas 深拷贝 attrs 时共享同一个加载器和缓存
+        return self
+
+    def _fetch(self, ids: List[int]):
+        placeholder = '?' if self.db.db_config['type'].lower() == 'sqlite' else '%s'
+        query = (f"SELECT id, {self.column} FROM student_records "
+                 f"WHERE id IN ({', '.join([placeholder] * len(ids))})")
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, ids)
+            rows = cursor.fetchall()
+            cursor.close()
+
+        values = {row[0]: row[1] for row in rows}
+        if self.column == 'feature_vector':
+            matrix, valid = decode_feature_matrix(values.get(i) for i in ids)
+            for i, record_id in enumerate(ids):
+                self._cache[record_id] = matrix[i] if valid[i] else None
+        else:
+            for record_id in ids:
+                self._cache[record_id] = values.get(record_id)
+        logger.info(f"按需加载 {self.column}: {len(ids)} 条记录")
+
+    def get(self, record_id: int):
+        """
+        获取单条记录的BLOB数据，未加载时加载其所在的整个批次
+
+        Args:
+            record_id: 记录ID
+
+        Returns:
+            feature_vector 列返回 float32 数组，其他列返回原始二进制数据
+        """
+        record_id = int(record_id)
+        with self._lock:
+            if record_id not in self._cache:
+                pos = self._position.get(record_id)
+                if pos is None:
+                    batch = [record_id]
+                else:
+                    start = pos - pos % self.batch_size
+                    batch = [i for i in self.record_ids[start:start + self.batch_size] if i not in self._cache]
+                self._fetch(batch)
+            return self._cache.get(record_id)
+
+    def load_all(self):
+        """一次性加载结果集中所有未加载的记录（分批执行）"""
+        with self._lock:
+            missing = [i for i in self.record_ids if i not in self._cache]
+            for start in range(0, len(missing), self.batch_size):
+                self._fetch(missing[start:start + self.batch_size])
+
+    def matrix(self) -> Optional[np.ndarray]:
+        """将 feature_vector 列加载为 (n, d) float32 矩阵，行顺序与结果集一致"""
+        if self.column != 'feature_vector':
+            raise ValueError(f"{self.column} 不是特征向量列")
+        self.load_all()
+        vectors = [self._cache.get(i) for i in self.record_ids]
+        dim = next((v.shape[0] for v in vectors if v is not None), 0)
+        matrix = np.zeros((len(vectors), dim), dtype=np.float32)
+        for i, v in enumerate(vectors):
+            if v is not None:
+                matrix[i] = v
+        return matrix
+
+
+class LazyBlob:
+    """单条记录BLOB数据的惰性句柄，访问 value 时才从数据库加载"""
+
+    __slots__ = ('loader', 'record_id')
+
+    def __init__(self, loader: BlobLoader, record_id: int):
+        self.loader = loader
+        self.record_id = record_id
+
+    @property
+    def value(self):
+        return self.loader.get(self.record_id)
+
+    def load(self):
+        return self.value
+
+    def __repr__(self):
+        return f"LazyBlob({self.loader.column}, id={self.record_id})"
@@ -0,0 +1,117 @@
+"""
+将 student_records.feature_vector 中旧的 pickle 数据批量转换为二进制特征格式
+
+用法:
+    python -m backend.dbInterface.migrate_feature_vectors --batch-size 500 --dtype float32
+"""
+import argparse
+import logging
+import pickle
+
+import numpy as np
+
+from backend.dbInterface.db_interface import DatabaseInterface
+from backend.dbInterface.feature_codec import encode_feature, is_encoded
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def migrate_feature_vectors(db_interface: DatabaseInterface,
+                            batch_size: int = 500,
+                            dtype: str = 'float32',
+                            algorithm: str = 'mgn',
+                            dry_run: bool = False) -> dict:
+    """
+    按主键分批迁移特征向量，每批一个事务，可中断后重复执行；转换的记录写入 feature_changes 变更日志
+
+    Args:
+        db_interface: 数据库接口实例
+        batch_size: 每批处理的记录数
+        dtype: 目标存储精度，'float32' 或 'float16'
+        algorithm: 写入头部的算法名称（旧数据没有记录算法）
+        dry_run: 只统计不写入
+
+    Returns:
+        迁移统计信息
+    """
+    placeholder = '?' if db_interface.db_config['type'].lower() == 'sqlite' else '%s'
+    select_sql = (f"SELECT id, feature_vector FROM student_records "
+                  f"WHERE id > {placeholder} AND feature_vector IS NOT NULL ORDER BY id LIMIT {placeholder}")
+    update_sql = f"UPDATE student_records SET feature_vector = {placeholder} WHERE id = {placeholder}"
+
+    stats = {'scanned': 0, 'converted': 0, 'skipped': 0, 'failed': 0}
+    last_id = 0
+    if not dry_run:
+        db_interface.ensure_feature_change_log()
+
+    while True:
+        with db_interface.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(select_sql, (last_id, batch_size))
+            rows = cursor.fetchall()
+
+            if not rows:
+                cursor.close()
+                break
+
+            updates = []
+            for record_id, blob in rows:
+                stats['scanned'] += 1
+                if blob is None or len(blob) == 0 or is_encoded(blob):
+                    stats['skipped'] += 1
+                    continue
+                try:
+                    vector = np.asarray(pickle.loads(blob), dtype=np.float32).ravel()
+                    updates.append((encode_feature(vector, algorithm=algorithm, dtype=dtype), record_id))
+                except Exception as e:
+                    stats['failed'] += 1
+                    logger.warning(f"记录 {record_id} 的特征向量无法解析，跳过: {e}")
+
+            if updates and not dry_run:
+                cursor.executemany(update_sql, updates)
+                # 同一事务中写入变更日志，检索库据此重新读取这些记录的特征
+                db_interface.record_feature_changes(cursor, [record_id for _, record_id in updates])
+                conn.commit()
+            stats['converted'] += len(updates)
+            cursor.close()
+
+        last_id = rows[-1][0]
+        logger.info(f"已处理到记录 {last_id}: {stats}")
+
+    logger.info(f"特征向量迁移完成{'（dry run，未写入）' if dry_run else ''}: {stats}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='迁移 student_records.feature_vector 为二进制特征格式')
+    parser.add_argument('--type', default='mysql', choices=['mysql', 'sqlite'])
+    parser.add_argument('--sqlite-path', default='')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=3306)
+    parser.add_argument('--user', default='root')
+    parser.add_argument('--password', default='123456')
+    parser.add_argument('--database', default='trajectory')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--dtype', default='float32', choices=['float32', 'float16'])
+    parser.add_argument('--algorithm', default='mgn', choices=['mgn', 'agw', 'sbs'])
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    db_interface = DatabaseInterface({
+        'type': args.type,
+        'sqlite_path': args.sqlite_path,
+        'host': args.host,
+        'port': args.port,
+        'user': args.user,
+        'password': args.password,
+        'database': args.database,
+    })
+    try:
+        migrate_feature_vectors(db_interface, args.batch_size, args.dtype, args.algorithm, args.dry_run)
+    finally:
+        db_interface.disconnect()
+
+
+if __name__ == '__main__':
+    main()
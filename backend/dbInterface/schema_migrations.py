@@ -0,0 +1,300 @@
+"""
+轨迹相关表的索引维护与 student_records 按时间范围分区
+
+用法:
+    python -m backend.dbInterface.schema_migrations status
+    python -m backend.dbInterface.schema_migrations indexes
+    python -m backend.dbInterface.schema_migrations partition --granularity month --ahead 3 --drop-foreign-key
+"""
+import argparse
+import logging
+from datetime import date, datetime
+from typing import Dict, List, Tuple
+
+from backend.dbInterface.db_interface import DatabaseInterface
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# (表名, 索引名, 列) —— 与 sql/create.sql 中的定义保持一致
+INDEXES: List[Tuple[str, str, Tuple[str, ...]]] = [
+    # 按摄像头 + 时间查询（get_video_path、按摄像头回放）
+    ('student_records', 'idx_records_camera_time', ('camera_id', 'timestamp')),
+    # 按学号 + 时间查询（轨迹查询）
+    ('student_records', 'idx_records_student_time', ('student_id', 'timestamp')),
+    # /filter 的覆盖索引：时间范围扫描 + 属性过滤，且包含 FILTER_COLUMNS 中的全部列（InnoDB 二级索引隐含主键 id）
+    ('student_records', 'idx_records_filter',
+     ('timestamp', 'has_backpack', 'has_umbrella', 'clothing_color', 'camera_id', 'student_id')),
+    # 按摄像头和日期查找录像
+    ('camera_videos', 'idx_videos_camera_date', ('camera_id', 'date', 'start_time')),
+]
+
+GRANULARITIES = ('day', 'month')
+
+
+def _is_sqlite(db_interface: DatabaseInterface) -> bool:
+    return db_interface.db_config['type'].lower() == 'sqlite'
+
+
+def get_indexes(db_interface: DatabaseInterface, table: str) -> Dict[str, Tuple[str, ...]]:
+    """
+    获取表上已有的索引
+
+    Args:
+        db_interface: 数据库接口实例
+        table: 表名
+
+    Returns:
+        {索引名: 列元组}
+    """
+    indexes = {}
+    with db_interface.connection() as conn:
+        cursor = conn.cursor()
+        if _is_sqlite(db_interface):
+            cursor.execute(f"PRAGMA index_list({table})")
+            names = [row[1] for row in cursor.fetchall()]
+            for name in names:
+                cursor.execute(f"PRAGMA index_info({name})")
+                indexes[name] = tuple(row[2] for row in sorted(cursor.fetchall()))
+        else:
+            cursor.execute(
+                "SELECT INDEX_NAME, COLUMN_NAME FROM information_schema.STATISTICS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s ORDER BY INDEX_NAME, SEQ_IN_INDEX",
+                (table,))
+            for name, column in cursor.fetchall():
+                indexes.setdefault(name, ())
+                indexes[name] += (column,)
+        cursor.close()
+    return indexes
+
+
+def ensure_indexes(db_interface: DatabaseInterface, dry_run: bool = False) -> Dict[str, str]:
+    """
+    创建缺失的索引，列定义发生变化的同名索引会被重建
+
+    Args:
+        db_interface: 数据库接口实例
+        dry_run: 只打印将要执行的语句
+
+    Returns:
+        {索引名: 'exists' | 'created' | 'rebuilt'}
+    """
+    result = {}
+    existing_by_table = {}
+    for table, name, columns in INDEXES:
+        if table not in existing_by_table:
+            existing_by_table[table] = get_indexes(db_interface, table)
+        existing = existing_by_table[table]
+
+        if existing.get(name) == columns:
+            result[name] = 'exists'
+            continue
+
+        statements = []
+        if name in existing:
+            if _is_sqlite(db_interface):
+                statements.append(f"DROP INDEX {name}")
+            else:
+                statements.append(f"DROP INDEX {name} ON {table}")
+        statements.append(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})")
+
+        for statement in statements:
+            logger.info(f"{'[dry run] ' if dry_run else ''}{statement}")
+            if not dry_run:
+                db_interface.execute_update(statement)
+        result[name] = 'rebuilt' if name in existing else 'created'
+
+    logger.info(f"索引检查完成: {result}")
+    return result
+
+
+def drop_indexes(db_interface: DatabaseInterface) -> List[str]:
+    """删除 INDEXES 中定义的索引（用于基准测试对比）"""
+    dropped = []
+    for table, name, _ in INDEXES:
+        if name not in get_indexes(db_interface, table):
+            continue
+        if _is_sqlite(db_interface):
+            db_interface.execute_update(f"DROP INDEX {name}")
+        else:
+            db_interface.execute_update(f"DROP INDEX {name} ON {table}")
+        dropped.append(name)
+    logger.info(f"已删除索引: {dropped}")
+    return dropped
+
+
+def _period_start(day: date, granularity: str) -> date:
+    return day if granularity == 'day' else day.replace(day=1)
+
+
+def _next_period(day: date, granularity: str) -> date:
+    if granularity == 'day':
+        return date.fromordinal(day.toordinal() + 1)
+    if day.month == 12:
+        return date(day.year + 1, 1, 1)
+    return date(day.year, day.month + 1, 1)
+
+
+def _partition_name(start: date, granularity: str) -> str:
+    return f"p{start:%Y%m%d}" if granularity == 'day' else f"p{start:%Y%m}"
+
+
+def _partition_bounds(first: date, last: date, granularity: str) -> List[Tuple[str, date]]:
+    """返回 [(分区名, 上界)]，覆盖从 first 所在周期到 last 所在周期"""
+    bounds = []
+    current = _period_start(first, granularity)
+    while current <= last:
+        upper = _next_period(current, granularity)
+        bounds.append((_partition_name(current, granularity), upper))
+        current = upper
+    return bounds
+
+
+def _partition_clause(bounds: List[Tuple[str, date]]) -> str:
+    parts = [f"PARTITION {name} VALUES LESS THAN (TO_DAYS('{upper:%Y-%m-%d}'))" for name, upper in bounds]
+    parts.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+    return ",\n    ".join(parts)
+
+
+def get_partitions(db_interface: DatabaseInterface) -> List[Tuple[str, str, int]]:
+    """
+    获取 student_records 当前的分区
+
+    Returns:
+        [(分区名, 上界描述, 行数估计)]，未分区或 SQLite 时返回空列表
+    """
+    if _is_sqlite(db_interface):
+        return []
+    rows = db_interface.execute_query(
+        "SELECT PARTITION_NAME, PARTITION_DESCRIPTION, TABLE_ROWS FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'student_records' AND PARTITION_NAME IS NOT NULL "
+        "ORDER BY PARTITION_ORDINAL_POSITION")
+    return [(row['PARTITION_NAME'], row['PARTITION_DESCRIPTION'], row['TABLE_ROWS']) for row in rows]
+
+
+def partition_student_records(db_interface: DatabaseInterface,
+                              granularity: str = 'month',
+                              ahead: int = 3,
+                              drop_foreign_key: bool = False,
+                              dry_run: bool = False) -> List[str]:
+    """
+    将 student_records 按 timestamp 进行 RANGE 分区；已分区时只追加未来的分区
+
+    MySQL 要求分区键包含在每个唯一键中且分区表不支持外键，因此首次分区会：
+    删除外键 fk_student（需显式传入 drop_foreign_key）、把 timestamp 改为 NOT NULL，
+    并把主键改为 (id, timestamp)。SQLite 不支持分区，直接跳过。
+
+    Args:
+        db_interface: 数据库接口实例
+        granularity: 分区粒度，'day' 或 'month'
+        ahead: 预先创建的未来分区数
+        drop_foreign_key: 是否允许删除 student_records 上的外键
+        dry_run: 只打印将要执行的语句
+
+    Returns:
+        执行（或将要执行）的语句列表
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"不支持的分区粒度: {granularity}")
+    if _is_sqlite(db_interface):
+        logger.warning("SQLite 不支持表分区，跳过")
+        return []
+
+    today = datetime.now().date()
+    last = today
+    for _ in range(ahead):
+        last = _next_period(_period_start(last, granularity), granularity)
+
+    statements = []
+    partitions = get_partitions(db_interface)
+
+    if partitions:
+        # 已分区：把 pmax 拆分出新的周期分区
+        existing = {name for name, _, _ in partitions}
+        regular = [name for name in existing if name != 'pmax']
+        latest = max(regular) if regular else None
+        if latest is None:
+            first = today
+        elif granularity == 'day':
+            first = _next_period(datetime.strptime(latest[1:], '%Y%m%d').date(), granularity)
+        else:
+            first = _next_period(datetime.strptime(latest[1:], '%Y%m').date(), granularity)
+        bounds = [b for b in _partition_bounds(first, last, granularity) if b[0] not in existing]
+        if not bounds:
+            logger.info("分区已覆盖到目标时间，无需调整")
+            return []
+        statements.append(
+            f"ALTER TABLE student_records REORGANIZE PARTITION pmax INTO (\n    {_partition_clause(bounds)}\n)")
+    else:
+        rows = db_interface.execute_query(
+            "SELECT MIN(timestamp) AS first_ts, SUM(timestamp IS NULL) AS null_count FROM student_records")
+        if rows and rows[0]['null_count']:
+            raise RuntimeError(f"student_records 中有 {rows[0]['null_count']} 条记录的 timestamp 为空，无法按时间分区")
+        first_ts = rows[0]['first_ts'] if rows else None
+        first = first_ts.date() if first_ts else today
+
+        foreign_keys = db_interface.execute_query(
+            "SELECT CONSTRAINT_NAME FROM information_schema.TABLE_CONSTRAINTS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'student_records' AND CONSTRAINT_TYPE = 'FOREIGN KEY'")
+        if foreign_keys and not drop_foreign_key:
+            raise RuntimeError("分区表不支持外键，需要删除 "
+                               f"{[fk['CONSTRAINT_NAME'] for fk in foreign_keys]}，请传入 drop_foreign_key=True")
+        for fk in foreign_keys:
+            statements.append(f"ALTER TABLE student_records DROP FOREIGN KEY {fk['CONSTRAINT_NAME']}")
+
+        statements.append("ALTER TABLE student_records MODIFY timestamp datetime NOT NULL, "
+                          "DROP PRIMARY KEY, ADD PRIMARY KEY (id, timestamp)")
+        statements.append(
+            f"ALTER TABLE student_records PARTITION BY RANGE (TO_DAYS(timestamp)) (\n"
+            f"    {_partition_clause(_partition_bounds(first, last, granularity))}\n)")
+
+    for statement in statements:
+        logger.info(f"{'[dry run] ' if dry_run else ''}{statement}")
+        if not dry_run:
+            db_interface.execute_update(statement)
+    return statements
+
+
+def main():
+    parser = argparse.ArgumentParser(description='维护轨迹相关表的索引和 student_records 分区')
+    parser.add_argument('command', choices=['status', 'indexes', 'partition'])
+    parser.add_argument('--type', default='mysql', choices=['mysql', 'sqlite'])
+    parser.add_argument('--sqlite-path', default='')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=3306)
+    parser.add_argument('--user', default='root')
+    parser.add_argument('--password', default='123456')
+    parser.add_argument('--database', default='trajectory')
+    parser.add_argument('--granularity', default='month', choices=GRANULARITIES)
+    parser.add_argument('--ahead', type=int, default=3, help='预先创建的未来分区数')
+    parser.add_argument('--drop-foreign-key', action='store_true')
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    db_interface = DatabaseInterface({
+        'type': args.type,
+        'sqlite_path': args.sqlite_path,
+        'host': args.host,
+        'port': args.port,
+        'user': args.user,
+        'password': args.password,
+        'database': args.database,
+    })
+    try:
+        if args.command == 'status':
+            for table in sorted({table for table, _, _ in INDEXES}):
+                for name, columns in get_indexes(db_interface, table).items():
+                    print(f"{table}.{name}: ({', '.join(columns)})")
+            for name, description, rows in get_partitions(db_interface):
+                print(f"student_records partition {name}: < {description}, ~{rows} rows")
+        elif args.command == 'indexes':
+            ensure_indexes(db_interface, args.dry_run)
+        else:
+            partition_student_records(db_interface, args.granularity, args.ahead,
+                                      args.drop_foreign_key, args.dry_run)
+    finally:
+        db_interface.disconnect()
+
+
+if __name__ == '__main__':
+    main()
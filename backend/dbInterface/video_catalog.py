@@ -0,0 +1,414 @@
+"""
+录像元数据与关键帧索引目录
+
+每段录像只探测一次（首次访问时或通过命令行批量扫描），把 FPS、帧数、时长、分辨率、编码、开始时间
+以及关键帧 (帧号, 字节偏移) 索引保存到 video_catalog 表，之后抽帧、跟踪和接口直接从内存/数据库读取。
+
+用法:
+    python -m backend.dbInterface.video_catalog scan --type sqlite --sqlite-path trajectory.db
+    python -m backend.dbInterface.video_catalog probe path/to/camera_1_2024-01-01_08-00-00.mp4
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import subprocess
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from backend.dbInterface.video_index import _to_date, _to_seconds
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# ffprobe 可执行文件，不存在时不建立关键帧索引（帧数使用 OpenCV 的估计值）
+FFPROBE_BIN = shutil.which('ffprobe') or 'ffprobe'
+FFPROBE_TIMEOUT = 120
+
+CATALOG_COLUMNS = ('video_path', 'fps', 'frame_count', 'duration', 'width', 'height', 'codec', 'start_time',
+                   'keyframes', 'file_size', 'file_mtime', 'updated_at')
+
+
+def parse_filename_start(video_path: str) -> Optional[datetime]:
+    """从文件名解析录像开始时间（格式 camera_X_YYYY-MM-DD_HH-MM-SS.mp4），失败时返回 None"""
+    try:
+        parts = os.path.basename(video_path).split('_')
+        return datetime.strptime(f"{parts[-2]}_{parts[-1].split('.')[0]}", "%Y-%m-%d_%H-%M-%S")
+    except (IndexError, ValueError):
+        return None
+
+
+class VideoMetadata:
+    """一段录像的元数据和关键帧索引"""
+
+    __slots__ = ('video_path', 'fps', 'frame_count', 'duration', 'width', 'height', 'codec', 'start_time',
+                 'keyframe_frames', 'keyframe_offsets', 'file_size', 'file_mtime')
+
+    def __init__(self, video_path: str, fps: float, frame_count: int, width: int = 0, height: int = 0,
+                 codec: str = '', start_time: Optional[datetime] = None, keyframes: Optional[np.ndarray] = None,
+                 file_size: Optional[int] = None, file_mtime: Optional[float] = None):
+        """
+        Args:
+            video_path: camera_videos 中的录像路径（本地路径或 URL）
+            fps: 帧率
+            frame_count: 帧数
+            width: 宽度
+            height: 高度
+            codec: 编码（FourCC 或 ffprobe 的 codec_name）
+            start_time: 录像开始时间
+            keyframes: (k, 2) int64 数组，每行为 (关键帧帧号, 字节偏移)，按帧号升序
+            file_size: 探测时的本地文件大小，用于判断文件是否变化
+            file_mtime: 探测时的本地文件修改时间
+        """
+        self.video_path = video_path
+        self.fps = float(fps) if fps else 0.0
+        self.frame_count = int(frame_count or 0)
+        self.duration = self.frame_count / self.fps if self.fps > 0 else 0.0
+        self.width = int(width or 0)
+        self.height = int(height or 0)
+        self.codec = codec or ''
+        self.start_time = start_time
+        keyframes = np.zeros((0, 2), dtype=np.int64) if keyframes is None else np.asarray(keyframes, dtype=np.int64)
+        self.keyframe_frames = np.ascontiguousarray(keyframes[:, 0])
+        self.keyframe_offsets = np.ascontiguousarray(keyframes[:, 1])
+        self.file_size = file_size
+        self.file_mtime = file_mtime
+
+    def frame_at(self, timestamp) -> Optional[int]:
+        """
+        时间点对应的帧号
+
+        Returns:
+            帧号；开始时间未知或时间点不在录像范围内时返回 None
+        """
+        if self.start_time is None or self.fps <= 0:
+            return None
+        if isinstance(timestamp, str):
+            timestamp = datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S")
+        offset = (timestamp - self.start_time).total_seconds()
+        if not 0 <= offset <= self.duration:
+            return None
+        return min(int(offset * self.fps), max(self.frame_count - 1, 0))
+
+    def keyframe_before(self, frame_index: int) -> int:
+        """不晚于 frame_index 的最后一个关键帧的帧号，没有关键帧索引时返回 -1"""
+        pos = int(np.searchsorted(self.keyframe_frames, frame_index, side='right')) - 1
+        return int(self.keyframe_frames[pos]) if pos >= 0 else -1
+
+    def keyframe_time(self, position: int) -> Optional[datetime]:
+        """第 position 个关键帧的时间"""
+        if self.start_time is None or self.fps <= 0:
+            return None
+        return self.start_time + timedelta(seconds=float(self.keyframe_frames[position]) / self.fps)
+
+    def matches_file(self, local_path: str) -> bool:
+        """本地文件的大小和修改时间是否与探测时一致"""
+        if self.file_size is None:
+            return True
+        try:
+            stat = os.stat(local_path)
+        except OSError:
+            return True
+        return stat.st_size == self.file_size and abs(stat.st_mtime - (self.file_mtime or 0)) < 1e-3
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'video_path': self.video_path,
+            'fps': self.fps,
+            'frame_count': self.frame_count,
+            'duration': self.duration,
+            'width': self.width,
+            'height': self.height,
+            'codec': self.codec,
+            'start_time': self.start_time.strftime("%Y-%m-%d %H:%M:%S") if self.start_time else None,
+            'keyframes': int(len(self.keyframe_frames)),
+        }
+
+
+def _probe_packets(local_path: str, fps: float):
+    """
+    用 ffprobe 读取视频流的包（不解码），得到精确帧数和关键帧索引
+
+    Returns:
+        (帧数, (k, 2) 关键帧数组, codec_name)；ffprobe 不可用或失败时返回 None
+    """
+    cmd = [FFPROBE_BIN, '-v', 'error', '-select_streams', 'v:0',
+           '-show_entries', 'stream=codec_name:packet=pts_time,dts_time,pos,flags', '-of', 'json', local_path]
+    try:
+        output = subprocess.run(cmd, capture_output=True, timeout=FFPROBE_TIMEOUT, check=True).stdout
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning(f"ffprobe 探测失败，不建立关键帧索引: {e}")
+        return None
+
+    info = json.loads(output or b'{}')
+    packets = info.get('packets', [])
+    if not packets:
+        return None
+    codec = (info.get('streams') or [{}])[0].get('codec_name', '')
+
+    times = np.array([float(p.get('pts_time', p.get('dts_time', 'nan')) or 'nan') for p in packets])
+    offsets = np.array([int(p.get('pos', -1) or -1) for p in packets], dtype=np.int64)
+    is_key = np.array(['K' in p.get('flags', '') for p in packets])
+    finite = np.isfinite(times)
+    first = times[finite].min() if finite.any() else 0.0
+    # 关键帧的帧号按显示时间计算（包按解码顺序排列，B 帧会使显示顺序与包顺序不同）
+    frames = np.where(finite, np.rint((times - first) * fps), np.arange(len(packets))).astype(np.int64)
+    keyframes = np.stack([frames[is_key], offsets[is_key]], axis=1)
+    keyframes = keyframes[np.argsort(keyframes[:, 0], kind='stable')]
+    return len(packets), keyframes, codec
+
+
+def probe_video(local_path: str, video_path: Optional[str] = None,
+                start_time: Optional[datetime] = None) -> Optional[VideoMetadata]:
+    """
+    探测本地录像文件的元数据
+
+    Args:
+        local_path: 本地文件路径
+        video_path: 目录中使用的路径（URL 录像为原始 URL），默认与 local_path 相同
+        start_time: 已知的开始时间，为 None 时从文件名解析
+
+    Returns:
+        VideoMetadata；文件无法打开时返回 None
+    """
+    import cv2
+
+    cap = cv2.VideoCapture(local_path)
+    try:
+        if not cap.isOpened():
+            logger.error(f"无法打开视频文件: {local_path}")
+            return None
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
+    finally:
+        cap.release()
+    codec = ''.join(chr((fourcc >> (8 * i)) & 0xFF) for i in range(4)).strip('\x00 ') if fourcc else ''
+
+    keyframes = None
+    packets = _probe_packets(local_path, fps) if fps > 0 else None
+    if packets is not None:
+        frame_count, keyframes, codec = packets[0], packets[1], packets[2] or codec
+
+    stat = os.stat(local_path)
+    metadata = VideoMetadata(video_path or local_path, fps, frame_count, width, height, codec,
+                             start_time or parse_filename_start(video_path or local_path), keyframes,
+                             stat.st_size, stat.st_mtime)
+    logger.info(f"录像元数据: {metadata.to_dict()}")
+    return metadata
+
+
+class VideoCatalog:
+    """video_catalog 表的读写和进程内缓存
+
+    get() 依次查找内存缓存、数据库，都没有（或本地文件已变化）时探测本地文件并写回数据库。
+    开始时间优先使用 camera_videos 中的日期和开始时间，没有对应记录时才从文件名解析。
+    """
+
+    def __init__(self, db_interface):
+        self.db = db_interface
+        self._cache: Dict[str, VideoMetadata] = {}
+        self._lock = threading.Lock()
+        self._table_ready = False
+
+    def _query(self, query: str) -> str:
+        if self.db.db_config['type'].lower() == 'sqlite':
+            return query.replace("%s", "?")
+        return query
+
+    def ensure_table(self):
+        """创建 video_catalog 表（已存在时跳过）"""
+        if self._table_ready:
+            return
+        blob = 'BLOB' if self.db.db_config['type'].lower() == 'sqlite' else 'MEDIUMBLOB'
+        self.db.execute_update(f"""
+            CREATE TABLE IF NOT EXISTS video_catalog (
+                video_path  VARCHAR(255) NOT NULL PRIMARY KEY,
+                fps         DOUBLE       NULL,
+                frame_count INT          NULL,
+                duration    DOUBLE       NULL,
+                width       INT          NULL,
+                height      INT          NULL,
+                codec       VARCHAR(16)  NULL,
+                start_time  DATETIME     NULL,
+                keyframes   {blob}       NULL,
+                file_size   BIGINT       NULL,
+                file_mtime  DOUBLE       NULL,
+                updated_at  DATETIME     NULL
+            )
+        """)
+        self._table_ready = True
+
+    def _from_row(self, row: Dict[str, Any]) -> VideoMetadata:
+        keyframes = row.get('keyframes')
+        keyframes = np.frombuffer(bytes(keyframes), dtype='<i8').reshape(-1, 2) if keyframes else None
+        start_time = row.get('start_time')
+        if isinstance(start_time, str):
+            start_time = datetime.strptime(start_time[:19], "%Y-%m-%d %H:%M:%S")
+        return VideoMetadata(row['video_path'], row['fps'], row['frame_count'], row['width'], row['height'],
+                             row['codec'], start_time, keyframes, row['file_size'], row['file_mtime'])
+
+    def _load(self, video_path: str) -> Optional[VideoMetadata]:
+        self.ensure_table()
+        rows = self.db.execute_query(
+            self._query(f"SELECT {', '.join(CATALOG_COLUMNS)} FROM video_catalog WHERE video_path = %s"),
+            (video_path,))
+        return self._from_row(rows[0]) if rows else None
+
+    def save(self, metadata: VideoMetadata):
+        """写入（覆盖）一条目录记录"""
+        self.ensure_table()
+        keyframes = np.stack([metadata.keyframe_frames, metadata.keyframe_offsets], axis=1).astype('<i8')
+        self.db.execute_update(
+            self._query(f"REPLACE INTO video_catalog ({', '.join(CATALOG_COLUMNS)}) "
+                        f"VALUES ({', '.join(['%s'] * len(CATALOG_COLUMNS))})"),
+            (metadata.video_path, metadata.fps, metadata.frame_count, metadata.duration, metadata.width,
+             metadata.height, metadata.codec,
+             metadata.start_time.strftime("%Y-%m-%d %H:%M:%S") if metadata.start_time else None,
+             keyframes.tobytes() if len(keyframes) else None, metadata.file_size, metadata.file_mtime,
+             datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        with self._lock:
+            self._cache[metadata.video_path] = metadata
+
+    def _start_time(self, video_path: str) -> Optional[datetime]:
+        """camera_videos 中记录的录像开始时间"""
+        rows = self.db.execute_query(
+            self._query("SELECT date, start_time FROM camera_videos WHERE video_path = %s LIMIT 1"), (video_path,))
+        if not rows or rows[0]['date'] is None or rows[0]['start_time'] is None:
+            return None
+        try:
+            return datetime.combine(_to_date(rows[0]['date']), datetime.min.time()) + \
+                timedelta(seconds=_to_seconds(rows[0]['start_time']))
+        except ValueError:
+            return None
+
+    def get(self, video_path: str, local_path: Optional[str] = None, probe: bool = True) -> Optional[VideoMetadata]:
+        """
+        获取录像元数据
+
+        Args:
+            video_path: camera_videos 中的录像路径（本地路径或 URL）
+            local_path: 本地文件路径（URL 录像下载后的路径），默认与 video_path 相同
+            probe: 目录中没有记录时是否探测本地文件
+
+        Returns:
+            VideoMetadata；没有记录且无法探测时返回 None
+        """
+        local_path = local_path or video_path
+        with self._lock:
+            metadata = self._cache.get(video_path)
+        if metadata is not None and metadata.matches_file(local_path):
+            return metadata
+
+        try:
+            metadata = self._load(video_path)
+        except Exception as e:
+            logger.error(f"读取录像目录失败: {e}")
+            metadata = None
+        if metadata is not None and metadata.matches_file(local_path):
+            with self._lock:
+                self._cache[video_path] = metadata
+            return metadata
+
+        if not probe or not os.path.exists(local_path):
+            return None
+        try:
+            start_time = self._start_time(video_path)
+        except Exception as e:
+            logger.warning(f"查询录像开始时间失败: {e}")
+            start_time = None
+        metadata = probe_video(local_path, video_path, start_time)
+        if metadata is None:
+            return None
+        try:
+            self.save(metadata)
+        except Exception as e:
+            logger.error(f"保存录像目录失败: {e}")
+            with self._lock:
+                self._cache[video_path] = metadata
+        return metadata
+
+    def invalidate(self, video_path: str):
+        """删除一条目录记录（录像被删除或替换时）"""
+        with self._lock:
+            self._cache.pop(video_path, None)
+        try:
+            self.ensure_table()
+            self.db.execute_update(self._query("DELETE FROM video_catalog WHERE video_path = %s"), (video_path,))
+        except Exception as e:
+            logger.error(f"删除录像目录记录失败: {e}")
+
+    def scan(self, force: bool = False) -> int:
+        """
+        为 camera_videos 中所有本地可访问的录像建立目录记录
+
+        Args:
+            force: 重新探测已有记录的录像
+
+        Returns:
+            新探测的录像数
+        """
+        self.ensure_table()
+        known = set() if force else {row['video_path'] for row in
+                                     self.db.execute_query("SELECT video_path FROM video_catalog")}
+        probed = 0
+        for row in self.db.execute_query("SELECT DISTINCT video_path FROM camera_videos"):
+            video_path = row['video_path']
+            if not video_path or video_path in known or not os.path.exists(video_path):
+                continue
+            if force:
+                with self._lock:
+                    self._cache.pop(video_path, None)
+                self.db.execute_update(self._query("DELETE FROM video_catalog WHERE video_path = %s"), (video_path,))
+            if self.get(video_path) is not None:
+                probed += 1
+        logger.info(f"录像目录扫描完成，新探测 {probed} 段录像")
+        return probed
+
+
+def main():
+    from backend.dbInterface.db_interface import DatabaseInterface
+
+    parser = argparse.ArgumentParser(description='录像元数据与关键帧索引目录')
+    parser.add_argument('command', choices=['scan', 'probe'])
+    parser.add_argument('path', nargs='?', help='probe 命令的本地视频路径')
+    parser.add_argument('--force', action='store_true', help='scan 时重新探测已有记录')
+    parser.add_argument('--type', default='mysql', choices=['mysql', 'sqlite'])
+    parser.add_argument('--sqlite-path', default='')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=3306)
+    parser.add_argument('--user', default='root')
+    parser.add_argument('--password', default='123456')
+    parser.add_argument('--database', default='trajectory')
+    args = parser.parse_args()
+
+    if args.command == 'probe':
+        if not args.path:
+            parser.error('probe 需要提供视频路径')
+        metadata = probe_video(args.path)
+        print(json.dumps(metadata.to_dict() if metadata else None, ensure_ascii=False, indent=2))
+        return
+
+    db_interface = DatabaseInterface({
+        'type': args.type,
+        'sqlite_path': args.sqlite_path,
+        'host': args.host,
+        'port': args.port,
+        'user': args.user,
+        'password': args.password,
+        'database': args.database,
+    })
+    try:
+        db_interface.video_catalog.scan(args.force)
+    finally:
+        db_interface.disconnect()
+
+
+if __name__ == '__main__':
+    main()
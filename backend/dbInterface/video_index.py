@@ -0,0 +1,245 @@
+import bisect
+import logging
+import threading
+import time
+from datetime import date, datetime, time as datetime_time, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def _to_seconds(value) -> int:
+    """将 TIME 列的值（MySQL 返回 timedelta，SQLite 返回字符串）转换为当天的秒数"""
+    if isinstance(value, timedelta):
+        return int(value.total_seconds())
+    if isinstance(value, datetime_time):
+        return value.hour * 3600 + value.minute * 60 + value.second
+    if isinstance(value, datetime):
+        return value.hour * 3600 + value.minute * 60 + value.second
+    if isinstance(value, str):
+        parts = value.strip().split(':')
+        return int(parts[0]) * 3600 + int(parts[1]) * 60 + int(float(parts[2]) if len(parts) > 2 else 0)
+    raise ValueError(f"无法解析时间: {value!r}")
+
+
+def _to_date(value) -> date:
+    """将 DATE 列的值转换为 date"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if isinstance(value, str):
+        value = value.strip()
+        return datetime.strptime(value[:10], '%Y-%m-%d' if '-' in value else '%Y%m%d').date()
+    raise ValueError(f"无法解析日期: {value!r}")
+
+
+def _seconds_to_time(seconds: int) -> datetime_time:
+    seconds = min(max(int(seconds), 0), 86399)
+    return datetime_time(seconds // 3600, (seconds % 3600) // 60, seconds % 60)
+
+
+class _CameraDay:
+    """某个摄像头某一天的录像区间，按开始时间排序"""
+
+    __slots__ = ('starts', 'ends', 'max_ends', 'ids', 'paths')
+
+    def __init__(self):
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+        self.max_ends: List[int] = []
+        self.ids: List[int] = []
+        self.paths: List[str] = []
+
+    def insert(self, video_id: int, start: int, end: int, path: str):
+        pos = bisect.bisect_right(self.starts, start)
+        self.starts.insert(pos, start)
+        self.ends.insert(pos, end)
+        self.ids.insert(pos, video_id)
+        self.paths.insert(pos, path)
+        self._rebuild_max_ends(pos)
+
+    def remove(self, video_id: int) -> bool:
+        if video_id not in self.ids:
+            return False
+        pos = self.ids.index(video_id)
+        for column in (self.starts, self.ends, self.ids, self.paths):
+            del column[pos]
+        self._rebuild_max_ends(pos)
+        return True
+
+    def _rebuild_max_ends(self, pos: int):
+        # max_ends[i] = max(ends[:i + 1])，用于在区间重叠时提前结束向前的扫描
+        del self.max_ends[pos:]
+        running = self.max_ends[-1] if self.max_ends else -1
+        for end in self.ends[pos:]:
+            running = max(running, end)
+            self.max_ends.append(running)
+
+    def find(self, seconds: np.ndarray) -> np.ndarray:
+        """
+        批量查找覆盖各时间点的录像位置
+
+        Returns:
+            与 seconds 等长的位置数组，未找到为 -1；多个录像覆盖同一时间点时取开始时间最晚的一个
+        """
+        result = np.full(len(seconds), -1, dtype=np.int64)
+        if not self.starts:
+            return result
+        # 开始时间 <= t 的最后一个区间
+        candidates = np.searchsorted(np.asarray(self.starts), seconds, side='right') - 1
+        for k, (t, i) in enumerate(zip(seconds.tolist(), candidates.tolist())):
+            while i >= 0 and self.max_ends[i] >= t:
+                if self.ends[i] >= t:
+                    result[k] = i
+                    break
+                i -= 1
+        return result
+
+
+class VideoIntervalIndex:
+    """camera_videos 的内存区间索引
+
+    按 (camera_id, date) 保存按开始时间排序的录像区间，二分查找一个时间点由哪段录像覆盖，
+    并支持一次查询一批记录。通过 id 水位线增量同步其他进程（如 insert.py）新增的录像，
+    应用内的新增/删除可以直接调用 refresh() / remove() 立即生效。
+    """
+
+    def __init__(self, db_interface, refresh_interval: float = 5.0, full_reload_interval: float = 600.0):
+        """
+        初始化录像区间索引
+
+        Args:
+            db_interface: 数据库接口实例
+            refresh_interval: 查询前增量同步新录像的最小间隔（秒）
+            full_reload_interval: 全量重新加载的间隔（秒），用于同步其他进程的修改和删除
+        """
+        self.db = db_interface
+        self.refresh_interval = refresh_interval
+        self.full_reload_interval = full_reload_interval
+        self._days: Dict[Tuple[int, date], _CameraDay] = {}
+        self._locations: Dict[int, Tuple[int, date]] = {}
+        self._last_id = 0
+        self._loaded_at = 0.0
+        self._refreshed_at = 0.0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._locations)
+
+    def _add_row(self, row: Dict[str, Any]):
+        video_id = int(row['id'])
+        if video_id in self._locations:
+            self._remove_locked(video_id)
+        try:
+            key = (int(row['camera_id']), _to_date(row['date']))
+            start = _to_seconds(row['start_time'])
+            end = _to_seconds(row['end_time'])
+        except (TypeError, ValueError) as e:
+            logger.warning(f"跳过无法解析的录像记录 {video_id}: {e}")
+            return
+        self._days.setdefault(key, _CameraDay()).insert(video_id, start, end, row['video_path'] or '')
+        self._locations[video_id] = key
+        self._last_id = max(self._last_id, video_id)
+
+    def _remove_locked(self, video_id: int) -> bool:
+        key = self._locations.pop(video_id, None)
+        if key is None:
+            return False
+        day = self._days[key]
+        day.remove(video_id)
+        if not day.ids:
+            del self._days[key]
+        return True
+
+    def _load(self, min_id: int = 0) -> int:
+        query = ("SELECT id, camera_id, date, start_time, end_time, video_path FROM camera_videos "
+                 "WHERE id > %s ORDER BY id")
+        if self.db.db_config['type'].lower() == 'sqlite':
+            query = query.replace("%s", "?")
+        rows = self.db.execute_query(query, (min_id,))
+        for row in rows:
+            self._add_row(row)
+        return len(rows)
+
+    def reload(self):
+        """全量重新加载索引"""
+        with self._lock:
+            self._days = {}
+            self._locations = {}
+            self._last_id = 0
+            count = self._load()
+            self._loaded_at = self._refreshed_at = time.monotonic()
+        logger.info(f"录像区间索引已加载: {count} 段录像，{len(self._days)} 个摄像头日期")
+
+    def refresh(self, force: bool = False):
+        """
+        增量同步 id 大于水位线的新录像；超过全量加载间隔时重新加载
+
+        Args:
+            force: 忽略 refresh_interval 立即同步
+        """
+        now = time.monotonic()
+        with self._lock:
+            if not self._loaded_at or now - self._loaded_at >= self.full_reload_interval:
+                self.reload()
+                return
+            if not force and now - self._refreshed_at < self.refresh_interval:
+                return
+            count = self._load(self._last_id)
+            self._refreshed_at = now
+        if count:
+            logger.info(f"录像区间索引增量同步了 {count} 段新录像")
+
+    def remove(self, video_id: int) -> bool:
+        """从索引中移除一段录像（对应 camera_videos 中的删除）"""
+        with self._lock:
+            return self._remove_locked(int(video_id))
+
+    def lookup_batch(self, queries: Sequence[Tuple[int, datetime]]) -> List[Optional[Dict[str, Any]]]:
+        """
+        批量查找覆盖各 (camera_id, timestamp) 的录像
+
+        Args:
+            queries: (camera_id, timestamp) 列表，timestamp 可以是 datetime 或 '%Y-%m-%d %H:%M:%S' 字符串
+
+        Returns:
+            与 queries 等长的列表，每项为 {'id', 'video_path', 'date', 'start_time', 'end_time'}，
+            start_time/end_time 为 datetime.time；未找到时为 None
+        """
+        self.refresh()
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(queries)
+        groups: Dict[Tuple[int, date], Tuple[List[int], List[int]]] = {}
+        for i, (camera_id, timestamp) in enumerate(queries):
+            if camera_id is None or timestamp is None:
+                continue
+            if isinstance(timestamp, str):
+                timestamp = datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S")
+            key = (int(camera_id), timestamp.date())
+            positions, seconds = groups.setdefault(key, ([], []))
+            positions.append(i)
+            seconds.append(timestamp.hour * 3600 + timestamp.minute * 60 + timestamp.second)
+
+        with self._lock:
+            for key, (positions, seconds) in groups.items():
+                day = self._days.get(key)
+                if day is None:
+                    continue
+                for i, j in zip(positions, day.find(np.asarray(seconds, dtype=np.int64)).tolist()):
+                    if j >= 0:
+                        results[i] = {
+                            'id': day.ids[j],
+                            'video_path': day.paths[j],
+                            'date': key[1],
+                            'start_time': _seconds_to_time(day.starts[j]),
+                            'end_time': _seconds_to_time(day.ends[j]),
+                        }
+        return results
+
+    def lookup(self, camera_id: int, timestamp: datetime) -> Optional[Dict[str, Any]]:
+        """查找覆盖单个时间点的录像，返回值同 lookup_batch 的元素"""
+        return self.lookup_batch([(camera_id, timestamp)])[0]
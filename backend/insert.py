@@ -11,6 +11,8 @@ import configparser
 from datetime import datetime, timedelta
 from urllib.parse import urlparse
 
+from backend.dbInterface.camera_registry import CameraRegistry
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -89,6 +91,21 @@ DB_CONFIG = {
 }
 
 
+def fetch_cameras():
+    """读取全部摄像头的位置和名称，供摄像头缓存调用"""
+    conn = pymysql.connect(**DB_CONFIG)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT camera_id, location_x, location_y, name FROM cameras")
+            return cursor.fetchall()
+    finally:
+        conn.close()
+
+
+# 摄像头信息缓存，摄像头在后台修改后最多 5 分钟生效
+camera_registry = CameraRegistry(fetch_cameras, ttl=300)
+
+
 def ensure_directory_exists(directory):
     """确保目录存在，如不存在则创建"""
     if not os.path.exists(directory):
@@ -188,9 +205,8 @@ def process_json_to_db(json_file_path):
             # 获取camera_id
             camera_id = int(selected_record['cameraid'].replace('camera', ''))
 
-            # 根据camera_id从cameras表查询location_x和location_y
-            cursor.execute("SELECT location_x, location_y, name FROM cameras WHERE camera_id = %s", (camera_id,))
-            camera_data = cursor.fetchone()
+            # 根据camera_id从摄像头缓存获取location_x和location_y
+            camera_data = camera_registry.get(camera_id)
 
             if not camera_data:
                 logger.warning(f"未找到camera_id为{camera_id}的记录")
@@ -1,6 +1,6 @@
 import pandas as pd
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Tuple, Optional
+from typing import Dict, Iterator, List, Any, Tuple, Optional
 import logging
 from backend.dbInterface.db_interface import DatabaseInterface
 
@@ -20,19 +20,39 @@ class QueryFilter:
         """
         self.db = db_interface
 
+    @staticmethod
+    def _split_features(features: Optional[Dict[str, Any]]) -> Tuple[Optional[Dict[str, bool]], Optional[str]]:
+        """将特征字典（如果提供）转换为数据库接口所需的格式：布尔特征字典和衣服颜色"""
+        db_features = None
+        clothing_color = None
+
+        if features:
+            db_features = {}
+            for key, value in features.items():
+                # 只包含布尔值的键值对添加到布尔特征中
+                if isinstance(value, bool):
+                    db_features[key] = value
+                # 提取衣服颜色单独处理
+                elif key == 'clothing_color' and isinstance(value, str):
+                    clothing_color = value
+
+        return db_features, clothing_color
+
     def filter_by_criteria(self,
                            student_id: Optional[str] = None,
                            features: Optional[Dict[str, Any]] = None,
                            time_range: Optional[Tuple[datetime, datetime]] = None,
-                           camera_ids: Optional[List[int]] = None) -> pd.DataFrame:
+                           camera_ids: Optional[List[int]] = None,
+                           columns: Optional[List[str]] = None) -> pd.DataFrame:
         """
         根据条件过滤学生记录
 
         Args:
-            student_id: 学生学号，可选
+            student_id: 学生学号，可选，只记录在日志中，不作为过滤条件（候选记录需要全部交给重识别）
             features: 特征字典，例如 {'has_backpack': True, 'clothing_color': 'red'}，可选
             time_range: 时间范围元组 (start_time, end_time)，可选
             camera_ids: 摄像头ID列表，可选
+            columns: 需要从数据库读取的列，默认读取全部列
 
         Returns:
             符合条件的学生记录DataFrame
@@ -40,37 +60,69 @@ class QueryFilter:
         logger.info(
             f"Filtering records with: student_id={student_id}, features={features}, time_range={time_range}, camera_ids={camera_ids}")
 
-        # 将特征字典（如果提供）转换为数据库接口所需的格式
-        db_features = None
-        clothing_color = None
-
-        if features:
-            db_features = {}
-            for key, value in features.items():
-                # 只包含布尔值的键值对添加到布尔特征中
-                if isinstance(value, bool):
-                    db_features[key] = value
-                # 提取衣服颜色单独处理
-                elif key == 'clothing_color' and isinstance(value, str):
-                    clothing_color = value
+        db_features, clothing_color = self._split_features(features)
 
         # 查询数据库
         records = self.db.query_student_records(
             features=db_features,
             time_range=time_range,
             camera_ids=camera_ids,
-            clothing_color=clothing_color
+            clothing_color=clothing_color,
+            columns=columns
         )
 
         logger.info(f"Initial filter returned {len(records)} records")
         return records
 
-    def enhance_filter_results(self, records: pd.DataFrame) -> pd.DataFrame:
+    def iter_filtered_records(self,
+                              student_id: Optional[str] = None,
+                              features: Optional[Dict[str, Any]] = None,
+                              time_range: Optional[Tuple[datetime, datetime]] = None,
+                              camera_ids: Optional[List[int]] = None,
+                              columns: Optional[List[str]] = None,
+                              chunk_size: int = 5000) -> Iterator[pd.DataFrame]:
+        """
+        流式过滤学生记录，按时间顺序逐块返回已补充摄像头信息的记录
+
+        摄像头信息只查询一次，每块记录读取后立即合并并转换时间戳，
+        适合长时间范围的查询，内存占用只与 chunk_size 有关。
+
+        与 filter_by_criteria 一样，student_id 只记录在日志中而不作为过滤条件：
+        查询的学号是要重建轨迹的目标，候选记录大多尚未标注学号，需要全部交给重识别比对。
+
+        Args:
+            student_id、features、time_range、camera_ids、columns: 与 filter_by_criteria 相同
+            chunk_size: 每块的记录数
+
+        Yields:
+            按时间排序、已补充摄像头位置信息的记录DataFrame块
+        """
+        logger.info(
+            f"Streaming records with: student_id={student_id}, features={features}, time_range={time_range}, "
+            f"camera_ids={camera_ids}, chunk_size={chunk_size}")
+
+        db_features, clothing_color = self._split_features(features)
+        cameras = self.db.get_camera_locations()
+
+        for chunk in self.db.iter_student_records(
+                features=db_features,
+                time_range=time_range,
+                camera_ids=camera_ids,
+                clothing_color=clothing_color,
+                columns=columns,
+                chunk_size=chunk_size):
+            enhanced = self.enhance_filter_results(chunk, cameras)
+            if 'timestamp' in enhanced.columns:
+                enhanced['timestamp'] = pd.to_datetime(enhanced['timestamp'])
+            yield enhanced
+
+    def enhance_filter_results(self, records: pd.DataFrame, cameras: Optional[pd.DataFrame] = None) -> pd.DataFrame:
         """
         增强过滤结果，添加额外的信息
 
         Args:
             records: 过滤后的记录
+            cameras: 摄像头位置信息，默认从数据库查询
 
         Returns:
             增强的记录数据
@@ -79,7 +131,8 @@ class QueryFilter:
             return records
 
         # 获取摄像头位置信息
-        cameras = self.db.get_camera_locations()
+        if cameras is None:
+            cameras = self.db.get_camera_locations()
 
         # 合并摄像头位置信息到记录中
         if 'camera_id' in records.columns:
@@ -137,7 +190,21 @@ class QueryFilter:
                        camera_ids: Optional[List[int]] = None,
                        has_backpack: Optional[bool] = None,
                        has_umbrella: Optional[bool] = None,
-                       clothing_color: Optional[str] = None) -> Dict[str, Any]:
+                       clothing_color: Optional[str] = None,
+                       columns: Optional[List[str]] = None,
+                       chunk_size: Optional[int] = None) -> Dict[str, Any]:
+        """
+        执行完整的过滤流程：条件过滤、补充摄像头信息、排序和分组
+
+        Args:
+            columns: 需要从数据库读取的列，只选取调用方实际使用的列可以避免传输BLOB数据；
+                默认读取全部列
+            chunk_size: 指定时通过流式游标分块读取，逐块补充摄像头信息并追加到排序结果和摄像头分组中，
+                不再对整个结果集排序和分组
+
+        Returns:
+            包含 all_records、sorted_records、camera_groups 的字典
+        """
         # 整合所有特征条件
         all_features = features or {}
         if has_backpack is not None:
@@ -147,26 +214,56 @@ class QueryFilter:
         if clothing_color is not None:
             all_features['clothing_color'] = clothing_color
 
-        # 初步过滤
-        filtered_records = self.filter_by_criteria(
-            student_id=student_id,
-            features=all_features,
-            time_range=time_range,
-            camera_ids=camera_ids
-        )
+        if chunk_size:
+            # 流式读取：块按 (timestamp, id) 顺序到达，逐块追加到结果和各摄像头分组，不需要再整体排序和分组
+            chunks = []
+            camera_chunks: Dict[int, List[pd.DataFrame]] = {}
+            offset = 0
+            for chunk in self.iter_filtered_records(
+                    student_id=student_id,
+                    features=all_features,
+                    time_range=time_range,
+                    camera_ids=camera_ids,
+                    columns=columns,
+                    chunk_size=chunk_size):
+                if chunk.empty:
+                    continue
+                # 索引在整个结果中连续，分组中的记录与 all_records 的索引一致
+                chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+                offset += len(chunk)
+                chunks.append(chunk)
+                if 'camera_id' in chunk.columns:
+                    for camera_id, group in chunk.groupby('camera_id', sort=False):
+                        camera_chunks.setdefault(camera_id, []).append(group)
+
+            filtered_records = enhanced_records = sorted_records = (
+                pd.concat(chunks) if len(chunks) > 1 else chunks[0] if chunks else pd.DataFrame()
+            )
+            grouped_records = {camera_id: pd.concat(parts) if len(parts) > 1 else parts[0]
+                               for camera_id, parts in sorted(camera_chunks.items())}
+            logger.info(f"Streamed {len(enhanced_records)} records into {len(grouped_records)} camera groups")
+        else:
+            # 初步过滤
+            filtered_records = self.filter_by_criteria(
+                student_id=student_id,
+                features=all_features,
+                time_range=time_range,
+                camera_ids=camera_ids,
+                columns=columns
+            )
 
-        # 增强结果
-        enhanced_records = self.enhance_filter_results(filtered_records)
+            # 增强结果
+            enhanced_records = self.enhance_filter_results(filtered_records)
 
-        # 确保时间戳是日期时间类型
-        if 'timestamp' in enhanced_records.columns:
-            enhanced_records['timestamp'] = pd.to_datetime(enhanced_records['timestamp'])
+            # 确保时间戳是日期时间类型
+            if 'timestamp' in enhanced_records.columns:
+                enhanced_records['timestamp'] = pd.to_datetime(enhanced_records['timestamp'])
 
-        # 按时间排序
-        sorted_records = self.sort_by_time(enhanced_records)
+            # 按时间排序
+            sorted_records = self.sort_by_time(enhanced_records)
 
-        # 按摄像头分组
-        grouped_records = self.group_by_camera(sorted_records)
+            # 按摄像头分组
+            grouped_records = self.group_by_camera(sorted_records)
 
         # 打印调试信息
         logger.debug(f"Filtered records: {filtered_records}")
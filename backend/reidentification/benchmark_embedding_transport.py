@@ -0,0 +1,83 @@
+"""
+比较特征向量以 JSON 列表传输与以 float16 编码字符串传输的开销
+
+模拟 /feature_extraction 返回、前端原样提交给 /feature_matching 的过程：序列化为 JSON、解析 JSON、
+堆叠为归一化矩阵并计算相似度。分别输出两种方式的 JSON 大小、耗时、Python 内存峰值，以及 float16
+带来的相似度误差。
+
+用法:
+    python -m backend.reidentification.benchmark_embedding_transport --records 200 --frames 2000
+"""
+import argparse
+import json
+import logging
+import time
+import tracemalloc
+
+import numpy as np
+
+from backend.reidentification.embedding import encode_vector
+from backend.reidentification.similarity import cosine_scores, normalize_vector, stack_normalized
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def make_payload(features, query, as_list):
+    """构造与 /feature_extraction 返回相同结构的数据"""
+    convert = (lambda v: v.tolist()) if as_list else encode_vector
+    return {
+        'records': [{'id': i, 'feature_vector': convert(v)} for i, v in enumerate(features)],
+        'query_feature': convert(query),
+    }
+
+
+def round_trip(features, query, as_list):
+    """序列化 -> 解析 -> 计算相似度，返回 (JSON 字节数, 相似度)"""
+    body = json.dumps(make_payload(features, query, as_list))
+    data = json.loads(body)
+    query_vector = normalize_vector(data['query_feature'])
+    matrix, valid = stack_normalized([r['feature_vector'] for r in data['records']], len(query_vector))
+    return len(body), cosine_scores(matrix, valid, query_vector)
+
+
+def measure(features, query, as_list, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        size, scores = round_trip(features, query, as_list)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    round_trip(features, query, as_list)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, best, peak, scores
+
+
+def run(count, dim, repeat):
+    rng = np.random.default_rng(0)
+    features = rng.standard_normal((count, dim)).astype(np.float32)
+    query = rng.standard_normal(dim).astype(np.float32)
+    print(f"{count} 个 {dim} 维特征向量")
+    print(f"{'方式':<16} {'JSON 大小':>12} {'耗时':>10} {'内存峰值':>12}")
+    results = {}
+    for name, as_list in (('JSON 列表', True), ('float16 编码', False)):
+        size, seconds, peak, scores = measure(features, query, as_list, repeat)
+        results[name] = scores
+        print(f"{name:<16} {size / 1e6:>10.2f}MB {seconds * 1000:>8.1f}ms {peak / 1e6:>10.1f}MB")
+    error = np.abs(results['JSON 列表'] - results['float16 编码']).max()
+    print(f"float16 编码的最大相似度误差: {error:.2e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='特征向量传输格式基准测试')
+    parser.add_argument('--records', type=int, default=200, help='主记录数')
+    parser.add_argument('--frames', type=int, default=2000, help='帧特征数')
+    parser.add_argument('--dim', type=int, default=2048)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    run(args.records + args.frames, args.dim, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+比较原始 MGN 与仅推理的 MGNEmbedding（去掉分类头、BN 折叠进卷积）
+
+用同一份 model_best.pt 权重分别构建两个模型，对同一批输入检查特征是否一致（最大绝对误差、
+最小余弦相似度），并输出各批大小下的吞吐量。特征不一致时以非零状态退出。
+
+用法:
+    python -m backend.reidentification.benchmark_mgn --batch-sizes 1 8 32 --repeat 5
+    python -m backend.reidentification.benchmark_mgn --images path/to/crops
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+
+from backend.reidentification.reidentification import REID_INPUT_SIZES, REID_MODEL_PATHS, build_mgn
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 特征一致性容差
+PARITY_ATOL = 1e-3
+PARITY_MIN_COSINE = 0.9999
+
+
+def load_inputs(image_dir, count):
+    """读取目录中的行人图像作为输入，未提供目录时使用随机输入"""
+    height, width = REID_INPUT_SIZES['mgn']
+    if not image_dir:
+        return torch.randn(count, 3, height, width)
+
+    from backend.reidentification.reidentification import ReIDProcessor
+    import cv2
+
+    names = sorted(n for n in os.listdir(image_dir) if n.lower().endswith(('.jpg', '.jpeg', '.png')))[:count]
+    images = [cv2.imread(os.path.join(image_dir, n)) for n in names]
+    batch, _ = ReIDProcessor()._preprocess_crops([im for im in images if im is not None], 'mgn')
+    if batch is None:
+        raise SystemExit(f"目录中没有可用的图像: {image_dir}")
+    return batch
+
+
+def forward(model, inputs, batch_size, full):
+    outputs = []
+    with torch.inference_mode():
+        for start in range(0, len(inputs), batch_size):
+            out = model(inputs[start:start + batch_size])
+            outputs.append(out[0] if full else out)
+    return torch.cat(outputs).numpy()
+
+
+def throughput(model, inputs, batch_size, repeat, full):
+    forward(model, inputs[:batch_size], batch_size, full)  # 预热
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        forward(model, inputs, batch_size, full)
+        best = min(best, time.perf_counter() - start)
+    return len(inputs) / best
+
+
+def run(model_path, image_dir, count, batch_sizes, repeat, threads):
+    if threads:
+        torch.set_num_threads(threads)
+    full = build_mgn(model_path, inference_only=False)
+    from backend.resources.models.mgn.mgn import MGNEmbedding
+    embedding = MGNEmbedding.from_mgn(full)
+    inputs = load_inputs(image_dir, count)
+    print(f"输入: {tuple(inputs.shape)}, 线程数: {torch.get_num_threads()}")
+
+    reference = forward(full, inputs, max(batch_sizes), True)
+    result = forward(embedding, inputs, max(batch_sizes), False)
+    max_abs = float(np.abs(reference - result).max())
+    cosine = (reference * result).sum(1) / np.maximum(
+        np.linalg.norm(reference, axis=1) * np.linalg.norm(result, axis=1), 1e-12)
+    min_cosine = float(cosine.min())
+    passed = reference.shape == result.shape and max_abs <= PARITY_ATOL and min_cosine >= PARITY_MIN_COSINE
+    print(f"特征一致性: 维度 {result.shape[1]}, 最大绝对误差 {max_abs:.2e}, 最小余弦相似度 {min_cosine:.6f} "
+          f"-> {'通过' if passed else '不通过'}")
+
+    print(f"{'batch':>6} {'MGN (张/秒)':>14} {'MGNEmbedding (张/秒)':>22} {'加速比':>8}")
+    for batch_size in batch_sizes:
+        base = throughput(full, inputs, batch_size, repeat, True)
+        fast = throughput(embedding, inputs, batch_size, repeat, False)
+        print(f"{batch_size:>6} {base:>14.1f} {fast:>22.1f} {fast / base:>7.2f}x")
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='MGN 仅推理模式的一致性检查与吞吐量基准测试')
+    parser.add_argument('--model-path', default=REID_MODEL_PATHS['mgn'])
+    parser.add_argument('--images', help='行人图像目录，不提供时使用随机输入')
+    parser.add_argument('--count', type=int, default=64, help='输入图像数')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--threads', type=int, default=0, help='torch 线程数，0 表示默认')
+    args = parser.parse_args()
+    if not run(args.model_path, args.images, args.count, args.batch_sizes, args.repeat, args.threads):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
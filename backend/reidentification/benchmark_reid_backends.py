@@ -0,0 +1,131 @@
+"""
+比较重识别模型各推理后端（eager、TorchScript、INT8）的特征一致性和吞吐量
+
+每个算法加载一次 eager 模型作为参考，分别转换为各后端，在同一批输入上检查与参考特征的最小余弦相似度
+（容差见 inference_backends.PARITY_MIN_COSINE），并输出每秒处理的图像数，最后给出每个算法中
+一致性达标且最快的后端，可填入 app.py 的 REID_BACKENDS。
+
+INT8 后端与部署时一样用 REID_CALIBRATION_DIR/<算法>/ 下的图像校准，评估用的 --images 不能是校准图像，
+这样一致性结果描述的就是实际部署的量化模型；没有校准图像时不测试 INT8。
+
+用法:
+    python -m backend.reidentification.benchmark_reid_backends --algorithms mgn agw --threads 8
+    python -m backend.reidentification.benchmark_reid_backends --images path/to/crops --backends eager int8
+"""
+import argparse
+import copy
+import logging
+import os
+import time
+
+import numpy as np
+import torch
+
+from backend.reidentification.inference_backends import BACKENDS, PARITY_MIN_COSINE, configure_threads, prepare_model
+from backend.reidentification.reidentification import (REID_CALIBRATION_DIR, REID_INPUT_SIZES, ReIDProcessor,
+                                                        calibration_image_paths, load_calibration_batches)
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def load_inputs(processor, algorithm, image_dir, count, calibration_dir=None):
+    """读取目录中的行人图像并预处理为模型输入，未提供目录时使用随机输入"""
+    if not image_dir:
+        height, width = REID_INPUT_SIZES[algorithm]
+        return torch.randn(count, 3, height, width)
+
+    import cv2
+
+    # 评估图像不能与校准图像重复
+    calibration_files = {os.path.realpath(path) for path in calibration_image_paths(algorithm, calibration_dir)}
+    paths = [os.path.join(image_dir, n) for n in sorted(os.listdir(image_dir))
+             if n.lower().endswith(('.jpg', '.jpeg', '.png'))]
+    paths = [path for path in paths if os.path.realpath(path) not in calibration_files][:count]
+    images = [cv2.imread(path) for path in paths]
+    batch, _ = processor._preprocess_crops([im for im in images if im is not None], algorithm)
+    if batch is None:
+        raise SystemExit(f"目录中没有可用的图像: {image_dir}")
+    return batch
+
+
+def forward(model, inputs, batch_size):
+    outputs = []
+    with torch.inference_mode():
+        for start in range(0, len(inputs), batch_size):
+            outputs.append(model(inputs[start:start + batch_size]).float())
+    return torch.cat(outputs).numpy()
+
+
+def images_per_second(model, inputs, batch_size, repeat):
+    forward(model, inputs[:batch_size], batch_size)  # 预热
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        forward(model, inputs, batch_size)
+        best = min(best, time.perf_counter() - start)
+    return len(inputs) / best
+
+
+def min_cosine(reference, result):
+    norms = np.linalg.norm(reference, axis=1) * np.linalg.norm(result, axis=1)
+    return float(((reference * result).sum(1) / np.maximum(norms, 1e-12)).min())
+
+
+def run(algorithms, backends, image_dir, count, batch_size, repeat, channels_last, calibration_dir=None):
+    processor = ReIDProcessor()
+    recommended = {}
+    print(f"{'算法':<6} {'后端':<12} {'最小余弦相似度':>14} {'一致性':>6} {'张/秒':>10}")
+    for algorithm in algorithms:
+        base = ReIDProcessor._build_model(algorithm).eval()
+        inputs = load_inputs(processor, algorithm, image_dir, count, calibration_dir)
+        reference = forward(base, inputs, batch_size)
+        calibration = load_calibration_batches(algorithm, calibration_dir) if 'int8' in backends else None
+
+        best = None
+        for backend in backends:
+            if backend == 'int8' and calibration is None:
+                print(f"{algorithm:<6} {backend:<12} {'没有校准图像':>14}")
+                continue
+            try:
+                model = prepare_model(copy.deepcopy(base), backend, REID_INPUT_SIZES[algorithm], channels_last,
+                                      calibration=calibration)
+                cosine = min_cosine(reference, forward(model, inputs, batch_size))
+                speed = images_per_second(model, inputs, batch_size, repeat)
+            except Exception as e:
+                logger.error(f"{algorithm} / {backend} 测试失败: {e}", exc_info=True)
+                print(f"{algorithm:<6} {backend:<12} {'失败':>14}")
+                continue
+            if model.backend != backend:
+                print(f"{algorithm:<6} {backend:<12} {'退回 ' + model.backend:>14}")
+                continue
+            passed = cosine >= PARITY_MIN_COSINE[backend]
+            print(f"{algorithm:<6} {backend:<12} {cosine:>14.6f} {'通过' if passed else '不通过':>6} {speed:>10.1f}")
+            if passed and (best is None or speed > best[1]):
+                best = (backend, speed)
+        recommended[algorithm] = best[0] if best else 'eager'
+
+    print(f"推荐的 REID_BACKENDS: {recommended}")
+    return recommended
+
+
+def main():
+    parser = argparse.ArgumentParser(description='重识别模型推理后端的一致性检查与吞吐量基准测试')
+    parser.add_argument('--algorithms', nargs='+', default=list(REID_INPUT_SIZES), choices=list(REID_INPUT_SIZES))
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument('--images', help='评估用的行人图像目录，不提供时使用随机输入（校准图像会被排除）')
+    parser.add_argument('--calibration-dir', default=REID_CALIBRATION_DIR,
+                        help='INT8 校准图像根目录，图像放在 <目录>/<算法>/ 下，与部署时一致')
+    parser.add_argument('--count', type=int, default=64, help='输入图像数')
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--threads', type=int, default=0, help='intra-op 线程数，0 表示使用全部 CPU 核')
+    parser.add_argument('--no-channels-last', action='store_true', help='不使用 channels_last 内存格式')
+    args = parser.parse_args()
+    configure_threads(args.threads, 1)
+    run(args.algorithms, args.backends, args.images, args.count, args.batch_size, args.repeat,
+        not args.no_channels_last, args.calibration_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+import base64
+import logging
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 计算使用 float32，存储和传输使用 float16（2048 维特征 4KB，base64 后约 5.5KB；JSON 列表约 40KB）
+EMBEDDING_DTYPE = np.float32
+TRANSPORT_DTYPE = np.float16
+# 编码后字符串的前缀，标明元素类型
+_PREFIXES = {'f16': np.float16, 'f32': np.float32}
+_DTYPE_PREFIXES = {np.dtype(dtype): prefix for prefix, dtype in _PREFIXES.items()}
+
+
+def encode_vector(vector, dtype=TRANSPORT_DTYPE) -> str:
+    """
+    将特征向量编码为可放入 JSON 的字符串，格式为 '<f16|f32>:<小端字节的 base64>'
+
+    Args:
+        vector: 特征向量（np.ndarray 或 list）
+        dtype: 传输使用的元素类型，np.float16 或 np.float32
+    """
+    dtype = np.dtype(dtype)
+    prefix = _DTYPE_PREFIXES.get(dtype)
+    if prefix is None:
+        raise ValueError(f"不支持的特征编码类型: {dtype}")
+    data = np.ascontiguousarray(vector, dtype=dtype.newbyteorder('<')).ravel()
+    return f"{prefix}:{base64.b64encode(data.tobytes()).decode('ascii')}"
+
+
+def decode_vector(value) -> Optional[np.ndarray]:
+    """
+    将 encode_vector 的编码字符串、list 或 np.ndarray 转换为一维 float32 数组
+
+    Returns:
+        float32 数组；value 为 None 或无法解析时返回 None
+    """
+    if value is None:
+        return None
+    if isinstance(value, np.ndarray) and value.dtype == EMBEDDING_DTYPE:
+        return value.ravel()
+    if isinstance(value, str):
+        prefix, _, payload = value.partition(':')
+        dtype = _PREFIXES.get(prefix)
+        if dtype is None:
+            logger.warning(f"无法识别的特征编码: {value[:16]}")
+            return None
+        try:
+            raw = base64.b64decode(payload, validate=True)
+            return np.frombuffer(raw, dtype=np.dtype(dtype).newbyteorder('<')).astype(EMBEDDING_DTYPE)
+        except ValueError as e:
+            logger.warning(f"特征编码解析失败: {e}")
+            return None
+    try:
+        return np.asarray(value, dtype=EMBEDDING_DTYPE).ravel()
+    except (TypeError, ValueError):
+        return None
+
+
+class EmbeddingMatrix:
+    """同一维度的一组特征向量
+
+    计算时始终是连续的 (n, dim) float32 矩阵，valid 标记每一行是否有效（缺失、无法解析或维度不符的
+    向量对应行为 0）。to_storage() / encode() 转换为 float16 用于存储和传输。
+    """
+
+    __slots__ = ('vectors', 'valid')
+
+    def __init__(self, vectors: np.ndarray, valid: Optional[np.ndarray] = None):
+        vectors = np.ascontiguousarray(vectors, dtype=EMBEDDING_DTYPE)
+        if vectors.ndim != 2:
+            raise ValueError(f"特征矩阵必须是二维的，实际为 {vectors.ndim} 维")
+        self.vectors = vectors
+        self.valid = np.ones(len(vectors), dtype=bool) if valid is None else np.asarray(valid, dtype=bool)
+
+    @classmethod
+    def from_values(cls, values: Sequence, dim: Optional[int] = None) -> 'EmbeddingMatrix':
+        """
+        由特征向量序列构造
+
+        Args:
+            values: 每个元素可以是 np.ndarray、list、encode_vector 的编码字符串或 None；也可以是二维数组
+            dim: 期望的维度，为 None 时取第一个有效向量的维度
+        """
+        if isinstance(values, np.ndarray) and values.ndim == 2 and (dim is None or values.shape[1] == dim):
+            return cls(np.array(values, dtype=EMBEDDING_DTYPE))
+
+        n = len(values)
+        if any(isinstance(v, str) for v in values):
+            values = [decode_vector(v) for v in values]
+        # list 直接取长度，避免 np.size 把每个 list 先转换为数组
+        sizes = [0 if v is None else len(v) if isinstance(v, (list, tuple)) else int(np.size(v)) for v in values]
+        if dim is None:
+            dim = next((size for size in sizes if size > 0), 0)
+        if dim and all(size == dim for size in sizes):
+            # 所有向量维度一致时一次转换
+            return cls(np.array(values, dtype=EMBEDDING_DTYPE).reshape(n, dim))
+
+        matrix = np.zeros((n, dim), dtype=EMBEDDING_DTYPE)
+        valid = np.zeros(n, dtype=bool)
+        for i, vector in enumerate(values):
+            if dim and sizes[i] == dim:
+                matrix[i] = np.asarray(vector, dtype=EMBEDDING_DTYPE).ravel()
+                valid[i] = True
+        return cls(matrix, valid)
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    @property
+    def dim(self) -> int:
+        return self.vectors.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return self.vectors.nbytes
+
+    def row(self, i: int) -> Optional[np.ndarray]:
+        """第 i 个向量（float32 视图），无效时返回 None"""
+        return self.vectors[i] if self.valid[i] else None
+
+    def to_storage(self, dtype=TRANSPORT_DTYPE) -> np.ndarray:
+        """转换为存储用的 (n, dim) 矩阵"""
+        return self.vectors.astype(dtype)
+
+    def encode(self, dtype=TRANSPORT_DTYPE) -> List[Optional[str]]:
+        """每一行编码为 encode_vector 格式的字符串，无效行为 None"""
+        return [encode_vector(vector, dtype) if ok else None
+                for vector, ok in zip(self.vectors, self.valid.tolist())]
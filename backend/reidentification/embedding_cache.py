@@ -0,0 +1,353 @@
+"""
+视频裁剪图特征的内容寻址缓存
+
+每个特征以 (视频内容哈希, 帧号, 边界框, 算法, 模型版本) 为键，float16 存放在按维度划分的
+内存映射文件中，键到槽位的映射和最近访问时间保存在 SQLite 索引里，总大小超过上限时按 LRU 淘汰。
+另外记录每个帧窗口检测出的裁剪图列表，窗口命中时可以跳过视频解码、行人检测和特征提取。
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(__file__), '../resources/cache/embeddings')
+DEFAULT_MAX_BYTES = 1 << 30
+# 视频内容哈希只读取文件头尾各 4MB（连同文件大小），避免每次请求完整读取大视频
+HASH_SAMPLE_BYTES = 4 << 20
+# 内存映射文件每次扩容的最少槽位数
+_MIN_GROW_SLOTS = 1024
+# 每次淘汰的最少条数，避免频繁小批量删除
+_EVICT_BATCH = 256
+
+_fingerprints: Dict[Tuple[str, int, int], str] = {}
+_fingerprints_lock = threading.Lock()
+
+
+def file_fingerprint(path: str) -> str:
+    """
+    视频文件的内容哈希
+
+    对文件大小和头尾各 HASH_SAMPLE_BYTES 字节做 SHA-1，同一文件 (路径, 大小, 修改时间) 不变时复用结果。
+    """
+    stat = os.stat(path)
+    cache_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _fingerprints_lock:
+        digest = _fingerprints.get(cache_key)
+    if digest is not None:
+        return digest
+
+    sha = hashlib.sha1(str(stat.st_size).encode())
+    with open(path, 'rb') as f:
+        sha.update(f.read(HASH_SAMPLE_BYTES))
+        if stat.st_size > 2 * HASH_SAMPLE_BYTES:
+            f.seek(-HASH_SAMPLE_BYTES, os.SEEK_END)
+        sha.update(f.read(HASH_SAMPLE_BYTES))
+    digest = sha.hexdigest()
+    with _fingerprints_lock:
+        _fingerprints[cache_key] = digest
+    return digest
+
+
+def weights_version(path: str) -> str:
+    """模型权重文件的版本标识（文件名、大小和修改时间），文件不存在时为 'none'"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return 'none'
+    return f"{os.path.basename(path)}:{stat.st_size}:{int(stat.st_mtime)}"
+
+
+def embedding_key(video_hash: str, frame_index: int, bbox: Sequence[int], algorithm: str, model_version: str) -> str:
+    x1, y1, x2, y2 = (int(v) for v in bbox)
+    return hashlib.sha1(
+        f"{video_hash}|{int(frame_index)}|{x1},{y1},{x2},{y2}|{algorithm}|{model_version}".encode()).hexdigest()
+
+
+def window_key(video_hash: str, start_frame: int, end_frame: int, step: int, algorithm: str, model_version: str) -> str:
+    return hashlib.sha1(
+        f"{video_hash}|{int(start_frame)}:{int(end_frame)}:{int(step)}|{algorithm}|{model_version}".encode()).hexdigest()
+
+
+class EmbeddingCache:
+    """磁盘上的特征缓存，多线程共享一个实例"""
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        Args:
+            cache_dir: 缓存目录（SQLite 索引和 embeddings_<dim>.f16 文件）
+            max_bytes: 特征数据的总大小上限（字节）
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._memmaps: Dict[int, np.memmap] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            conn = sqlite3.connect(os.path.join(self.cache_dir, 'index.sqlite'), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    dim INTEGER NOT NULL,
+                    slot INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access);
+                CREATE TABLE IF NOT EXISTS free_slots (
+                    dim INTEGER NOT NULL,
+                    slot INTEGER NOT NULL,
+                    PRIMARY KEY (dim, slot)
+                );
+                CREATE TABLE IF NOT EXISTS slot_files (
+                    dim INTEGER PRIMARY KEY,
+                    used INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS windows (
+                    key TEXT PRIMARY KEY,
+                    crops TEXT NOT NULL,
+                    last_access REAL NOT NULL
+                );
+            """)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _memmap(self, dim: int, min_slots: int = 0) -> np.memmap:
+        """打开（必要时扩容）某个维度的内存映射文件"""
+        mm = self._memmaps.get(dim)
+        if mm is not None and len(mm) >= min_slots:
+            return mm
+        path = os.path.join(self.cache_dir, f"embeddings_{dim}.f16")
+        row_bytes = dim * 2
+        current = os.path.getsize(path) // row_bytes if os.path.exists(path) else 0
+        if current < min_slots or current == 0:
+            capacity = max(min_slots, current * 2, _MIN_GROW_SLOTS)
+            if mm is not None:
+                mm.flush()
+                del self._memmaps[dim]
+            with open(path, 'ab') as f:
+                f.truncate(capacity * row_bytes)
+            current = capacity
+        mm = np.memmap(path, dtype=np.float16, mode='r+', shape=(current, dim))
+        self._memmaps[dim] = mm
+        return mm
+
+    def _allocate(self, conn: sqlite3.Connection, dim: int, count: int) -> List[int]:
+        """分配 count 个槽位，优先复用被淘汰的槽位"""
+        slots = [row[0] for row in conn.execute(
+            "SELECT slot FROM free_slots WHERE dim = ? LIMIT ?", (dim, count))]
+        if slots:
+            conn.executemany("DELETE FROM free_slots WHERE dim = ? AND slot = ?", [(dim, s) for s in slots])
+        missing = count - len(slots)
+        if missing:
+            row = conn.execute("SELECT used FROM slot_files WHERE dim = ?", (dim,)).fetchone()
+            used = row[0] if row else 0
+            slots.extend(range(used, used + missing))
+            conn.execute("INSERT OR REPLACE INTO slot_files (dim, used) VALUES (?, ?)", (dim, used + missing))
+        return slots
+
+    def _evict(self, conn: sqlite3.Connection):
+        """总大小超过上限时按最近访问时间淘汰，比淘汰的特征更久未访问的窗口记录一并删除"""
+        total = conn.execute("SELECT COALESCE(SUM(dim), 0) * 2 FROM embeddings").fetchone()[0]
+        evicted = 0
+        cutoff = None
+        while total > self.max_bytes:
+            rows = conn.execute("SELECT key, dim, slot, last_access FROM embeddings ORDER BY last_access LIMIT ?",
+                                (_EVICT_BATCH,)).fetchall()
+            if not rows:
+                break
+            conn.executemany("DELETE FROM embeddings WHERE key = ?", [(row[0],) for row in rows])
+            conn.executemany("INSERT OR IGNORE INTO free_slots (dim, slot) VALUES (?, ?)",
+                             [(row[1], row[2]) for row in rows])
+            total -= sum(row[1] for row in rows) * 2
+            evicted += len(rows)
+            cutoff = rows[-1][3]
+        if evicted:
+            conn.execute("DELETE FROM windows WHERE last_access <= ?", (cutoff,))
+            logger.info(f"特征缓存淘汰 {evicted} 条")
+
+    def _read(self, conn: sqlite3.Connection, keys: Sequence[str]) -> Optional[np.ndarray]:
+        """读取一组特征，任一键缺失时返回 None"""
+        if not keys:
+            return np.zeros((0, 0), dtype=np.float32)
+        found: Dict[str, Tuple[int, int]] = {}
+        unique = list(dict.fromkeys(keys))
+        for start in range(0, len(unique), 500):
+            chunk = unique[start:start + 500]
+            rows = conn.execute(
+                f"SELECT key, dim, slot FROM embeddings WHERE key IN ({', '.join('?' * len(chunk))})", chunk)
+            found.update((key, (dim, slot)) for key, dim, slot in rows)
+        if len(found) != len(unique):
+            return None
+        dims = {dim for dim, _ in found.values()}
+        if len(dims) != 1:
+            return None
+        dim = dims.pop()
+        slots = np.fromiter((found[key][1] for key in keys), dtype=np.int64, count=len(keys))
+        features = np.asarray(self._memmap(dim, int(slots.max()) + 1)[slots], dtype=np.float32)
+        now = time.time()
+        conn.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?", [(now, key) for key in unique])
+        return features
+
+    def _write(self, conn: sqlite3.Connection, keys: Sequence[str], features: np.ndarray):
+        """写入一组特征（已存在的键覆盖原槽位）"""
+        dim = features.shape[1]
+        existing = {}
+        for start in range(0, len(keys), 500):
+            chunk = list(keys[start:start + 500])
+            existing.update(conn.execute(
+                f"SELECT key, slot FROM embeddings WHERE key IN ({', '.join('?' * len(chunk))}) AND dim = ?",
+                chunk + [dim]).fetchall())
+        new_keys = [key for key in dict.fromkeys(keys) if key not in existing]
+        existing.update(zip(new_keys, self._allocate(conn, dim, len(new_keys))))
+        slots = np.fromiter((existing[key] for key in keys), dtype=np.int64, count=len(keys))
+        mm = self._memmap(dim, int(slots.max()) + 1)
+        mm[slots] = features.astype(np.float16)
+        mm.flush()
+        now = time.time()
+        conn.executemany("INSERT OR REPLACE INTO embeddings (key, dim, slot, last_access) VALUES (?, ?, ?, ?)",
+                         [(key, dim, int(existing[key]), now) for key in dict.fromkeys(keys)])
+
+    def get(self, video_hash: str, frame_index: int, bbox: Sequence[int], algorithm: str,
+            model_version: str) -> Optional[np.ndarray]:
+        """查询单个裁剪图的特征，未命中时返回 None"""
+        key = embedding_key(video_hash, frame_index, bbox, algorithm, model_version)
+        with self._lock:
+            conn = self._connect()
+            features = self._read(conn, [key])
+            conn.commit()
+        if features is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return features[0]
+
+    def put(self, video_hash: str, frame_index: int, bbox: Sequence[int], algorithm: str,
+            model_version: str, feature) -> bool:
+        """保存单个裁剪图的特征"""
+        feature = np.asarray(feature, dtype=np.float32).reshape(1, -1)
+        if not np.isfinite(feature.astype(np.float16)).all():
+            return False
+        key = embedding_key(video_hash, frame_index, bbox, algorithm, model_version)
+        with self._lock:
+            conn = self._connect()
+            self._write(conn, [key], feature)
+            self._evict(conn)
+            conn.commit()
+        return True
+
+    def lookup_window(self, video_hash: str, start_frame: int, end_frame: int, step: int, algorithm: str,
+                      model_version: str) -> Optional[Tuple[List[int], List[List[int]], np.ndarray]]:
+        """
+        查询一个帧窗口的检测和特征结果
+
+        Args:
+            video_hash: file_fingerprint 返回的视频内容哈希
+            start_frame: 窗口起始帧
+            end_frame: 窗口结束帧
+            step: 抽帧间隔
+            algorithm: 特征提取算法
+            model_version: 检测和重识别模型的版本标识
+
+        Returns:
+            (帧号列表, 边界框列表, (N,d) 特征矩阵)；未命中或部分特征已被淘汰时返回 None
+        """
+        key = window_key(video_hash, start_frame, end_frame, step, algorithm, model_version)
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT crops FROM windows WHERE key = ?", (key,)).fetchone()
+            result = None
+            if row is not None:
+                crops = json.loads(row[0])
+                features = self._read(conn, [crop[2] for crop in crops])
+                if features is None:
+                    # 部分特征已被淘汰，窗口记录作废
+                    conn.execute("DELETE FROM windows WHERE key = ?", (key,))
+                else:
+                    conn.execute("UPDATE windows SET last_access = ? WHERE key = ?", (time.time(), key))
+                    result = ([crop[0] for crop in crops], [crop[1] for crop in crops], features)
+            conn.commit()
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def store_window(self, video_hash: str, start_frame: int, end_frame: int, step: int, algorithm: str,
+                     model_version: str, frame_indices: Sequence[int], bboxes: Sequence[Sequence[int]],
+                     features) -> bool:
+        """
+        保存一个帧窗口的检测和特征结果（没有检测到人物的窗口也会记录）
+
+        Returns:
+            是否保存（特征含非有限值或超出 float16 范围时不保存）
+        """
+        features = np.asarray(features, dtype=np.float32)
+        if len(frame_indices) != len(bboxes) or len(bboxes) != len(features):
+            raise ValueError("帧号、边界框和特征数量不一致")
+        if len(features) and not np.isfinite(features.astype(np.float16)).all():
+            return False
+        keys = [embedding_key(video_hash, frame, bbox, algorithm, model_version)
+                for frame, bbox in zip(frame_indices, bboxes)]
+        crops = [[int(frame), [int(v) for v in bbox], key] for frame, bbox, key in zip(frame_indices, bboxes, keys)]
+        with self._lock:
+            conn = self._connect()
+            if keys:
+                self._write(conn, keys, features.reshape(len(keys), -1))
+            conn.execute("INSERT OR REPLACE INTO windows (key, crops, last_access) VALUES (?, ?, ?)",
+                         (window_key(video_hash, start_frame, end_frame, step, algorithm, model_version),
+                          json.dumps(crops), time.time()))
+            self._evict(conn)
+            conn.commit()
+        return True
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            conn = self._connect()
+            conn.executescript("DELETE FROM embeddings; DELETE FROM free_slots; DELETE FROM slot_files; "
+                               "DELETE FROM windows;")
+            conn.commit()
+            for dim in list(self._memmaps):
+                del self._memmaps[dim]
+            for name in os.listdir(self.cache_dir):
+                if name.endswith('.f16'):
+                    os.remove(os.path.join(self.cache_dir, name))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            conn = self._connect()
+            entries, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(dim), 0) * 2 FROM embeddings").fetchone()
+            windows = conn.execute("SELECT COUNT(*) FROM windows").fetchone()[0]
+        return {
+            'entries': entries,
+            'windows': windows,
+            'bytes': total,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+    def close(self):
+        with self._lock:
+            for mm in self._memmaps.values():
+                mm.flush()
+            self._memmaps.clear()
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
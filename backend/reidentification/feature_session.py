@@ -0,0 +1,252 @@
+"""
+特征提取结果的服务端会话存储
+
+/feature_extraction 的结果（每条记录和每个检测帧的特征向量）保存在服务端，只把会话ID返回给前端，
+/feature_matching 用会话ID和阈值匹配，换一个阈值重新匹配不需要再传输和解析特征。
+
+会话按 LRU 保存在内存中，内存中的特征总大小或会话数超过上限时，最久未使用的会话的特征以 float16
+写入 .npy 文件并改为内存映射读取；磁盘上的总大小超过上限或会话过期时删除。
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from backend.reidentification.embedding import TRANSPORT_DTYPE, EmbeddingMatrix, decode_vector
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_SPILL_DIR = os.path.join(os.path.dirname(__file__), '../resources/cache/feature_sessions')
+DEFAULT_MAX_SESSIONS = 64
+DEFAULT_MAX_BYTES = 256 << 20
+DEFAULT_MAX_SPILL_BYTES = 2 << 30
+DEFAULT_TTL_SECONDS = 2 * 3600
+
+
+class FeatureSession:
+    """一次特征提取的结果
+
+    记录和帧的元数据（不含特征向量）保存在列表中，特征向量分别堆叠为矩阵（内存中为 float32，
+    溢出到磁盘后为 float16 内存映射），valid 标记每一行是否有有效特征。
+    """
+
+    __slots__ = ('session_id', 'algorithm', 'records', 'record_vectors', 'record_valid', 'frames', 'frame_cameras',
+                 'frame_vectors', 'frame_valid', 'query_feature', 'created', 'last_access', 'spill_paths')
+
+    def __init__(self, session_id: str, algorithm: str, result: Dict[str, Any]):
+        """
+        Args:
+            session_id: 会话ID
+            algorithm: 特征提取算法
+            result: ReIDProcessor.extract_features 的返回值
+        """
+        self.session_id = session_id
+        self.algorithm = algorithm
+        self.query_feature = decode_vector(result.get('query_feature'))
+        dim = len(self.query_feature) if self.query_feature is not None else None
+
+        records = result.get('records', [])
+        self.records = [{k: v for k, v in record.items() if k != 'feature_vector'} for record in records]
+        matrix = EmbeddingMatrix.from_values([record.get('feature_vector') for record in records], dim)
+        self.record_vectors, self.record_valid = matrix.vectors, matrix.valid
+
+        self.frames: List[Dict[str, Any]] = []
+        self.frame_cameras: List[Any] = []
+        frame_vectors = []
+        for camera_id, frames in (result.get('all_frames_features') or {}).items():
+            for frame in frames:
+                self.frames.append({k: v for k, v in frame.items() if k != 'feature_vector'})
+                self.frame_cameras.append(camera_id)
+                frame_vectors.append(frame.get('feature_vector'))
+        matrix = EmbeddingMatrix.from_values(frame_vectors, dim or None)
+        self.frame_vectors, self.frame_valid = matrix.vectors, matrix.valid
+
+        self.created = self.last_access = time.time()
+        self.spill_paths: List[str] = []
+
+    @property
+    def spilled(self) -> bool:
+        return bool(self.spill_paths)
+
+    @property
+    def nbytes(self) -> int:
+        """特征矩阵占用的字节数（溢出后为磁盘上的大小）"""
+        return self.record_vectors.nbytes + self.frame_vectors.nbytes
+
+    def spill(self, spill_dir: str):
+        """把特征矩阵以 float16 写入磁盘，改为内存映射读取"""
+        if self.spilled:
+            return
+        paths = [os.path.join(spill_dir, f"{self.session_id}_records.npy"),
+                 os.path.join(spill_dir, f"{self.session_id}_frames.npy")]
+        np.save(paths[0], self.record_vectors.astype(TRANSPORT_DTYPE))
+        np.save(paths[1], self.frame_vectors.astype(TRANSPORT_DTYPE))
+        self.record_vectors = np.load(paths[0], mmap_mode='r')
+        self.frame_vectors = np.load(paths[1], mmap_mode='r')
+        self.spill_paths = paths
+
+    def release(self):
+        """删除溢出文件"""
+        self.record_vectors = self.frame_vectors = np.zeros((0, 0), dtype=np.float32)
+        for path in self.spill_paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.spill_paths = []
+
+    def to_features_data(self) -> Dict[str, Any]:
+        """
+        转换为 ReIDProcessor.match_features 的输入格式
+
+        特征向量是矩阵各行的视图，不复制数据。
+        """
+        records = [dict(record, feature_vector=self.record_vectors[i] if ok else None)
+                   for i, (record, ok) in enumerate(zip(self.records, self.record_valid.tolist()))]
+        all_frames_features: Dict[Any, List[Dict[str, Any]]] = {}
+        for i, (frame, camera_id, ok) in enumerate(zip(self.frames, self.frame_cameras, self.frame_valid.tolist())):
+            all_frames_features.setdefault(camera_id, []).append(
+                dict(frame, feature_vector=self.frame_vectors[i] if ok else None))
+        return {
+            'records': records,
+            'all_frames_features': all_frames_features,
+            'query_feature': self.query_feature,
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'session_id': self.session_id,
+            'algorithm': self.algorithm,
+            'records': len(self.records),
+            'frames': len(self.frames),
+            'bytes': self.nbytes,
+            'spilled': self.spilled,
+        }
+
+
+class FeatureSessionStore:
+    """按 LRU 管理特征会话，超出内存上限时溢出到内存映射文件"""
+
+    def __init__(self, spill_dir: str = DEFAULT_SPILL_DIR, max_sessions: int = DEFAULT_MAX_SESSIONS,
+                 max_bytes: int = DEFAULT_MAX_BYTES, max_spill_bytes: int = DEFAULT_MAX_SPILL_BYTES,
+                 ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        """
+        Args:
+            spill_dir: 溢出文件目录（启动时清空上次运行留下的文件）
+            max_sessions: 内存中最多保留的会话数
+            max_bytes: 内存中特征矩阵的总大小上限
+            max_spill_bytes: 溢出文件的总大小上限
+            ttl_seconds: 会话在最后一次使用后的有效期
+        """
+        self.spill_dir = os.path.abspath(spill_dir)
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.max_spill_bytes = max_spill_bytes
+        self.ttl_seconds = ttl_seconds
+        self._sessions: 'OrderedDict[str, FeatureSession]' = OrderedDict()
+        self._lock = threading.Lock()
+
+        os.makedirs(self.spill_dir, exist_ok=True)
+        for name in os.listdir(self.spill_dir):
+            if name.endswith('.npy'):
+                try:
+                    os.remove(os.path.join(self.spill_dir, name))
+                except OSError:
+                    pass
+
+    def create(self, result: Dict[str, Any], algorithm: str = 'mgn') -> str:
+        """
+        保存一次特征提取的结果
+
+        Args:
+            result: ReIDProcessor.extract_features 的返回值
+            algorithm: 特征提取算法
+
+        Returns:
+            会话ID
+        """
+        session = FeatureSession(uuid.uuid4().hex, algorithm, result)
+        with self._lock:
+            self._sessions[session.session_id] = session
+            self._enforce_limits()
+        logger.info(f"创建特征会话 {session.session_id}: {len(session.records)} 条记录, "
+                    f"{len(session.frames)} 个帧特征, {session.nbytes / (1 << 20):.1f}MB")
+        return session.session_id
+
+    def get(self, session_id: str) -> Optional[FeatureSession]:
+        """获取会话，不存在或已过期时返回 None"""
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_access = time.time()
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is None:
+            return False
+        session.release()
+        return True
+
+    def clear(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            in_memory = [s for s in self._sessions.values() if not s.spilled]
+            spilled = [s for s in self._sessions.values() if s.spilled]
+            return {
+                'sessions': len(self._sessions),
+                'in_memory': len(in_memory),
+                'memory_bytes': sum(s.nbytes for s in in_memory),
+                'spilled': len(spilled),
+                'spill_bytes': sum(s.nbytes for s in spilled),
+            }
+
+    def _expire(self):
+        """删除过期的会话（调用方持有锁）"""
+        deadline = time.time() - self.ttl_seconds
+        for session_id in [sid for sid, s in self._sessions.items() if s.last_access < deadline]:
+            self._sessions.pop(session_id).release()
+            logger.info(f"特征会话 {session_id} 已过期")
+
+    def _enforce_limits(self):
+        """内存超限时从最久未使用的会话开始溢出到磁盘，磁盘超限时删除（调用方持有锁）"""
+        self._expire()
+        in_memory = [s for s in self._sessions.values() if not s.spilled]
+        memory_bytes = sum(s.nbytes for s in in_memory)
+        count = len(in_memory)
+        # 最近创建/使用的会话始终保留在内存中
+        for session in in_memory[:-1]:
+            if memory_bytes <= self.max_bytes and count <= self.max_sessions:
+                break
+            memory_bytes -= session.nbytes
+            count -= 1
+            try:
+                session.spill(self.spill_dir)
+                logger.info(f"特征会话 {session.session_id} 已溢出到磁盘")
+            except OSError as e:
+                logger.error(f"特征会话 {session.session_id} 溢出失败，删除该会话: {e}")
+                self._sessions.pop(session.session_id).release()
+
+        spilled = [s for s in self._sessions.values() if s.spilled]
+        spill_bytes = sum(s.nbytes for s in spilled)
+        for session in spilled:
+            if spill_bytes <= self.max_spill_bytes:
+                break
+            spill_bytes -= session.nbytes
+            self._sessions.pop(session.session_id).release()
+            logger.info(f"特征会话 {session.session_id} 超出磁盘上限，已删除")
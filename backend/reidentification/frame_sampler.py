@@ -0,0 +1,138 @@
+import logging
+from typing import List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 下一个窗口在当前解码位置之后不超过该秒数时继续顺序解码，不再 seek
+SEQUENTIAL_SKIP_SECONDS = 5
+
+
+class FrameSampler:
+    """按顺序解码的抽帧器
+
+    cap.set(CAP_PROP_POS_FRAMES) 每次都会回到最近的关键帧重新解码，长 GOP 的 H.264 视频逐帧 seek
+    时大部分时间花在重复解码上。FrameSampler 对每个帧窗口只 seek 一次到起始帧，之后用 grab() 顺序
+    解码，只对需要的帧调用 retrieve()；同一个视频的多个窗口按时间顺序读取时，相距不远的窗口之间
+    也不再 seek。
+
+    提供关键帧索引（见 VideoCatalog）时，只有当前位置与目标帧之间存在关键帧才 seek，并且直接 seek 到
+    目标之前的关键帧再顺序解码，定位准确且不会多解码。
+    """
+
+    def __init__(self, video_path: str, skip_seconds: float = SEQUENTIAL_SKIP_SECONDS,
+                 keyframes: Optional[Sequence[int]] = None):
+        """
+        Args:
+            video_path: 本地视频文件路径
+            skip_seconds: 没有关键帧索引时，目标帧在当前位置之后不超过该秒数则顺序解码过去而不是 seek
+            keyframes: 关键帧帧号（升序），为 None 或空时使用 skip_seconds 判断
+        """
+        self.video_path = video_path
+        self.cap = cv2.VideoCapture(video_path)
+        self.skip_seconds = skip_seconds
+        self.keyframes = np.asarray(keyframes if keyframes is not None else [], dtype=np.int64)
+        # 下一次 grab() 将解码的帧号，未知时为 None
+        self._position: Optional[int] = 0 if self.cap.isOpened() else None
+        self.seeks = 0
+
+    def isOpened(self) -> bool:
+        return self.cap.isOpened()
+
+    @property
+    def fps(self) -> float:
+        return self.cap.get(cv2.CAP_PROP_FPS)
+
+    @property
+    def frame_count(self) -> int:
+        return int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    def get(self, prop):
+        return self.cap.get(prop)
+
+    def _seek(self, frame_index: int):
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+        self._position = frame_index
+        self.seeks += 1
+
+    def _keyframe_before(self, frame_index: int) -> int:
+        pos = int(np.searchsorted(self.keyframes, frame_index, side='right')) - 1
+        return int(self.keyframes[pos]) if pos >= 0 else -1
+
+    def read_indices(self, frame_indices: Sequence[int]) -> Tuple[List[np.ndarray], List[int]]:
+        """
+        按帧号读取帧
+
+        Args:
+            frame_indices: 需要的帧号（升序）
+
+        Returns:
+            (帧列表, 对应的帧号列表)；读取失败的帧会被跳过
+        """
+        frames: List[np.ndarray] = []
+        read_indices: List[int] = []
+        if not frame_indices or not self.cap.isOpened():
+            return frames, read_indices
+
+        max_skip = max(int(self.fps * self.skip_seconds), 1)
+        for target in frame_indices:
+            keyframe = self._keyframe_before(target)
+            if self._position is None or target < self._position:
+                self._seek(keyframe if keyframe >= 0 else target)
+            elif len(self.keyframes):
+                # 当前位置与目标之间有关键帧时，从该关键帧开始解码比继续顺序解码少
+                if keyframe > self._position:
+                    self._seek(keyframe)
+            elif target - self._position > max_skip:
+                self._seek(target)
+            # 顺序解码到目标帧，中间的帧只 grab 不 retrieve
+            while self._position < target:
+                if not self.cap.grab():
+                    self._position = None
+                    break
+                self._position += 1
+            if self._position is None or not self.cap.grab():
+                logger.warning(f"无法读取帧: {target}")
+                self._position = None
+                if target >= self.frame_count:
+                    # 已到视频末尾，后面的帧号都读不到
+                    break
+                continue
+            self._position += 1
+            ok, frame = self.cap.retrieve()
+            if ok:
+                frames.append(frame)
+                read_indices.append(target)
+            else:
+                logger.warning(f"无法解码帧: {target}")
+        return frames, read_indices
+
+    def read_window(self, start_frame: int, end_frame: int, step: int) -> Tuple[List[np.ndarray], List[int]]:
+        """读取 [start_frame, end_frame] 内每隔 step 帧的一帧"""
+        return self.read_indices(range(start_frame, end_frame + 1, max(int(step), 1)))
+
+    def release(self):
+        self.cap.release()
+        self._position = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+def read_frames_seeking(cap, frame_indices: Sequence[int]) -> Tuple[List[np.ndarray], List[int]]:
+    """逐帧 seek 的读取方式（原实现），用于基准测试对比"""
+    frames: List[np.ndarray] = []
+    read_indices: List[int] = []
+    for frame_idx in frame_indices:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+        ret, frame = cap.read()
+        if ret:
+            frames.append(frame)
+            read_indices.append(frame_idx)
+    return frames, read_indices
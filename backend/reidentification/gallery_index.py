@@ -0,0 +1,566 @@
+"""
+student_records.feature_vector 的持久化 FAISS 检索库
+
+用法（从数据库全量重建并保存）:
+    python -m backend.reidentification.gallery_index rebuild --algorithm mgn
+"""
+import argparse
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from backend.dbInterface.feature_codec import decode_feature, is_encoded, parse_header
+from backend.reidentification.similarity import normalize_vector, stack_normalized
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_DIR = os.path.join(os.path.dirname(__file__), '../resources/cache/gallery')
+
+INDEX_TYPES = ('flat', 'auto', 'hnsw')
+SHARD_GRANULARITIES = ('day', 'month', 'year')
+
+
+def _faiss():
+    import faiss
+    return faiss
+
+
+def _sql(db_interface, query: str) -> str:
+    if db_interface.db_config['type'].lower() == 'sqlite':
+        return query.replace("%s", "?")
+    return query
+
+
+def _to_epoch(timestamp) -> float:
+    if isinstance(timestamp, (int, float, np.integer, np.floating)):
+        return float(timestamp)
+    if isinstance(timestamp, str):
+        timestamp = datetime.strptime(timestamp[:19], "%Y-%m-%d %H:%M:%S")
+    return timestamp.timestamp()
+
+
+def shard_key(timestamp: float, granularity: str = 'month') -> str:
+    """时间戳（秒）所在分片的键，如 '202405'"""
+    moment = datetime.fromtimestamp(timestamp)
+    if granularity == 'day':
+        return moment.strftime('%Y%m%d')
+    if granularity == 'year':
+        return moment.strftime('%Y')
+    return moment.strftime('%Y%m')
+
+
+def shard_bounds(key: str) -> Tuple[float, float]:
+    """分片覆盖的时间范围 [start, end)（秒）"""
+    if len(key) == 8:
+        start = datetime.strptime(key, '%Y%m%d')
+        end = datetime.fromordinal(start.toordinal() + 1)
+    elif len(key) == 6:
+        start = datetime.strptime(key, '%Y%m')
+        end = datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+    else:
+        start = datetime.strptime(key, '%Y')
+        end = datetime(start.year + 1, 1, 1)
+    return start.timestamp(), end.timestamp()
+
+
+class _Shard:
+    """一个时间分片的 FAISS 索引，id 即 student_records.id
+
+    精确和 HNSW 分片用 IndexIDMap2 包装；IVF-PQ 分片直接用 IndexIVFPQ 保存 id（IVF 原生支持
+    add_with_ids / remove_ids，删除后内部序号不压缩，不能再套 IndexIDMap2）。
+    """
+
+    __slots__ = ('key', 'index', 'kind', 'tombstones')
+
+    def __init__(self, key: str, index, kind: str):
+        self.key = key
+        self.index = index
+        self.kind = kind
+        # 不支持 remove_ids 的索引（HNSW）用墓碑标记删除，保存时压缩
+        self.tombstones = set()
+
+    @property
+    def size(self) -> int:
+        return self.index.ntotal - len(self.tombstones)
+
+
+class GalleryIndex:
+    """按时间分片的特征检索库
+
+    每条带特征的 student_records 以 L2 归一化后的向量加入所在时间分片，内积即余弦相似度。
+    小分片使用精确的 IndexFlatIP；index_type='auto' 时分片超过 ivf_threshold 后转为 IVF-PQ，
+    'hnsw' 使用 HNSW 图索引。支持增量添加、按记录ID删除、按时间范围只检索相关分片，
+    保存时先写入新的版本目录再原子切换 CURRENT 指针。其他进程写入的特征通过 feature_changes 变更日志
+    增量同步（sync()），已从数据库删除的记录由 prune() 清理。
+    """
+
+    def __init__(self, algorithm: str = 'mgn', index_dir: Optional[str] = DEFAULT_INDEX_DIR,
+                 index_type: str = 'auto', granularity: str = 'month', ivf_threshold: int = 50000,
+                 nprobe: int = 16, hnsw_m: int = 32, ef_search: int = 128):
+        """
+        初始化检索库
+
+        Args:
+            algorithm: 特征所属的重识别算法，只收录该算法（或旧格式未标注算法）的特征
+            index_dir: 持久化目录，为 None 时不落盘
+            index_type: 'flat' 精确检索；'auto' 小分片精确、大分片 IVF-PQ；'hnsw' HNSW 图索引
+            granularity: 时间分片粒度 'day'、'month' 或 'year'
+            ivf_threshold: 'auto' 模式下分片转为 IVF-PQ 的向量数
+            nprobe: IVF 检索的聚类中心数
+            hnsw_m: HNSW 每个节点的邻居数
+            ef_search: HNSW 检索时的候选队列长度
+        """
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"不支持的索引类型: {index_type}")
+        if granularity not in SHARD_GRANULARITIES:
+            raise ValueError(f"不支持的分片粒度: {granularity}")
+        self.algorithm = algorithm
+        self.index_dir = os.path.join(index_dir, algorithm) if index_dir else None
+        self.index_type = index_type
+        self.granularity = granularity
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self.hnsw_m = hnsw_m
+        self.ef_search = ef_search
+        self.dim: Optional[int] = None
+        self._shards: Dict[str, _Shard] = {}
+        self._times: Dict[int, float] = {}
+        # 已同步到的 feature_changes.seq
+        self._last_seq = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._times)
+
+    def __contains__(self, record_id) -> bool:
+        return int(record_id) in self._times
+
+    # ------------------------------------------------------------------ 索引构建
+
+    def _new_index(self, kind: str):
+        faiss = _faiss()
+        if kind == 'hnsw':
+            base = faiss.IndexHNSWFlat(self.dim, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            base.hnsw.efSearch = self.ef_search
+        else:
+            base = faiss.IndexFlatIP(self.dim)
+        return faiss.IndexIDMap2(base)
+
+    def _pq_m(self) -> int:
+        """PQ 子量化器个数：能整除维度且每段不少于 8 维的最大值（不超过 64）"""
+        for m in (64, 32, 16, 8, 4, 2, 1):
+            if self.dim % m == 0 and self.dim // m >= 8:
+                return m
+        return 1
+
+    def _upgrade_to_ivfpq(self, shard: _Shard):
+        """把精确分片重建为 IVF-PQ"""
+        faiss = _faiss()
+        n = shard.index.ntotal
+        ids = faiss.vector_to_array(shard.index.id_map).astype(np.int64)
+        vectors = faiss.downcast_index(shard.index.index).reconstruct_n(0, n)
+        nlist = int(min(max(4 * np.sqrt(n), 16), n // 39))
+        quantizer = faiss.IndexFlatIP(self.dim)
+        base = faiss.IndexIVFPQ(quantizer, self.dim, nlist, self._pq_m(), 8, faiss.METRIC_INNER_PRODUCT)
+        start = time.perf_counter()
+        base.train(vectors)
+        base.nprobe = self.nprobe
+        base.add_with_ids(vectors, ids)
+        shard.index = base
+        shard.kind = 'ivfpq'
+        logger.info(f"分片 {shard.key} 转为 IVF-PQ: {n} 个向量, nlist={nlist}, "
+                    f"耗时 {time.perf_counter() - start:.1f}s")
+
+    def _shard(self, key: str) -> _Shard:
+        shard = self._shards.get(key)
+        if shard is None:
+            kind = 'hnsw' if self.index_type == 'hnsw' else 'flat'
+            shard = _Shard(key, self._new_index(kind), kind)
+            self._shards[key] = shard
+        return shard
+
+    def add(self, record_ids: Sequence[int], vectors, timestamps: Sequence) -> int:
+        """
+        增量添加（或替换）特征
+
+        Args:
+            record_ids: student_records.id
+            vectors: (n, d) 特征矩阵或特征向量序列
+            timestamps: 记录时间（datetime、'%Y-%m-%d %H:%M:%S' 字符串或秒数）
+
+        Returns:
+            实际加入的数量（无效向量被跳过）
+        """
+        if len(record_ids) == 0:
+            return 0
+        matrix, valid = stack_normalized(vectors, self.dim)
+        if self.dim is None and matrix.shape[1]:
+            self.dim = matrix.shape[1]
+        if not valid.any():
+            return 0
+
+        ids = np.asarray(record_ids, dtype=np.int64)[valid]
+        matrix = matrix[valid]
+        times = np.asarray([_to_epoch(t) for t, ok in zip(timestamps, valid) if ok], dtype=np.float64)
+        keys = np.asarray([shard_key(t, self.granularity) for t in times])
+
+        with self._lock:
+            # 已存在的记录先删除，保证每个ID只出现一次
+            existing = [int(i) for i in ids if int(i) in self._times]
+            if existing:
+                self._remove_locked(existing)
+            for key in np.unique(keys):
+                mask = keys == key
+                shard = self._shard(str(key))
+                if shard.tombstones and not shard.tombstones.isdisjoint(ids[mask].tolist()):
+                    # 被标记删除的旧向量仍在 HNSW 图中，重新加入同一ID前先压缩
+                    self._compact(shard)
+                shard.index.add_with_ids(matrix[mask], ids[mask])
+                if (self.index_type == 'auto' and shard.kind == 'flat'
+                        and shard.index.ntotal >= self.ivf_threshold):
+                    self._upgrade_to_ivfpq(shard)
+            self._times.update(zip(ids.tolist(), times.tolist()))
+        return int(len(ids))
+
+    def _remove_locked(self, record_ids: List[int]) -> int:
+        faiss = _faiss()
+        by_shard: Dict[str, List[int]] = {}
+        for record_id in record_ids:
+            t = self._times.pop(record_id, None)
+            if t is not None:
+                by_shard.setdefault(shard_key(t, self.granularity), []).append(record_id)
+        for key, ids in by_shard.items():
+            shard = self._shards[key]
+            if shard.kind == 'hnsw':
+                shard.tombstones.update(ids)
+            else:
+                shard.index.remove_ids(faiss.IDSelectorBatch(np.asarray(ids, dtype=np.int64)))
+            if shard.size == 0:
+                del self._shards[key]
+        return sum(len(ids) for ids in by_shard.values())
+
+    def remove(self, record_ids: Iterable[int]) -> int:
+        """按记录ID删除，返回删除的数量"""
+        with self._lock:
+            return self._remove_locked([int(i) for i in record_ids])
+
+    # ------------------------------------------------------------------ 检索
+
+    def search(self, query, k: int = 10,
+               time_range: Optional[Tuple[datetime, datetime]] = None) -> List[Tuple[int, float]]:
+        """
+        检索与查询特征最相似的记录
+
+        Args:
+            query: 查询特征向量
+            k: 返回数量
+            time_range: (开始时间, 结束时间)，只检索该范围内的记录，任一端为 None 表示不限
+
+        Returns:
+            [(record_id, 余弦相似度)]，按相似度从高到低
+        """
+        query_vector = normalize_vector(query)
+        if query_vector is None or self.dim is None or len(query_vector) != self.dim or k <= 0:
+            return []
+        query_vector = query_vector.reshape(1, -1)
+        start_time, end_time = time_range or (None, None)
+        lo = -np.inf if start_time is None else _to_epoch(start_time)
+        hi = np.inf if end_time is None else _to_epoch(end_time)
+
+        results: List[Tuple[int, float]] = []
+        with self._lock:
+            for key, shard in self._shards.items():
+                start, end = shard_bounds(key)
+                if end <= lo or start > hi:
+                    continue
+                partial = start < lo or end > hi
+                results.extend(self._search_shard(shard, query_vector, k, lo, hi, partial))
+
+        results.sort(key=lambda item: -item[1])
+        return results[:k]
+
+    def _search_shard(self, shard: _Shard, query_vector: np.ndarray, k: int,
+                      lo: float, hi: float, partial: bool) -> List[Tuple[int, float]]:
+        """在一个分片中检索；分片只有一部分在时间范围内时多取一些候选再过滤，不够时扩大"""
+        total = shard.index.ntotal
+        fetch = min(total, k * (4 if partial else 1) + len(shard.tombstones))
+        while True:
+            scores, ids = shard.index.search(query_vector, fetch)
+            hits = []
+            for record_id, score in zip(ids[0].tolist(), scores[0].tolist()):
+                if record_id < 0 or record_id in shard.tombstones:
+                    continue
+                if partial and not lo <= self._times.get(record_id, np.nan) <= hi:
+                    continue
+                hits.append((record_id, score))
+            if len(hits) >= k or fetch >= total:
+                return hits[:k]
+            fetch = min(total, fetch * 4)
+
+    # ------------------------------------------------------------------ 持久化
+
+    def _compact(self, shard: _Shard):
+        """重建 HNSW 分片，去掉墓碑"""
+        faiss = _faiss()
+        ids = faiss.vector_to_array(shard.index.id_map).astype(np.int64)
+        keep = np.asarray([i not in shard.tombstones for i in ids.tolist()], dtype=bool)
+        vectors = np.vstack([shard.index.reconstruct(int(i)) for i in ids[keep]]) if keep.any() else None
+        shard.index = self._new_index('hnsw')
+        if vectors is not None:
+            shard.index.add_with_ids(vectors, ids[keep])
+        shard.tombstones = set()
+
+    def save(self):
+        """保存到新的版本目录，再原子替换 CURRENT 指针，读者不会看到写了一半的索引"""
+        if not self.index_dir:
+            return
+        faiss = _faiss()
+        with self._lock:
+            os.makedirs(self.index_dir, exist_ok=True)
+            version = f"v{int(time.time() * 1000)}"
+            version_dir = os.path.join(self.index_dir, version)
+            os.makedirs(version_dir)
+            for key, shard in self._shards.items():
+                if shard.tombstones:
+                    self._compact(shard)
+                faiss.write_index(shard.index, os.path.join(version_dir, f"{key}.{shard.kind}.faiss"))
+            ids = np.fromiter(self._times.keys(), dtype=np.int64, count=len(self._times))
+            times = np.fromiter(self._times.values(), dtype=np.float64, count=len(self._times))
+            np.savez(os.path.join(version_dir, 'meta.npz'), ids=ids, times=times,
+                     dim=np.int64(self.dim or 0), granularity=np.str_(self.granularity),
+                     last_seq=np.int64(self._last_seq))
+
+            pointer = os.path.join(self.index_dir, 'CURRENT')
+            tmp_pointer = f"{pointer}.{os.getpid()}.tmp"
+            with open(tmp_pointer, 'w') as f:
+                f.write(version)
+            os.replace(tmp_pointer, pointer)
+
+            # 清理旧版本
+            for name in os.listdir(self.index_dir):
+                path = os.path.join(self.index_dir, name)
+                if name != version and name.startswith('v') and os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+        logger.info(f"检索库已保存: {len(self)} 个向量, {len(self._shards)} 个分片 -> {version_dir}")
+
+    def load(self) -> bool:
+        """从磁盘加载，成功返回 True"""
+        if not self.index_dir:
+            return False
+        pointer = os.path.join(self.index_dir, 'CURRENT')
+        if not os.path.exists(pointer):
+            return False
+        faiss = _faiss()
+        with open(pointer) as f:
+            version_dir = os.path.join(self.index_dir, f.read().strip())
+        try:
+            meta = np.load(os.path.join(version_dir, 'meta.npz'))
+            if str(meta['granularity']) != self.granularity:
+                logger.warning("检索库的分片粒度与配置不一致，需要重建")
+                return False
+            if 'last_seq' not in meta.files:
+                logger.warning("检索库没有变更日志水位线（旧版本），需要重建")
+                return False
+            shards = {}
+            for name in os.listdir(version_dir):
+                if not name.endswith('.faiss'):
+                    continue
+                key, kind, _ = name.split('.')
+                index = faiss.read_index(os.path.join(version_dir, name))
+                if kind == 'ivfpq':
+                    if isinstance(index, faiss.IndexIDMap2):
+                        # 旧版本保存的 IVF-PQ 分片套了 IndexIDMap2，删除记录后 id 会错位，需要重建
+                        logger.warning(f"分片 {key} 是旧格式的 IVF-PQ 索引，需要重建")
+                        return False
+                    index.nprobe = self.nprobe
+                elif kind == 'hnsw':
+                    faiss.downcast_index(index.index).hnsw.efSearch = self.ef_search
+                shards[key] = _Shard(key, index, kind)
+        except Exception as e:
+            logger.error(f"加载检索库失败: {e}")
+            return False
+
+        with self._lock:
+            self.dim = int(meta['dim']) or None
+            self._shards = shards
+            self._times = dict(zip(meta['ids'].tolist(), meta['times'].tolist()))
+            self._last_seq = int(meta['last_seq'])
+        logger.info(f"检索库已加载: {len(self)} 个向量, {len(shards)} 个分片")
+        return True
+
+    # ------------------------------------------------------------------ 与数据库同步
+
+    def _accepts(self, blob) -> bool:
+        if not is_encoded(blob):
+            return True  # 旧格式没有算法标记，按维度判断
+        return parse_header(blob)[2] in (self.algorithm, 'unknown')
+
+    def _refresh(self, db_interface, record_ids: List[int]) -> int:
+        """重新读取记录的当前特征：有特征的加入或替换，特征被清空、属于其他算法或记录已删除的移除"""
+        added = removed = 0
+        for start in range(0, len(record_ids), 1000):
+            batch = record_ids[start:start + 1000]
+            query = _sql(db_interface, "SELECT id, timestamp, feature_vector FROM student_records "
+                                       f"WHERE id IN ({', '.join(['%s'] * len(batch))})")
+            rows = [row for row in db_interface.execute_query(query, tuple(batch))
+                    if row['feature_vector'] is not None and row['timestamp'] is not None
+                    and self._accepts(row['feature_vector'])]
+            present = {int(row['id']) for row in rows}
+            with self._lock:
+                removed += self._remove_locked([i for i in batch if i not in present and i in self._times])
+                added += self.add([row['id'] for row in rows], [decode_feature(row['feature_vector']) for row in rows],
+                                  [row['timestamp'] for row in rows])
+        return added + removed
+
+    def sync(self, db_interface, batch_size: int = 5000) -> int:
+        """
+        按 feature_changes 变更日志增量同步特征
+
+        save_feature_vector 和 migrate_feature_vectors 更新 feature_vector 时在同一事务中写入变更日志，
+        这里读取 seq 水位线之后变化的记录ID并重新读取它们的当前特征，因此其他进程更新已有记录的特征
+        也会被同步，与记录ID的大小无关。
+
+        Returns:
+            加入、替换或删除的向量数
+        """
+        db_interface.ensure_feature_change_log()
+        query = _sql(db_interface, "SELECT seq, record_id FROM feature_changes WHERE seq > %s ORDER BY seq LIMIT %s")
+
+        changed = 0
+        with self._lock:
+            while True:
+                rows = db_interface.execute_query(query, (self._last_seq, batch_size))
+                if not rows:
+                    break
+                changed += self._refresh(db_interface, sorted({int(row['record_id']) for row in rows}))
+                self._last_seq = int(rows[-1]['seq'])
+        if changed:
+            logger.info(f"检索库增量同步了 {changed} 个向量")
+        return changed
+
+    def prune(self, db_interface, batch_size: int = 1000) -> int:
+        """
+        删除数据库中已不存在或已没有特征的记录
+
+        删除 student_records（包括删除学生时的级联删除）不经过变更日志，需要定期对照数据库检查。
+
+        Returns:
+            删除的数量
+        """
+        with self._lock:
+            record_ids = sorted(self._times)
+        removed = 0
+        for start in range(0, len(record_ids), batch_size):
+            batch = record_ids[start:start + batch_size]
+            query = _sql(db_interface, "SELECT id FROM student_records "
+                                       f"WHERE id IN ({', '.join(['%s'] * len(batch))}) AND feature_vector IS NOT NULL")
+            existing = {int(row['id']) for row in db_interface.execute_query(query, tuple(batch))}
+            missing = [i for i in batch if i not in existing]
+            if missing:
+                removed += self.remove(missing)
+        if removed:
+            logger.info(f"检索库删除了 {removed} 个数据库中已不存在的记录")
+        return removed
+
+    def rebuild(self, db_interface, batch_size: int = 5000) -> int:
+        """从 student_records 全量重建"""
+        db_interface.ensure_feature_change_log()
+        query = _sql(db_interface, "SELECT id, timestamp, feature_vector FROM student_records "
+                                   "WHERE id > %s AND feature_vector IS NOT NULL ORDER BY id LIMIT %s")
+        with self._lock:
+            self._shards = {}
+            self._times = {}
+            self.dim = None
+            # 先记下变更日志的位置，扫描期间发生的变化在最后的 sync 中重放
+            rows = db_interface.execute_query("SELECT MAX(seq) AS seq FROM feature_changes")
+            self._last_seq = int(rows[0]['seq'] or 0) if rows else 0
+            last_id = 0
+            while True:
+                rows = db_interface.execute_query(query, (last_id, batch_size))
+                if not rows:
+                    break
+                last_id = rows[-1]['id']
+                rows = [row for row in rows
+                        if row['timestamp'] is not None and self._accepts(row['feature_vector'])]
+                self.add([row['id'] for row in rows], [decode_feature(row['feature_vector']) for row in rows],
+                         [row['timestamp'] for row in rows])
+            self.sync(db_interface, batch_size)
+        logger.info(f"检索库重建完成: {len(self)} 个向量, {len(self._shards)} 个分片")
+        return len(self)
+
+    def add_from_db(self, db_interface, record_id: int, vector) -> bool:
+        """保存特征后调用：查询记录时间并加入检索库"""
+        query = _sql(db_interface, "SELECT timestamp FROM student_records WHERE id = %s")
+        rows = db_interface.execute_query(query, (record_id,))
+        if not rows or rows[0]['timestamp'] is None:
+            return False
+        return self.add([record_id], [vector], [rows[0]['timestamp']]) == 1
+
+    def load_or_rebuild(self, db_interface) -> 'GalleryIndex':
+        """优先从磁盘加载并同步保存之后的变化，没有可用的索引时从数据库重建并保存"""
+        if not self.load():
+            self.rebuild(db_interface)
+            self.save()
+        elif self.sync(db_interface) + self.prune(db_interface):
+            self.save()
+        return self
+
+    def stats(self) -> Dict:
+        return {
+            'algorithm': self.algorithm,
+            'dim': self.dim,
+            'size': len(self),
+            'last_seq': self._last_seq,
+            'shards': {key: {'kind': shard.kind, 'size': shard.size} for key, shard in sorted(self._shards.items())},
+        }
+
+
+def main():
+    from backend.dbInterface.db_interface import DatabaseInterface
+
+    parser = argparse.ArgumentParser(description='student_records 特征检索库')
+    parser.add_argument('command', choices=['rebuild', 'stats'])
+    parser.add_argument('--algorithm', default='mgn', choices=['mgn', 'agw', 'sbs'])
+    parser.add_argument('--index-type', default='auto', choices=INDEX_TYPES)
+    parser.add_argument('--granularity', default='month', choices=SHARD_GRANULARITIES)
+    parser.add_argument('--index-dir', default=DEFAULT_INDEX_DIR)
+    parser.add_argument('--type', default='mysql', choices=['mysql', 'sqlite'])
+    parser.add_argument('--sqlite-path', default='')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=3306)
+    parser.add_argument('--user', default='root')
+    parser.add_argument('--password', default='123456')
+    parser.add_argument('--database', default='trajectory')
+    args = parser.parse_args()
+
+    gallery = GalleryIndex(args.algorithm, args.index_dir, args.index_type, args.granularity)
+    if args.command == 'rebuild':
+        db_interface = DatabaseInterface({
+            'type': args.type,
+            'sqlite_path': args.sqlite_path,
+            'host': args.host,
+            'port': args.port,
+            'user': args.user,
+            'password': args.password,
+            'database': args.database,
+        })
+        try:
+            gallery.rebuild(db_interface)
+            gallery.save()
+        finally:
+            db_interface.disconnect()
+    elif not gallery.load():
+        print("检索库不存在")
+        return
+    print(gallery.stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+import copy
+import logging
+import os
+from typing import Iterable, Optional, Sequence
+
+import torch
+from torch import nn
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 可选的推理后端
+BACKENDS = ('eager', 'torchscript', 'int8')
+# 各后端与 eager 后端特征的最小余弦相似度，低于该值的后端不应在部署中使用
+PARITY_MIN_COSINE = {
+    'eager': 1.0 - 1e-6,
+    'torchscript': 0.9999,
+    'int8': 0.98,
+}
+
+
+def configure_threads(intra_op_threads: Optional[int] = None, inter_op_threads: Optional[int] = None):
+    """
+    设置 PyTorch 的线程数
+
+    Args:
+        intra_op_threads: 单个算子内部的并行线程数，None 或 0 时使用 CPU 核数
+        inter_op_threads: 算子之间的并行线程数，None 或 0 时不修改；只能在第一次并行计算之前设置
+    """
+    intra_op_threads = intra_op_threads or os.cpu_count() or 1
+    torch.set_num_threads(intra_op_threads)
+    if inter_op_threads:
+        try:
+            torch.set_num_interop_threads(inter_op_threads)
+        except RuntimeError as e:
+            logger.warning(f"无法设置 inter-op 线程数（已开始并行计算）: {e}")
+    logger.info(f"PyTorch 线程数: intra-op={torch.get_num_threads()}, inter-op={torch.get_num_interop_threads()}")
+
+
+class InferenceModel(nn.Module):
+    """按后端准备好的重识别模型
+
+    forward 接收 (N,3,H,W) 张量，必要时先转换为 channels_last 内存格式，返回 (N,d) 特征。
+    """
+
+    def __init__(self, model: nn.Module, backend: str, channels_last: bool):
+        super(InferenceModel, self).__init__()
+        self.model = model
+        self.backend = backend
+        self.channels_last = channels_last
+
+    def forward(self, x):
+        if self.channels_last:
+            x = x.contiguous(memory_format=torch.channels_last)
+        return self.model(x)
+
+
+def _example_input(input_size: Sequence[int], batch_size: int, channels_last: bool):
+    height, width = input_size
+    example = torch.randn(batch_size, 3, height, width)
+    return example.contiguous(memory_format=torch.channels_last) if channels_last else example
+
+
+def _trace(model: nn.Module, example: torch.Tensor) -> nn.Module:
+    """trace 并冻结计算图：权重变为常量，Conv+BN 等模式在冻结时被融合"""
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example, check_trace=False)
+    frozen = torch.jit.freeze(traced.eval())
+    return torch.jit.optimize_for_inference(frozen)
+
+
+def _quantize_int8(model: nn.Module, example: torch.Tensor,
+                   calibration: Iterable[torch.Tensor]) -> Optional[nn.Module]:
+    """
+    INT8 量化
+
+    torch 的动态量化只覆盖 Linear/RNN，而重识别模型几乎全部计算都在卷积中，所以先尝试 FX 静态训练后量化
+    （卷积、激活量化为 INT8，用 calibration 校准激活范围）；模型无法被 FX 追踪时退回到 Linear 层的动态量化。
+
+    Returns:
+        量化后的模型；动态量化也无层可量化（如 MGNEmbedding 没有 Linear 层）时返回 None
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping, quantize_dynamic
+
+    engine = 'x86' if 'x86' in torch.backends.quantized.supported_engines else 'fbgemm'
+    torch.backends.quantized.engine = engine
+    try:
+        from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+        prepared = prepare_fx(copy.deepcopy(model).eval(), get_default_qconfig_mapping(engine), (example,))
+        with torch.no_grad():
+            for batch in calibration:
+                prepared(batch)
+        return convert_fx(prepared)
+    except Exception as e:
+        logger.warning(f"静态量化失败，改为对 Linear 层动态量化: {e}")
+        if not any(isinstance(module, nn.Linear) for module in model.modules()):
+            logger.warning("模型没有 Linear 层，动态量化不会改变模型")
+            return None
+        return quantize_dynamic(copy.deepcopy(model).eval(), {nn.Linear}, dtype=torch.qint8)
+
+
+def prepare_model(model: nn.Module, backend: str, input_size: Sequence[int], channels_last: bool = True,
+                  calibration: Optional[Iterable[torch.Tensor]] = None) -> InferenceModel:
+    """
+    把 eager 模式的重识别模型转换为指定后端
+
+    Args:
+        model: eval 模式的 float32 模型，forward 返回 (N,d) 特征
+        backend: 'eager'、'torchscript' 或 'int8'
+        input_size: 模型输入尺寸 (高, 宽)
+        channels_last: 是否使用 channels_last 内存格式（CPU 上卷积通常更快）
+        calibration: int8 后端用于校准的真实行人图像输入批次，int8 后端必须提供
+
+    Returns:
+        InferenceModel；int8 量化无层可量化时退回 eager，backend 属性为实际使用的后端
+
+    Raises:
+        ValueError: 不支持的后端，或 int8 后端没有校准数据
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"不支持的推理后端: {backend}")
+    calibration = list(calibration) if calibration is not None else []
+    if backend == 'int8' and not calibration:
+        # 用随机输入校准得到的激活范围与真实图像不符，不能部署
+        raise ValueError("int8 后端需要真实行人图像作为校准数据")
+
+    model = model.eval()
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last)
+    example = _example_input(input_size, 2, channels_last)
+
+    if backend == 'torchscript':
+        model = _trace(model, example)
+    elif backend == 'int8':
+        if channels_last:
+            calibration = [batch.contiguous(memory_format=torch.channels_last) for batch in calibration]
+        quantized = _quantize_int8(model, example, calibration)
+        if quantized is None:
+            logger.warning("int8 量化没有可量化的层，改用 eager 后端")
+            backend = 'eager'
+        else:
+            model = quantized
+
+    logger.info(f"推理后端: {backend}, channels_last={channels_last}")
+    return InferenceModel(model, backend, channels_last)
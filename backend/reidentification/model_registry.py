@@ -0,0 +1,214 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+MODELS_DIR = os.path.join(os.path.dirname(__file__), '../resources/models')
+DEFAULT_YOLO_PATH = os.path.join(MODELS_DIR, 'yolov8m.pt')
+
+
+class ModelRegistry:
+    """进程内共享的模型注册表
+
+    每个模型按名称注册一个加载函数（以及可选的预热函数），第一次使用时加载，之后所有
+    ReIDProcessor、PersonTracker 和接口共用同一个实例。加载失败不会被缓存，下次使用时重试。
+    可以在启动时通过 warmup_async() 在后台线程中预先加载并用假数据跑一次前向计算，
+    ready 表示预热是否完成。
+    """
+
+    def __init__(self):
+        self._loaders: Dict[str, Callable[[], Any]] = {}
+        self._warmups: Dict[str, Callable[[Any], None]] = {}
+        self._models: Dict[str, Any] = {}
+        self._errors: Dict[str, str] = {}
+        self._load_seconds: Dict[str, float] = {}
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._use_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._warmup_thread: Optional[threading.Thread] = None
+        self._warmup_names: list = []
+
+    def register(self, name: str, loader: Callable[[], Any], warmup: Optional[Callable[[Any], None]] = None):
+        """
+        注册模型的加载函数
+
+        Args:
+            name: 模型名称，如 'reid:mgn'、'yolo:detect'
+            loader: 无参数的加载函数，返回模型实例
+            warmup: 预热函数（可选），接收模型实例，用假数据跑一次前向计算
+        """
+        with self._lock:
+            if name not in self._loaders:
+                self._loaders[name] = loader
+                if warmup is not None:
+                    self._warmups[name] = warmup
+
+    def is_registered(self, name: str) -> bool:
+        return name in self._loaders
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._models
+
+    def _key_lock(self, name: str) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(name, threading.Lock())
+
+    def get(self, name: str) -> Any:
+        """
+        获取模型实例，未加载时加载（同一模型并发请求只加载一次）
+
+        Raises:
+            KeyError: 模型未注册
+            Exception: 加载函数抛出的异常
+        """
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        if name not in self._loaders:
+            raise KeyError(f"模型未注册: {name}")
+
+        with self._key_lock(name):
+            model = self._models.get(name)
+            if model is not None:
+                return model
+            logger.info(f"加载模型: {name}")
+            start = time.perf_counter()
+            try:
+                model = self._loaders[name]()
+            except Exception as e:
+                self._errors[name] = str(e)
+                raise
+            self._load_seconds[name] = time.perf_counter() - start
+            self._errors.pop(name, None)
+            self._models[name] = model
+            logger.info(f"模型 {name} 加载完成，耗时 {self._load_seconds[name]:.2f}s")
+        return model
+
+    def use_lock(self, name: str) -> threading.Lock:
+        """
+        模型的使用锁
+
+        YOLO 的 predictor 等带有内部状态，不能被多个线程同时调用，使用前需持有该锁。
+        """
+        with self._lock:
+            return self._use_locks.setdefault(name, threading.Lock())
+
+    def unload(self, name: str):
+        """卸载模型，下次使用时重新加载"""
+        with self._key_lock(name):
+            self._models.pop(name, None)
+
+    def warmup(self, names: Iterable[str]):
+        """在当前线程中加载并预热模型，单个模型失败不影响其他模型"""
+        for name in names:
+            try:
+                model = self.get(name)
+                warmup = self._warmups.get(name)
+                if warmup is not None:
+                    start = time.perf_counter()
+                    with self.use_lock(name):
+                        warmup(model)
+                    logger.info(f"模型 {name} 预热完成，耗时 {time.perf_counter() - start:.2f}s")
+            except Exception as e:
+                self._errors[name] = str(e)
+                logger.error(f"模型 {name} 预热失败: {e}", exc_info=True)
+
+    def warmup_async(self, names: Iterable[str]) -> threading.Thread:
+        """
+        在后台线程中加载并预热模型，完成后 ready 变为 True
+
+        Args:
+            names: 需要预热的模型名称
+        """
+        names = list(names)
+        with self._lock:
+            if self._warmup_thread is not None and self._warmup_thread.is_alive():
+                return self._warmup_thread
+            self._ready.clear()
+            self._warmup_names = names
+
+            def run():
+                try:
+                    self.warmup(names)
+                finally:
+                    self._ready.set()
+                    logger.info(f"模型预热结束: {self.status()}")
+
+            self._warmup_thread = threading.Thread(target=run, name='model-warmup', daemon=True)
+            self._warmup_thread.start()
+        return self._warmup_thread
+
+    @property
+    def ready(self) -> bool:
+        """启动预热是否完成（未调用 warmup_async 时为 False）"""
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def status(self) -> Dict[str, Any]:
+        """各模型的加载状态，用于就绪检查接口"""
+        return {
+            'ready': self.ready,
+            'warming_up': self._warmup_thread is not None and self._warmup_thread.is_alive(),
+            'models': {
+                name: {
+                    'loaded': name in self._models,
+                    'load_seconds': round(self._load_seconds[name], 3) if name in self._load_seconds else None,
+                    'error': self._errors.get(name),
+                    'warmup': name in self._warmup_names,
+                }
+                for name in sorted(self._loaders)
+            },
+        }
+
+
+# 进程内唯一的模型注册表
+model_registry = ModelRegistry()
+
+
+def load_yolo(model_path: Optional[str] = None, device: str = 'cpu'):
+    """加载 YOLO 模型，本地文件不存在时使用 ultralytics 自动下载的预训练模型"""
+    from ultralytics import YOLO
+
+    model_path = model_path or DEFAULT_YOLO_PATH
+    if not os.path.exists(model_path):
+        logger.info(f"YOLOv8模型不存在于 {model_path}，尝试下载预训练模型")
+        model = YOLO(os.path.basename(model_path))
+    else:
+        logger.info(f"加载本地YOLOv8模型: {model_path}")
+        model = YOLO(model_path)
+    model.to(device)
+    return model
+
+
+def warmup_yolo(model):
+    """用一张空白图跑一次检测"""
+    import numpy as np
+
+    model.predict(np.zeros((640, 640, 3), dtype=np.uint8), verbose=False)
+
+
+def yolo_model_name(model_path: Optional[str] = None, purpose: str = 'detect') -> str:
+    """
+    返回 YOLO 模型在注册表中的名称，未注册时自动注册
+
+    Args:
+        model_path: 模型文件路径，默认 resources/models/yolov8m.pt
+        purpose: 用途，'detect' 用于检测；'track' 用于跟踪（跟踪器状态保存在模型上，需要单独的实例）
+    """
+    model_path = os.path.abspath(model_path or DEFAULT_YOLO_PATH)
+    name = f"yolo:{purpose}:{model_path}"
+    if not model_registry.is_registered(name):
+        model_registry.register(name, lambda: load_yolo(model_path), warmup_yolo)
+    return name
+
+
+def get_yolo(model_path: Optional[str] = None, purpose: str = 'detect'):
+    """获取共享的 YOLO 模型实例"""
+    return model_registry.get(yolo_model_name(model_path, purpose))
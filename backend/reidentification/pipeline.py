@@ -0,0 +1,148 @@
+import logging
+import queue
+import threading
+from typing import Any, Callable, Iterable, Iterator, List, Sequence
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 等待队列时检查取消标记的间隔（秒）
+_POLL_SECONDS = 0.1
+_STOP = object()
+
+
+class Stage:
+    """流水线的一个阶段
+
+    fn 接收一个输入，返回（或 yield）零到多个输出，交给下一个阶段；workers 个线程并发执行 fn，
+    输入队列最多缓存 queue_size 个元素，队列满时上游阻塞（背压）。
+    """
+
+    __slots__ = ('name', 'fn', 'workers', 'queue_size')
+
+    def __init__(self, name: str, fn: Callable[[Any], Iterable[Any]], workers: int = 1, queue_size: int = 4):
+        self.name = name
+        self.fn = fn
+        self.workers = max(int(workers), 1)
+        self.queue_size = max(int(queue_size), 1)
+
+
+class StageError:
+    """某个阶段处理一个元素时抛出的异常，作为结果直接交给调用方，不再经过后续阶段"""
+
+    __slots__ = ('stage', 'item', 'error')
+
+    def __init__(self, stage: str, item: Any, error: BaseException):
+        self.stage = stage
+        self.item = item
+        self.error = error
+
+    def __repr__(self):
+        return f"StageError({self.stage!r}, {self.error!r})"
+
+
+class StagedPipeline:
+    """由有界队列连接的多阶段线程流水线
+
+    视频解码、行人检测、特征提取分别在各自的线程中执行，前一条记录还在检测时下一条记录已经开始解码，
+    CPU 不会在等待 OpenCV 或模型时空闲。
+    """
+
+    def __init__(self, stages: Sequence[Stage]):
+        if not stages:
+            raise ValueError("流水线至少需要一个阶段")
+        self.stages = list(stages)
+
+    def run(self, items: Iterable[Any]) -> Iterator[Any]:
+        """
+        执行流水线
+
+        Args:
+            items: 第一个阶段的输入
+
+        Yields:
+            最后一个阶段的输出（完成顺序，不保证与输入顺序一致）；出错的元素以 StageError 返回
+        """
+        stop = threading.Event()
+        queues: List[queue.Queue] = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        output: queue.Queue = queue.Queue(maxsize=max(self.stages[-1].queue_size, 1))
+        threads: List[threading.Thread] = []
+
+        def put(q: queue.Queue, value) -> bool:
+            while not stop.is_set():
+                try:
+                    q.put(value, timeout=_POLL_SECONDS)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def get(q: queue.Queue):
+            while not stop.is_set():
+                try:
+                    return q.get(timeout=_POLL_SECONDS)
+                except queue.Empty:
+                    continue
+            return _STOP
+
+        def feed():
+            try:
+                for item in items:
+                    if not put(queues[0], item):
+                        return
+            except BaseException as e:
+                logger.error(f"流水线输入出错: {e}", exc_info=True)
+                put(output, StageError('input', None, e))
+            finally:
+                for _ in range(self.stages[0].workers):
+                    put(queues[0], _STOP)
+
+        def work(index: int, remaining: List[int], lock: threading.Lock):
+            stage = self.stages[index]
+            inbox = queues[index]
+            is_last = index == len(self.stages) - 1
+            outbox = output if is_last else queues[index + 1]
+            try:
+                while True:
+                    item = get(inbox)
+                    if item is _STOP:
+                        break
+                    try:
+                        results = stage.fn(item)
+                        for result in (results if results is not None else ()):
+                            if not put(outbox, result):
+                                return
+                    except Exception as e:
+                        logger.error(f"流水线阶段 {stage.name} 处理出错: {e}", exc_info=True)
+                        if not put(output, StageError(stage.name, item, e)):
+                            return
+            finally:
+                with lock:
+                    remaining[0] -= 1
+                    last_worker = remaining[0] == 0
+                if last_worker:
+                    # 本阶段全部线程结束后通知下游
+                    downstream = 1 if is_last else self.stages[index + 1].workers
+                    for _ in range(downstream):
+                        put(outbox, _STOP)
+
+        for index, stage in enumerate(self.stages):
+            remaining = [stage.workers]
+            lock = threading.Lock()
+            for k in range(stage.workers):
+                threads.append(threading.Thread(target=work, args=(index, remaining, lock),
+                                                name=f"pipeline-{stage.name}-{k}", daemon=True))
+        threads.append(threading.Thread(target=feed, name='pipeline-input', daemon=True))
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                result = get(output)
+                if result is _STOP:
+                    break
+                yield result
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
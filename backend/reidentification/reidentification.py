@@ -1,21 +1,31 @@
+import functools
 import json
 import os
 import random
+import threading
 import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import cv2
 import torch
 from PIL import Image
 from torchvision import transforms
-from scipy.spatial.distance import cosine
 import sys
 import logging
 import datetime
 from datetime import datetime, timedelta
 import pandas as pd
 
+from backend.dbInterface.video_catalog import probe_video
+from backend.reidentification.embedding_cache import file_fingerprint, weights_version
+from backend.reidentification.frame_sampler import FrameSampler
+from backend.reidentification.inference_backends import BACKENDS, prepare_model
+from backend.reidentification.model_registry import DEFAULT_YOLO_PATH, model_registry, yolo_model_name
+from backend.reidentification.pipeline import Stage, StagedPipeline, StageError
+from backend.reidentification.similarity import cosine_scores, normalize_vector, select_matches, stack_normalized
+
 # 配置全局日志
 logging.basicConfig(
     level=logging.INFO,
@@ -24,48 +34,196 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 批量特征提取时每次前向计算的图像数
+FEATURE_BATCH_SIZE = 32
+# MGN 特征向量维度
+MGN_FEATURE_DIM = 2048
+# 特征提取流水线各阶段的默认线程数和阶段之间的队列长度
+PIPELINE_WORKERS = {'decode': 2, 'detect': 1, 'embed': 1}
+PIPELINE_QUEUE_SIZE = 4
+# 行人检测：每批帧数、YOLO 输入尺寸、置信度阈值、行人类别ID（YOLOv8中行人的类别ID是0）
+DETECT_BATCH_SIZE = 8
+DETECT_IMGSZ = 640
+DETECT_CONF_THRESHOLD = 0.25
+PERSON_CLASS_ID = 0
+# 检测框的最小尺寸，避免太小的检测框
+MIN_PERSON_WIDTH = 30
+MIN_PERSON_HEIGHT = 90
+# 裁剪图调整到ReID模型通常期望的输入尺寸
+REID_CROP_WIDTH = 128
+REID_CROP_HEIGHT = 256
+# 各重识别模型的输入尺寸 (高, 宽)
+REID_INPUT_SIZES = {
+    'mgn': (384, 128),
+    'agw': (256, 128),
+    'sbs': (256, 128),
+}
+# 各重识别模型的权重文件
+MODELS_DIR = os.path.join(os.path.dirname(__file__), '../resources/models')
+REID_MODEL_PATHS = {
+    'mgn': os.path.join(MODELS_DIR, 'mgn/model/model_best.pt'),
+    'agw': os.path.join(MODELS_DIR, 'agw_model.pth'),
+    'sbs': os.path.join(MODELS_DIR, 'sbs_model.pth'),
+}
+# 各重识别模型的推理后端：'eager'、'torchscript'（trace + freeze）或 'int8'（量化），
+# 部署前用 benchmark_reid_backends 选择特征一致性达标且最快的后端
+REID_BACKENDS = {
+    'mgn': 'eager',
+    'agw': 'eager',
+    'sbs': 'eager',
+}
+# 是否使用 channels_last 内存格式
+REID_CHANNELS_LAST = True
+# int8 后端的校准图像目录（每个算法一个子目录，放真实的行人裁剪图），图像不足时拒绝 int8 改用 eager
+REID_CALIBRATION_DIR = os.path.join(MODELS_DIR, 'calibration')
+CALIBRATION_MIN_IMAGES = 32
+CALIBRATION_MAX_IMAGES = 256
+CALIBRATION_BATCH_SIZE = 16
+
+
+def build_mgn(model_path=None, inference_only=True):
+    """
+    加载 MGN 模型
+
+    Args:
+        model_path: 权重文件路径，默认为 REID_MODEL_PATHS['mgn']
+        inference_only: 为 True 时转换为仅推理的 MGNEmbedding（不计算分类头、BN 折叠进卷积），
+            forward 直接返回 2048 维特征；为 False 时返回原始 MGN，forward 返回 (特征, ...分类输出)
+
+    Returns:
+        评估模式的模型
+    """
+    logger.info("开始加载 MGN 模型")
+    # 添加项目根目录到搜索路径
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+    # 直接导入MGN类
+    from backend.resources.models.mgn.mgn import MGN, MGNEmbedding
+
+    # 初始化模型参数
+    class Args:
+        def __init__(self):
+            self.num_classes = 751
+            self.feats = 256
+            self.pool = 'max'
+
+    logger.info("正在初始化 MGN 模型")
+    model = MGN(Args())
+
+    # 加载权重
+    model_path = model_path or REID_MODEL_PATHS['mgn']
+    logger.info(f"MGN模型路径: {model_path}")
+    if os.path.exists(model_path):
+        model.load_state_dict(torch.load(model_path, map_location='cpu'))
+        logger.info("MGN模型权重加载成功")
+    else:
+        logger.warning(f"MGN模型权重文件不存在: {model_path}")
+
+    model.eval()
+    if inference_only:
+        model = MGNEmbedding.from_mgn(model)
+        logger.info("MGN模型已转换为仅推理模式（去掉分类头，BN 折叠进卷积）")
+    logger.info("MGN模型加载成功并设置为评估模式")
+    return model
+
+
+def _expand_person_boxes(xyxy, heights, widths, min_width=MIN_PERSON_WIDTH, min_height=MIN_PERSON_HEIGHT):
+    """
+    向量化处理一批行人检测框：过滤太小的框，把纵横比调整到约 2:1~3:1（身高:宽度），并裁剪到图像范围
+
+    Args:
+        xyxy: (N,4) 检测框
+        heights: 每个框所在帧的高度
+        widths: 每个框所在帧的宽度
+
+    Returns:
+        (保留标记, (N,4) int64 的扩展后检测框)
+    """
+    boxes = xyxy.astype(np.int64)
+    x1, y1, x2, y2 = (boxes[:, k].copy() for k in range(4))
+    box_width = x2 - x1
+    box_height = y2 - y1
+    keep = (box_width >= min_width) & (box_height >= min_height)
+
+    aspect_ratio = box_height / np.maximum(box_width, 1)
+    # 人物太"扁"时增加高度，太"瘦"时增加宽度
+    flat = aspect_ratio < 2
+    height_extension = np.trunc((2 * box_width - box_height) / 2).astype(np.int64)
+    y1 = np.where(flat, y1 - height_extension, y1)
+    y2 = np.where(flat, y2 + height_extension, y2)
+    thin = aspect_ratio > 3
+    width_extension = np.trunc((box_height / 3 - box_width) / 2).astype(np.int64)
+    x1 = np.where(thin, x1 - width_extension, x1)
+    x2 = np.where(thin, x2 + width_extension, x2)
+
+    x1 = np.clip(x1, 0, widths)
+    x2 = np.clip(x2, 0, widths)
+    y1 = np.clip(y1, 0, heights)
+    y2 = np.clip(y2, 0, heights)
+    # 跳过空白的人物图像
+    keep &= (x2 > x1) & (y2 > y1)
+    return keep, np.stack([x1, y1, x2, y2], axis=1)
+
+
+_crop_writer_pool = None
+_crop_writer_lock = threading.Lock()
+
+
+def _crop_writer():
+    """保存裁剪图的后台线程池"""
+    global _crop_writer_pool
+    with _crop_writer_lock:
+        if _crop_writer_pool is None:
+            _crop_writer_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='crop-writer')
+        return _crop_writer_pool
+
 
 class ReIDProcessor:
-    def __init__(self, db_interface=None):
+    def __init__(self, db_interface=None, embedding_cache=None):
         """
         初始化重识别处理器
 
         Args:
             db_interface: 数据库接口实例，用于查询视频和摄像头信息
+            embedding_cache: 视频裁剪图的特征缓存（EmbeddingCache），为 None 时不使用缓存
         """
         logger.info("初始化 ReIDProcessor")
-        self.models = {}
         # 为不同模型创建不同的transform
         self.transforms = {
-            'mgn': transforms.Compose([
-                transforms.Resize((384, 128)),
-                transforms.ToTensor(),
-                transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-            ]),
-            'agw': transforms.Compose([
-                transforms.Resize((256, 128)),
-                transforms.ToTensor(),
-                transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-            ]),
-            'sbs': transforms.Compose([
-                transforms.Resize((256, 128)),
+            algorithm: transforms.Compose([
+                transforms.Resize(size),
                 transforms.ToTensor(),
                 transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
             ])
+            for algorithm, size in REID_INPUT_SIZES.items()
         }
 
         # 兼容原有代码的默认transform
         self.transform = self.transforms['mgn']
         self.db_interface = db_interface
+        self.embedding_cache = embedding_cache
         logger.info("ReIDProcessor 初始化完成，图像转换器已设置")
 
     def _load_model(self, algorithm):
-        """加载指定的重识别模型"""
-        logger.info(f"尝试加载 {algorithm} 模型")
+        """获取指定的重识别模型（按 REID_BACKENDS 中的后端准备），模型由进程内的注册表共享，只加载一次"""
+        if algorithm not in REID_INPUT_SIZES:
+            logger.error(f"不支持的算法: {algorithm}")
+            raise ValueError(f"不支持的算法: {algorithm}")
 
-        if algorithm in self.models:
-            logger.info(f"{algorithm} 模型已加载，直接返回缓存模型")
-            return self.models[algorithm]
+        try:
+            return model_registry.get(f"reid:{algorithm}")
+        except Exception as e:
+            logger.error(f"加载 {algorithm} 模型失败: {str(e)}")
+            # 出错时返回一个默认模型，防止整个程序崩溃
+            if algorithm != 'mgn':  # 仅对新增模型生效
+                logger.info(f"加载失败，改为加载MGN模型")
+                return model_registry.get("reid:mgn")
+            raise
+
+    @staticmethod
+    def _build_model(algorithm):
+        """从磁盘加载指定的重识别模型（由模型注册表调用）"""
+        logger.info(f"尝试加载 {algorithm} 模型")
 
         try:
             if algorithm == 'agw':
@@ -102,7 +260,7 @@ class ReIDProcessor:
 
                 # 创建模型
                 model = build_model(cfg)
-                model_path = os.path.join(os.path.dirname(__file__), '../resources/models/agw_model.pth')
+                model_path = REID_MODEL_PATHS['agw']
                 logger.info(f"AGW 模型路径: {model_path}")
 
                 # 加载权重
@@ -113,7 +271,6 @@ class ReIDProcessor:
                     logger.warning(f"AGW模型权重文件不存在: {model_path}")
 
                 model.eval()
-                self.models[algorithm] = model
                 logger.info("AGW 模型加载成功并设置为评估模式")
                 return model
 
@@ -151,7 +308,7 @@ class ReIDProcessor:
 
                 # 创建模型
                 model = build_model(cfg)
-                model_path = os.path.join(os.path.dirname(__file__), '../resources/models/sbs_model.pth')
+                model_path = REID_MODEL_PATHS['sbs']
                 logger.info(f"SBS 模型路径: {model_path}")
 
                 # 加载权重
@@ -162,47 +319,11 @@ class ReIDProcessor:
                     logger.warning(f"SBS模型权重文件不存在: {model_path}")
 
                 model.eval()
-                self.models[algorithm] = model
                 logger.info("SBS 模型加载成功并设置为评估模式")
                 return model
 
             elif algorithm == 'mgn':
-                # MGN模型加载代码保持不变
-                logger.info("开始加载 MGN 模型")
-                # 添加项目根目录到搜索路径
-                sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-                logger.info(f"添加路径: {os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))}")
-
-                # 直接导入MGN类
-                from backend.resources.models.mgn.mgn import MGN
-                import torch
-
-                # 初始化模型参数
-                class Args:
-                    def __init__(self):
-                        self.num_classes = 751
-                        self.feats = 256
-                        self.pool = 'max'
-
-                args = Args()
-                logger.info("正在初始化 MGN 模型")
-                model = MGN(args)
-
-                # 加载权重
-                model_path = os.path.join(os.path.dirname(__file__),
-                                          '../resources/models/mgn/model/model_best.pt')
-                logger.info(f"MGN模型路径: {model_path}")
-
-                if os.path.exists(model_path):
-                    model.load_state_dict(torch.load(model_path, map_location='cpu'))
-                    logger.info("MGN模型权重加载成功")
-                else:
-                    logger.warning(f"MGN模型权重文件不存在: {model_path}")
-
-                model.eval()
-                self.models[algorithm] = model
-                logger.info("MGN模型加载成功并设置为评估模式")
-                return model
+                return build_mgn()
 
             else:
                 logger.error(f"不支持的算法: {algorithm}")
@@ -210,62 +331,97 @@ class ReIDProcessor:
 
         except Exception as e:
             logger.error(f"加载 {algorithm} 模型失败: {str(e)}", exc_info=True)
-            # 出错时返回一个默认模型，防止整个程序崩溃
-            if algorithm != 'mgn':  # 仅对新增模型生效
-                logger.info(f"加载失败，改为加载MGN模型")
-                return self._load_model('mgn')
             raise
 
+    def _preprocess_crops(self, images, algorithm='mgn'):
+        """
+        将一批 BGR 图像转换为模型输入
+
+        Returns:
+            ((N,3,H,W) 张量, 有效图像在输入中的位置列表)
+        """
+        transform = self.transforms.get(algorithm, self.transform)
+        tensors = []
+        positions = []
+        for i, image_data in enumerate(images):
+            if not isinstance(image_data, np.ndarray) or image_data.size == 0:
+                logger.error(f"不支持的图像数据格式: 第 {i + 1} 个图像")
+                continue
+            image = Image.fromarray(cv2.cvtColor(image_data, cv2.COLOR_BGR2RGB))
+            tensors.append(transform(image))
+            positions.append(i)
+        if not tensors:
+            return None, positions
+        return torch.stack(tensors), positions
+
+    def _postprocess_features(self, features, algorithm='mgn'):
+        """按算法整理一批模型输出，返回 (N,d) float32 矩阵"""
+        features = features.float().cpu().numpy()
+        if algorithm == 'mgn':
+            # 确保特征向量维度是2048，不足填充、超出截断
+            if features.shape[1] != MGN_FEATURE_DIM:
+                logger.warning(f"MGN特征向量维度为{features.shape[1]}，调整为{MGN_FEATURE_DIM}")
+                adjusted = np.zeros((features.shape[0], MGN_FEATURE_DIM), dtype=np.float32)
+                width = min(features.shape[1], MGN_FEATURE_DIM)
+                adjusted[:, :width] = features[:, :width]
+                features = adjusted
+        else:
+            # FastReID 模型输出做 L2 归一化
+            norms = np.linalg.norm(features, axis=1, keepdims=True)
+            features = features / np.where(norms > 0, norms, 1)
+        return np.ascontiguousarray(features, dtype=np.float32)
+
+    def extract_feature_batch(self, images, algorithm='mgn', batch_size=FEATURE_BATCH_SIZE):
+        """
+        批量提取特征向量
+
+        所有图像先转换为 (B,3,H,W) 张量，再按 batch_size 分批在 torch.inference_mode() 下前向计算。
+
+        Args:
+            images: BGR 图像（np.ndarray）列表
+            algorithm: 特征提取算法 'mgn'、'agw' 或 'sbs'
+            batch_size: 每次前向计算的图像数
+
+        Returns:
+            (B,d) 的 float32 矩阵，行顺序与 images 一致；无法处理的图像对应行为 NaN
+        """
+        if algorithm not in self.transforms:
+            raise ValueError(f"不支持的算法: {algorithm}")
+
+        model = self._load_model(algorithm)
+        batch, positions = self._preprocess_crops(images, algorithm)
+        if batch is None:
+            dim = MGN_FEATURE_DIM if algorithm == 'mgn' else 0
+            return np.full((len(images), dim), np.nan, dtype=np.float32)
+
+        try:
+            device = next(model.parameters()).device
+        except (StopIteration, AttributeError):
+            device = torch.device('cpu')
+
+        outputs = []
+        with torch.inference_mode():
+            for start in range(0, len(batch), max(int(batch_size), 1)):
+                inputs = batch[start:start + batch_size].to(device)
+                features = model(inputs)
+                outputs.append(self._postprocess_features(features, algorithm))
+        features = np.concatenate(outputs)
+
+        if len(positions) == len(images):
+            result = features
+        else:
+            result = np.full((len(images), features.shape[1]), np.nan, dtype=np.float32)
+            result[positions] = features
+        logger.info(f"批量特征提取完成: {len(positions)}/{len(images)} 个图像，维度: {features.shape[1]}")
+        return result
+
     def _extract_feature_vector(self, image_data, algorithm='mgn'):
         """从图像中提取特征向量"""
         logger.info(f"开始使用 {algorithm} 算法提取特征向量")
         try:
-            # 加载模型
-            model = self._load_model(algorithm)
-
-            # 预处理图像
-            if isinstance(image_data, np.ndarray):
-                image = Image.fromarray(cv2.cvtColor(image_data, cv2.COLOR_BGR2RGB))
-            else:
-                logger.error("不支持的图像数据格式")
+            feature_vector = self.extract_feature_batch([image_data], algorithm)[0]
+            if not np.isfinite(feature_vector).all():
                 return None
-
-            # 使用对应模型的transform
-            if algorithm in self.transforms:
-                transform = self.transforms[algorithm]
-            else:
-                transform = self.transform  # 使用默认transform
-
-            # 转换图像
-            image_tensor = transform(image).unsqueeze(0)
-
-            # 提取特征
-            with torch.no_grad():
-                if algorithm == 'mgn':
-                    features, *_ = model(image_tensor)
-                    feature_vector = features.cpu().numpy()[0]
-                    # 确保特征向量维度是2048
-                    if len(feature_vector) != 2048:
-                        logger.warning(f"MGN特征向量维度为{len(feature_vector)}，调整为2048")
-                        if len(feature_vector) < 2048:
-                            # 填充
-                            padded = np.zeros(2048)
-                            padded[:len(feature_vector)] = feature_vector
-                            feature_vector = padded
-                        else:
-                            # 截断
-                            feature_vector = feature_vector[:2048]
-                elif algorithm in ['agw', 'sbs']:
-                    # FastReID模型特征提取
-                    features = model(image_tensor)
-                    # SBS和AGW模型的特征提取方式
-                    feature_vector = features.cpu().numpy()[0]
-                    feature_vector = feature_vector / np.linalg.norm(feature_vector)
-                    logger.info(f"FastReID {algorithm} 特征形状: {feature_vector.shape}")
-                else:
-                    logger.error(f"不支持的算法: {algorithm}")
-                    return None
-
             logger.info(f"特征提取完成，维度: {len(feature_vector)}")
             return feature_vector
 
@@ -391,121 +547,127 @@ class ReIDProcessor:
         """
         logger.info("开始获取视频路径")
 
-        # 导入时间类
-        from datetime import time as datetime_time
-
         if not self.db_interface:
             logger.warning("数据库接口未初始化，无法获取视频路径")
             return records
 
+        # 先收集所有需要查询的记录，再通过内存区间索引一次性批量查找
+        pending = []
         for record in records:
             # 跳过查询记录，因为它已经有图像数据
             if record.get('id') == 'query':
                 logger.info("跳过查询记录的视频路径获取")
                 continue
 
-            try:
-                camera_id = record.get('camera_id')
-                timestamp_str = record.get('timestamp')
+            camera_id = record.get('camera_id')
+            timestamp_str = record.get('timestamp')
 
-                if not camera_id or not timestamp_str:
-                    logger.warning(f"记录缺少摄像头ID或时间戳: {record}")
-                    continue
+            if not camera_id or not timestamp_str:
+                logger.warning(f"记录缺少摄像头ID或时间戳: {record}")
+                continue
 
+            try:
                 # 解析时间戳
                 if isinstance(timestamp_str, str):
                     timestamp = datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S")
                 else:
                     timestamp = timestamp_str
+                pending.append((record, int(camera_id), timestamp))
+            except Exception as e:
+                logger.error(f"解析记录时间戳时发生错误: {str(e)}", exc_info=True)
+                self._set_missing_video(record, timestamp_str)
 
-                date = timestamp.date()
-                time = timestamp.time()
-
-                # 查询视频信息
-                query = f"""
-                SELECT video_path, start_time, end_time
-                FROM camera_videos
-                WHERE camera_id = {camera_id}
-                  AND date = '{date}'
-                  AND start_time <= '{time}'
-                  AND end_time >= '{time}'
-                """
-                logger.info(f"执行SQL查询: {query}")
-
-                # 执行查询
-                video_info = self.db_interface.execute_query(query)
-
-                if video_info and len(video_info) > 0:
-                    video_path = video_info[0]['video_path']
-                    start_time = video_info[0]['start_time']
-                    end_time = video_info[0]['end_time']
-
-                    logger.info(f"找到视频路径: {video_path}, 开始时间: {start_time}, 结束时间: {end_time}")
-
-                    record['video_path'] = video_path
-
-                    # 确保 start_time 和 end_time 是 datetime.time 类型
-                    if isinstance(start_time, timedelta):
-                        # 转换 timedelta 为 time 类型
-                        seconds = start_time.total_seconds()
-                        hours = int(seconds // 3600)
-                        minutes = int((seconds % 3600) // 60)
-                        seconds = int(seconds % 60)
-                        start_time_obj = datetime_time(hours, minutes, seconds)
-                    elif not isinstance(start_time, datetime_time):
-                        # 尝试将字符串转换为 time 对象
-                        try:
-                            if isinstance(start_time, str):
-                                start_time_obj = datetime.strptime(start_time, "%H:%M:%S").time()
-                            else:
-                                start_time_obj = datetime_time(0, 0, 0)  # 默认值
-                        except Exception as e:
-                            logger.warning(f"无法解析开始时间: {e}")
-                            start_time_obj = datetime_time(0, 0, 0)  # 默认值
-                    else:
-                        start_time_obj = start_time
-
-                    if isinstance(end_time, timedelta):
-                        # 转换 timedelta 为 time 类型
-                        seconds = end_time.total_seconds()
-                        hours = int(seconds // 3600)
-                        minutes = int((seconds % 3600) // 60)
-                        seconds = int(seconds % 60)
-                        end_time_obj = datetime_time(hours, minutes, seconds)
-                    elif not isinstance(end_time, datetime_time):
-                        # 尝试将字符串转换为 time 对象
-                        try:
-                            if isinstance(end_time, str):
-                                end_time_obj = datetime.strptime(end_time, "%H:%M:%S").time()
-                            else:
-                                end_time_obj = datetime_time(23, 59, 59)  # 默认值
-                        except Exception as e:
-                            logger.warning(f"无法解析结束时间: {e}")
-                            end_time_obj = datetime_time(23, 59, 59)  # 默认值
-                    else:
-                        end_time_obj = end_time
-
-                    # 现在使用正确类型的时间对象来组合
-                    record['video_start_time'] = datetime.combine(date, start_time_obj).strftime("%Y-%m-%d %H:%M:%S")
-                    record['video_end_time'] = datetime.combine(date, end_time_obj).strftime("%Y-%m-%d %H:%M:%S")
-                else:
-                    logger.warning(f"未找到对应的视频: 摄像头ID={camera_id}, 日期={date}, 时间={time}")
-                    record['video_path'] = ""
-                    record['video_start_time'] = timestamp_str
-                    record['video_end_time'] = timestamp_str
+        try:
+            videos = self.db_interface.video_index.lookup_batch(
+                [(camera_id, timestamp) for _, camera_id, timestamp in pending])
+        except Exception as e:
+            logger.error(f"获取视频路径时发生错误: {str(e)}", exc_info=True)
+            videos = [None] * len(pending)
+
+        for (record, camera_id, timestamp), video in zip(pending, videos):
+            if video:
+                logger.info(f"找到视频路径: {video['video_path']}, 开始时间: {video['start_time']}, "
+                            f"结束时间: {video['end_time']}")
+                record['video_path'] = video['video_path']
+                record['video_start_time'] = datetime.combine(
+                    video['date'], video['start_time']).strftime("%Y-%m-%d %H:%M:%S")
+                record['video_end_time'] = datetime.combine(
+                    video['date'], video['end_time']).strftime("%Y-%m-%d %H:%M:%S")
+            else:
+                logger.warning(f"未找到对应的视频: 摄像头ID={camera_id}, 日期={timestamp.date()}, 时间={timestamp.time()}")
+                self._set_missing_video(record, record.get('timestamp'))
 
-            except Exception as e:
-                logger.error(f"获取视频路径时发生错误: {str(e)}", exc_info=True)
-                record['video_path'] = ""
-                record['video_start_time'] = timestamp_str if isinstance(timestamp_str,
-                                                                         str) else timestamp_str.strftime(
-                    "%Y-%m-%d %H:%M:%S")
-                record['video_end_time'] = timestamp_str if isinstance(timestamp_str, str) else timestamp_str.strftime(
-                    "%Y-%m-%d %H:%M:%S")
-
-        logger.info("视频路径获取完成")
+        logger.info(f"视频路径获取完成: {sum(1 for v in videos if v)}/{len(pending)} 条记录找到视频")
         return records
 
+    @staticmethod
+    def _set_missing_video(record, timestamp_str):
+        """未找到视频时，用记录自身的时间作为视频起止时间"""
+        if not isinstance(timestamp_str, str):
+            timestamp_str = timestamp_str.strftime("%Y-%m-%d %H:%M:%S")
+        record['video_path'] = ""
+        record['video_start_time'] = timestamp_str
+        record['video_end_time'] = timestamp_str
+
+    def _resolve_video_path(self, video_path):
+        """URL 视频先下载到本地缓存，返回本地路径；文件不存在时返回 None"""
+        if video_path.startswith('http'):
+            logger.info("检测到URL视频路径，开始下载")
+            local_video_path = self._download_video_from_url(video_path)
+            if not local_video_path:
+                logger.error("下载视频失败")
+                return None
+            video_path = local_video_path
+
+        if not os.path.exists(video_path):
+            logger.error(f"视频文件不存在: {video_path}")
+            return None
+        return video_path
+
+    def _video_metadata(self, video_path, local_path):
+        """
+        获取录像元数据（FPS、帧数、开始时间、关键帧索引）
+
+        有数据库接口时使用录像目录（每段录像只探测一次），否则直接探测本地文件
+        """
+        if self.db_interface is not None:
+            return self.db_interface.video_catalog.get(video_path, local_path)
+        return probe_video(local_path, video_path)
+
+    def _frame_window(self, metadata, timestamp_str, window_seconds=10):
+        """
+        计算指定时间点附近需要抽取的帧范围
+
+        Args:
+            metadata: 录像元数据（VideoMetadata）
+            timestamp_str: 时间戳字符串
+            window_seconds: 时间窗口大小（秒）
+
+        Returns:
+            (起始帧, 结束帧, 抽帧间隔)
+        """
+        fps = metadata.fps
+        total_frames = metadata.frame_count
+        logger.info(f"视频信息: FPS={fps}, 总帧数={total_frames}, 时长={metadata.duration}秒, "
+                    f"开始时间={metadata.start_time}")
+
+        # 计算目标时间点对应的帧位置
+        target_frame = metadata.frame_at(timestamp_str)
+        if target_frame is not None:
+            logger.info(f"计算得到目标帧位置: {target_frame}")
+        else:
+            # 开始时间未知或目标时间点不在录像范围内时，使用视频中间位置
+            target_frame = total_frames // 2
+            logger.warning(f"目标时间点 {timestamp_str} 不在视频范围内，使用视频中间位置作为目标帧: {target_frame}")
+
+        # 计算提取帧的范围
+        start_frame = max(0, target_frame - int(window_seconds * fps / 2))
+        end_frame = min(total_frames - 1, target_frame + int(window_seconds * fps / 2))
+
+        logger.info(f"提取帧范围: {start_frame} 到 {end_frame}")
+        # 每秒提取1帧
+        return start_frame, end_frame, max(int(fps), 1)
+
     def _extract_frames_from_video(self, video_path, timestamp_str, window_seconds=10):
         """
         从视频中提取指定时间点附近的帧
@@ -520,239 +682,331 @@ class ReIDProcessor:
         """
         logger.info(f"开始从视频中提取帧: {video_path}, 时间点: {timestamp_str}")
 
-        # 检查是否是URL
-        if video_path.startswith('http'):
-            logger.info("检测到URL视频路径，开始下载")
-            local_video_path = self._download_video_from_url(video_path)
-            if not local_video_path:
-                logger.error("下载视频失败")
-                return []
-            video_path = local_video_path
-
-        if not os.path.exists(video_path):
-            logger.error(f"视频文件不存在: {video_path}")
+        local_path = self._resolve_video_path(video_path)
+        if not local_path:
             return []
 
         try:
-            # 解析时间戳
-            if isinstance(timestamp_str, str):
-                timestamp = datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S")
-            else:
-                timestamp = timestamp_str
-
-            # 打开视频文件
-            cap = cv2.VideoCapture(video_path)
-            if not cap.isOpened():
-                logger.error(f"无法打开视频文件: {video_path}")
+            metadata = self._video_metadata(video_path, local_path)
+            if metadata is None or metadata.fps <= 0:
+                logger.error(f"无法读取视频信息: {local_path}")
                 return []
 
-            # 获取视频信息
-            fps = cap.get(cv2.CAP_PROP_FPS)
-            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            video_duration = total_frames / fps  # 视频总时长（秒）
+            # 打开视频文件，按关键帧索引 seek 后顺序解码
+            with FrameSampler(local_path, keyframes=metadata.keyframe_frames) as sampler:
+                if not sampler.isOpened():
+                    logger.error(f"无法打开视频文件: {local_path}")
+                    return []
+                window = self._frame_window(metadata, timestamp_str, window_seconds)
+                frames, _ = sampler.read_window(*window)
+            logger.info(f"完成帧提取，共提取 {len(frames)} 帧")
+            return frames
 
-            logger.info(f"视频信息: FPS={fps}, 总帧数={total_frames}, 时长={video_duration}秒")
+        except Exception as e:
+            logger.error(f"提取帧时发生错误: {str(e)}", exc_info=True)
+            return []
 
-            # 提取视频文件名中的日期和时间信息（假设格式为 camera_X_YYYY-MM-DD_HH-MM-SS.mp4）
-            video_filename = os.path.basename(video_path)
-            video_timestamp = None
+    def _cache_version(self, algorithm):
+        """特征缓存使用的模型版本：重识别模型和检测模型的权重版本，非 eager 后端的特征单独缓存"""
+        version = f"{weights_version(REID_MODEL_PATHS[algorithm])}|{weights_version(DEFAULT_YOLO_PATH)}"
+        # 按实际加载的后端区分（int8 没有校准数据等情况下会退回 eager）
+        backend = getattr(self._load_model(algorithm), 'backend', 'eager')
+        return version if backend == 'eager' else f"{version}|{backend}"
 
-            # 尝试从文件名解析时间
-            try:
-                parts = video_filename.split('_')
-                date_part = parts[-2]
-                time_part = parts[-1].split('.')[0]
+    def _decode_video_jobs(self, video_path, items, algorithm='mgn'):
+        """
+        流水线解码阶段：打开一段录像，按时间顺序读取各记录的帧窗口
 
-                date_obj = datetime.strptime(date_part, "%Y-%m-%d")
-                time_obj = datetime.strptime(time_part, "%H-%M-%S").time()
+        先按 (视频内容哈希, 帧窗口, 算法, 模型版本) 查询特征缓存，命中时不解码，直接带上特征。
 
-                video_timestamp = datetime.combine(date_obj.date(), time_obj)
-                logger.info(f"从文件名解析出视频开始时间: {video_timestamp}")
-            except Exception as e:
-                logger.warning(f"无法从文件名解析时间: {str(e)}")
-                video_timestamp = None
+        Args:
+            video_path: 记录中的录像路径（本地路径或 URL）
+            items: 使用该录像的 [(记录位置, 记录)]，按时间顺序排列
+            algorithm: 特征提取算法
 
-            # 计算目标时间点对应的帧位置
-            target_frame = None
+        Yields:
+            每条记录一个任务字典：index、record，以及 features（缓存命中或无法读取时为 None）
+            或 frames、frame_indices、cache_key（需要继续检测和提取特征）
+        """
+        local_path = self._resolve_video_path(video_path)
+        metadata = self._video_metadata(video_path, local_path) if local_path else None
+        if metadata is None or metadata.fps <= 0:
+            logger.error(f"无法读取视频信息: {video_path}")
+            for index, record in items:
+                yield {'index': index, 'record': record, 'features': None}
+            return
+
+        cache = self.embedding_cache
+        video_hash = version = None
+        if cache is not None:
+            try:
+                video_hash = file_fingerprint(local_path)
+                version = self._cache_version(algorithm)
+            except Exception as e:
+                logger.error(f"计算视频内容哈希失败: {e}", exc_info=True)
+                cache = None
+
+        # 同一录像只打开一次，相邻的帧窗口顺序解码
+        with FrameSampler(local_path, keyframes=metadata.keyframe_frames) as sampler:
+            if not sampler.isOpened():
+                logger.error(f"无法打开视频文件: {local_path}")
+            for index, record in items:
+                job = {'index': index, 'record': record, 'features': None}
+                if sampler.isOpened():
+                    try:
+                        self._decode_window(job, sampler, metadata, local_path, algorithm, video_hash, version, cache)
+                    except Exception as e:
+                        # 单条记录出错不影响同一录像的其他记录
+                        logger.error(f"从视频中提取记录 {record.get('id')} 的帧时出错: {e}", exc_info=True)
+                yield job
+
+    def _decode_window(self, job, sampler, metadata, local_path, algorithm, video_hash, version, cache):
+        """读取一条记录的帧窗口，缓存命中时直接填入特征"""
+        start_frame, end_frame, step = self._frame_window(metadata, job['record'].get('timestamp', ''))
+        if cache is not None:
+            try:
+                cached = cache.lookup_window(video_hash, start_frame, end_frame, step, algorithm, version)
+            except Exception as e:
+                logger.error(f"查询特征缓存失败: {e}", exc_info=True)
+                cached = None
+            if cached is not None:
+                logger.info(f"特征缓存命中: {local_path} 帧 {start_frame}-{end_frame}，{len(cached[2])} 个人物")
+                job['features'] = cached[2]
+                return
+            job['cache_key'] = (video_hash, start_frame, end_frame, step, version)
+
+        frames, frame_indices = sampler.read_window(start_frame, end_frame, step)
+        logger.info(f"完成帧提取，共提取 {len(frames)} 帧")
+        if not frames:
+            logger.warning("未能从视频中提取帧")
+            return
+        job['frames'] = frames
+        job['frame_indices'] = frame_indices
+
+    def _detect_job(self, job, save_dir=None):
+        """流水线检测阶段：在任务的帧中检测人物"""
+        frames = job.pop('frames', None)
+        if frames:
+            job['person_images'], job['boxes'] = self._detect_person_in_frames(
+                frames, save_dir=save_dir, camera_id=job['record'].get('camera_id'), return_boxes=True)
+        return job
+
+    def _embed_job(self, job, algorithm='mgn'):
+        """流水线特征提取阶段：对任务的图像或检测到的人物批量提取特征，并写入特征缓存"""
+        if job.get('image') is not None:
+            job['features'] = self.extract_feature_batch([job['image']], algorithm)
+            return job
+        if 'person_images' not in job:
+            return job
+
+        person_images = job['person_images']
+        if not person_images:
+            logger.warning("未在视频帧中检测到人物")
+            job['features'] = np.zeros((0, MGN_FEATURE_DIM if algorithm == 'mgn' else 0), dtype=np.float32)
+        else:
+            job['features'] = self.extract_feature_batch(person_images, algorithm)
 
-            if video_timestamp:
-                # 计算时间差（秒）
-                time_diff = (timestamp - video_timestamp).total_seconds()
+        cache_key = job.get('cache_key')
+        if self.embedding_cache is not None and cache_key is not None:
+            video_hash, start_frame, end_frame, step, version = cache_key
+            frame_indices = job['frame_indices']
+            try:
+                self.embedding_cache.store_window(
+                    video_hash, start_frame, end_frame, step, algorithm, version,
+                    [frame_indices[pos] for pos, _ in job['boxes']], [bbox for _, bbox in job['boxes']],
+                    job['features'])
+            except Exception as e:
+                logger.error(f"写入特征缓存失败: {e}", exc_info=True)
+        return job
 
-                if 0 <= time_diff <= video_duration:
-                    target_frame = int(time_diff * fps)
-                    logger.info(f"计算得到目标帧位置: {target_frame}")
-                else:
-                    logger.warning(f"目标时间点不在视频范围内: 时间差={time_diff}秒, 视频时长={video_duration}秒")
-
-            # 如果无法计算目标帧，则使用视频中间位置
-            if target_frame is None:
-                target_frame = total_frames // 2
-                logger.info(f"使用视频中间位置作为目标帧: {target_frame}")
-
-            # 计算提取帧的范围
-            start_frame = max(0, target_frame - int(window_seconds * fps / 2))
-            end_frame = min(total_frames - 1, target_frame + int(window_seconds * fps / 2))
-
-            logger.info(f"提取帧范围: {start_frame} 到 {end_frame}")
-
-            # 提取帧
-            frames = []
-            cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
-
-            # 每秒提取1帧
-            step = int(fps)
-            for frame_idx in range(start_frame, end_frame + 1, step):
-                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
-                ret, frame = cap.read()
-                if ret:
-                    frames.append(frame)
-                    logger.info(f"成功提取帧: {frame_idx}, 形状: {frame.shape}")
-                else:
-                    logger.warning(f"无法读取帧: {frame_idx}")
+    def _video_person_features(self, record, algorithm='mgn', save_dir=None):
+        """
+        从记录对应视频的帧窗口中检测人物并批量提取特征（单条记录，依次执行解码、检测、特征提取）
 
-            cap.release()
-            logger.info(f"完成帧提取，共提取 {len(frames)} 帧")
-            return frames
+        Args:
+            record: 带有 video_path 和 timestamp 的记录
+            algorithm: 特征提取算法
+            save_dir: 保存检测结果的目录路径（缓存命中时不会重新保存）
 
-        except Exception as e:
-            logger.error(f"提取帧时发生错误: {str(e)}", exc_info=True)
-            return []
+        Returns:
+            (人物图像列表, (N,d) 特征矩阵)；缓存命中时人物图像列表为空，无法读取视频时特征矩阵为 None
+        """
+        for job in self._decode_video_jobs(record['video_path'], [(0, record)], algorithm):
+            job = self._embed_job(self._detect_job(job, save_dir), algorithm)
+            return job.get('person_images', []), job['features']
+        return [], None
 
-    def _detect_person_in_frames(self, frames, save_dir=None, camera_id=None):
+    def _detect_person_in_frames(self, frames, save_dir=None, camera_id=None, return_boxes=False,
+                                 batch_size=DETECT_BATCH_SIZE, imgsz=DETECT_IMGSZ):
         """
-        使用YOLOv8在帧中检测人物并可选择保存到本地
+        使用YOLOv8在帧中批量检测人物并可选择保存到本地
+
+        帧按 batch_size 分批、以固定的 imgsz 送入检测器，每帧的检测框一次性转换为 NumPy 数组，
+        尺寸过滤、纵横比扩展和裁剪到图像范围对所有检测框向量化计算。保存裁剪图在后台线程中进行。
 
         Args:
             frames: 视频帧列表
             save_dir: 保存检测结果的目录路径，如不提供则不保存
             camera_id: 摄像头ID，用于命名保存的图像
+            return_boxes: 是否同时返回每个人物图像所在的帧位置和裁剪框
+            batch_size: 每次送入检测器的帧数
+            imgsz: 检测器的输入尺寸
 
         Returns:
-            检测到的人物图像列表
+            检测到的人物图像列表；return_boxes 为 True 时返回 (人物图像列表, [(帧在列表中的位置, [x1, y1, x2, y2])])
         """
         logger.info(f"开始在 {len(frames)} 帧中检测人物，使用YOLOv8模型")
 
         try:
-            # 使用YOLOv8替代HOG检测器
-            import torch
-            from ultralytics import YOLO
-
-            # 加载YOLOv8模型
-            model_path = os.path.join(os.path.dirname(__file__), '../resources/models/yolov8m.pt')
-            if not os.path.exists(model_path):
-                logger.info(f"YOLOv8模型不存在于 {model_path}，尝试下载预训练模型")
-                model = YOLO('yolov8m.pt')  # 自动下载预训练模型
-            else:
-                logger.info(f"加载本地YOLOv8模型: {model_path}")
-                model = YOLO(model_path)
-
-            # 强制使用 CPU
-            device = 'cpu'
-            model.to(device)  # 将模型移动到 CPU
-
-            person_images = []
+            # 使用YOLOv8替代HOG检测器，模型由注册表共享，只加载一次（CPU）
+            model_name = yolo_model_name()
+            model = model_registry.get(model_name)
 
             # 创建保存目录
             if save_dir:
                 os.makedirs(save_dir, exist_ok=True)
                 logger.info(f"行人图像将保存到: {save_dir}")
 
-            # 当前时间戳用于文件名
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-
             # 摄像头ID字符串，如果没有则使用unknown
             cam_id_str = f"cam{camera_id}" if camera_id is not None else "unknown"
 
-            # 设置检测参数
-            conf_threshold = 0.25  # 置信度阈值
-            person_class_id = 0  # YOLOv8中行人的类别ID是0
-
-            # ReID模型通常期望的输入尺寸
-            target_width = 128  # ReID模型期望的宽度
-            target_height = 256  # ReID模型期望的高度
-
-            # 最小尺寸要求，避免太小的检测框
-            min_width = 30
-            min_height = 90
-
-            # 跟踪已保存的行人检测总数，用于生成连续编号
-            person_count = 0
-
-            for i, frame in enumerate(frames):
-                # 执行检测
-                results = model(frame, conf=conf_threshold, classes=[person_class_id])
-
-                for j, result in enumerate(results):
-                    boxes = result.boxes  # 获取边界框
-
-                    # 处理每个检测到的人物
-                    for k, box in enumerate(boxes):
-                        # 获取边界框坐标
-                        x1, y1, x2, y2 = box.xyxy[0].cpu().numpy().astype(int)
-                        conf = float(box.conf[0])
-
-                        # 计算边界框尺寸
-                        box_width = x2 - x1
-                        box_height = y2 - y1
+            # 批量检测，每帧的检测框和置信度一次性转为 NumPy
+            frame_ids, xyxy, confs = [], [], []
+            batch_size = max(int(batch_size), 1)
+            for start in range(0, len(frames), batch_size):
+                batch = frames[start:start + batch_size]
+                # 共享的YOLO模型不能被多个线程同时调用
+                with model_registry.use_lock(model_name):
+                    results = model(batch, conf=DETECT_CONF_THRESHOLD, classes=[PERSON_CLASS_ID], imgsz=imgsz,
+                                    verbose=False)
+                for offset, result in enumerate(results):
+                    boxes = result.boxes
+                    if boxes is None or len(boxes) == 0:
+                        continue
+                    xyxy.append(boxes.xyxy.cpu().numpy())
+                    confs.append(boxes.conf.cpu().numpy())
+                    frame_ids.append(np.full(len(xyxy[-1]), start + offset, dtype=np.int64))
+
+            if not xyxy:
+                logger.info("人物检测完成，未检测到人物")
+                return ([], []) if return_boxes else []
+
+            frame_ids = np.concatenate(frame_ids)
+            confs = np.concatenate(confs)
+            shapes = np.array([frames[i].shape[:2] for i in range(len(frames))], dtype=np.int64)
+            keep, boxes = _expand_person_boxes(np.concatenate(xyxy), shapes[frame_ids, 0], shapes[frame_ids, 1])
+            logger.info(f"检测到 {len(keep)} 个行人边界框，过滤太小或空白的边界框后剩余 {int(keep.sum())} 个")
 
-                        # 忽略太小的检测框
-                        if box_width < min_width or box_height < min_height:
-                            logger.info(f"跳过太小的行人边界框: {box_width}x{box_height}, 帧{i}, 检测{k}")
-                            continue
-                        # 计算扩展比例，保持纵横比约为1:2（身高:宽度=2:1）
-                        aspect_ratio = box_height / box_width
-                        if aspect_ratio < 2:  # 如果人物太"扁"，增加高度
-                            height_extension = int((2 * box_width - box_height) / 2)
-                            y1 = max(0, y1 - height_extension)
-                            y2 = min(frame.shape[0], y2 + height_extension)
-                        elif aspect_ratio > 3:  # 如果人物太"瘦"，增加宽度
-                            width_extension = int((box_height / 3 - box_width) / 2)
-                            x1 = max(0, x1 - width_extension)
-                            x2 = min(frame.shape[1], x2 + width_extension)
-
-                        # 提取人物图像
-                        person_img = frame[y1:y2, x1:x2]
-                        if person_img.size == 0:
-                            logger.warning(f"跳过空白人物图像: 帧{i}, 检测{k}")
-                            continue
+            person_images = []
+            person_boxes = []
+            for frame_id, conf, (x1, y1, x2, y2) in zip(frame_ids[keep].tolist(), confs[keep].tolist(),
+                                                        boxes[keep].tolist()):
+                # 提取人物图像并调整为ReID模型期望的输入尺寸
+                person_img_resized = cv2.resize(frames[frame_id][y1:y2, x1:x2], (REID_CROP_WIDTH, REID_CROP_HEIGHT),
+                                                interpolation=cv2.INTER_AREA)
+                if save_dir:
+                    # 命名格式: person_摄像头ID_连续编号_置信度.jpg
+                    filepath = os.path.join(save_dir, f"person_{cam_id_str}_idx{len(person_images):04d}_conf{conf:.2f}.jpg")
+                    _crop_writer().submit(cv2.imwrite, filepath, person_img_resized)
+                person_images.append(person_img_resized)
+                person_boxes.append((frame_id, [x1, y1, x2, y2]))
 
-                        # 调整大小为ReID模型期望的输入尺寸
-                        person_img_resized = cv2.resize(person_img, (target_width, target_height),
-                                                        interpolation=cv2.INTER_AREA)
+            logger.info(f"人物检测完成，使用YOLOv8模型共提取 {len(person_images)} 个人物图像")
+            return (person_images, person_boxes) if return_boxes else person_images
 
-                        # 添加到结果列表
-                        person_images.append(person_img_resized)
+        except Exception as e:
+            logger.error(f"YOLOv8人物检测失败: {str(e)}", exc_info=True)
+            return ([], []) if return_boxes else []
 
-                        # 保存到本地
-                        if save_dir:
-                            # 新的命名格式: person_摄像头ID_时间戳_帧索引_检测索引_连续编号_置信度.jpg
-                            filename = f"person_{cam_id_str}_idx{person_count:04d}_conf{conf:.2f}.jpg"
-                            filepath = os.path.join(save_dir, filename)
-                            cv2.imwrite(filepath, person_img_resized)
-                            logger.info(f"已保存行人图像: {filepath}, 尺寸: {target_width}x{target_height}")
+    @staticmethod
+    def decode_base64_image(image_str):
+        """
+        解码 base64 图像（可带 data:image 前缀）
 
-                            # 更新连续编号
-                            person_count += 1
+        Returns:
+            BGR 图像，解码失败时返回 None
+        """
+        import base64
+        try:
+            # 检查是否包含data:image前缀
+            if ',' in image_str:
+                image_str = image_str.split(',', 1)[1]
+            nparr = np.frombuffer(base64.b64decode(image_str), np.uint8)
+            image_data = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            if image_data is not None:
+                logger.info(f"成功从base64解码图像，形状: {image_data.shape}")
+            else:
+                logger.error("从base64解码图像失败，结果为None")
+            return image_data
+        except Exception as e:
+            logger.error(f"解码base64图像时出错: {e}", exc_info=True)
+            return None
 
-            logger.info(f"人物检测完成，使用YOLOv8模型共提取 {len(person_images)} 个人物图像")
-            return person_images
+    def _load_record_image(self, record):
+        """读取记录中直接提供的图像（image、image_base64 或 image_path），没有时返回 None"""
+        image_data = None
+
+        # 检查记录中是否包含图像数据
+        if 'image' in record:
+            logger.info("使用直接提供的图像数据")
+            image_data = record['image']
+        elif 'image_base64' in record:
+            logger.info("检测到base64编码的图像数据")
+            image_data = self.decode_base64_image(record['image_base64'])
+
+        # 如果记录中没有图像数据，尝试从image_path加载
+        if image_data is None and 'image_path' in record:
+            logger.info(f"尝试从路径加载图像: {record['image_path']}")
+            try:
+                image_data = cv2.imread(record['image_path'])
+                if image_data is not None:
+                    logger.info(f"成功从路径加载图像，形状: {image_data.shape}")
+                else:
+                    logger.error(f"从路径加载图像失败，结果为None: {record['image_path']}")
+            except Exception as e:
+                logger.error(f"从路径加载图像时出错: {e}", exc_info=True)
+        return image_data
 
-        except Exception as e:
-            logger.error(f"YOLOv8人物检测失败: {str(e)}", exc_info=True)
+    def _feature_pipeline(self, algorithm='mgn', save_dir=None, workers=None):
+        """
+        构造 解码 -> 检测 -> 特征提取 三阶段流水线
 
-    def extract_features(self, records, algorithm='mgn', callback=None, save_dir=None):
+        Args:
+            algorithm: 特征提取算法
+            save_dir: 保存检测结果的目录路径
+            workers: 各阶段线程数，覆盖 PIPELINE_WORKERS 中的默认值
+        """
+        workers = {**PIPELINE_WORKERS, **(workers or {})}
+
+        def decode(task):
+            if task[0] == 'image':
+                _, index, record, image = task
+                return [{'index': index, 'record': record, 'image': image, 'features': None}]
+            _, video_path, items = task
+            return self._decode_video_jobs(video_path, items, algorithm)
+
+        return StagedPipeline([
+            Stage('decode', decode, workers['decode'], PIPELINE_QUEUE_SIZE),
+            Stage('detect', lambda job: [self._detect_job(job, save_dir)], workers['detect'], PIPELINE_QUEUE_SIZE),
+            Stage('embed', lambda job: [self._embed_job(job, algorithm)], workers['embed'], PIPELINE_QUEUE_SIZE),
+        ])
+
+    def extract_features(self, records, algorithm='mgn', callback=None, save_dir=None, workers=None):
         """
         提取特征向量，并返回匹配到的图像帧
 
+        录像解码、行人检测、特征提取在由有界队列连接的流水线中并行执行，同一录像的记录按时间顺序
+        交给同一个解码任务，只打开一次。
+
         参数:
             records: 包含图像信息的记录列表
             algorithm: 使用的特征提取算法，默认为'mgn'
             callback: 进度回调函数
             save_dir: 保存检测结果的目录路径
+            workers: 流水线各阶段的线程数，如 {'decode': 2, 'detect': 1, 'embed': 1}
 
         返回:
-            添加了特征向量和图像数据的记录列表
+            {'records', 'all_frames_features', 'query_feature'}，其中的特征向量均为 float32 数组
         """
         logger.info(f"开始批量特征提取，使用算法: {algorithm}，记录数量: {len(records)}")
         try:
@@ -797,143 +1051,86 @@ class ReIDProcessor:
             total_records = len(records)
             logger.info(f"总记录数: {total_records}")
 
+            # 生成流水线任务：直接提供图像的记录各一个任务，需要从录像中提取的记录按录像分组
+            tasks = []
+            video_groups = {}
             for idx, record in enumerate(records):
-                logger.info(f"处理第 {idx + 1}/{total_records} 条记录")
-
                 # 检查记录是否包含必要字段
                 if 'id' not in record:
                     logger.warning(f"记录缺少id字段: {record}")
                     record['id'] = idx  # 使用索引作为临时ID
                     logger.info(f"为记录分配临时ID: {idx}")
 
-                logger.info(f"处理记录ID: {record['id']}")
-
-                # 初始化帧特征数组
-                record_frames_features = []
-
-                # 尝试获取图像数据
-                image_data = None
-
-                # 检查记录中是否包含图像数据
-                if 'image' in record:
-                    logger.info("使用直接提供的图像数据")
-                    image_data = record['image']
-                elif 'image_base64' in record:
-                    logger.info("检测到base64编码的图像数据")
-                    import base64
-                    # 从base64解码图像
-                    try:
-                        # 检查是否包含data:image前缀
-                        image_str = record['image_base64']
-                        if ',' in image_str:
-                            logger.info("检测到data:image前缀，进行分割处理")
-                            image_str = image_str.split(',', 1)[1]
-
-                        logger.info("解码base64图像数据")
-                        image_bytes = base64.b64decode(image_str)
-                        nparr = np.frombuffer(image_bytes, np.uint8)
-                        image_data = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-                        if image_data is not None:
-                            logger.info(f"成功从base64解码图像，形状: {image_data.shape}")
-                        else:
-                            logger.error("从base64解码图像失败，结果为None")
-                    except Exception as e:
-                        logger.error(f"解码base64图像时出错: {e}", exc_info=True)
-
-                # 如果记录中没有图像数据，尝试从image_path加载
-                if image_data is None and 'image_path' in record:
-                    logger.info(f"尝试从路径加载图像: {record['image_path']}")
-                    try:
-                        image_data = cv2.imread(record['image_path'])
-                        if image_data is not None:
-                            logger.info(f"成功从路径加载图像，形状: {image_data.shape}")
-                        else:
-                            logger.error(f"从路径加载图像失败，结果为None: {record['image_path']}")
-                    except Exception as e:
-                        logger.error(f"从路径加载图像时出错: {e}", exc_info=True)
-
-                # 如果记录中没有图像数据，尝试从视频中提取
-                extracted_person_images = []
-                if image_data is None and 'video_path' in record and record['video_path']:
-                    logger.info(f"尝试从视频中提取图像: {record['video_path']}")
-                    try:
-                        # 从视频中提取帧
-                        frames = self._extract_frames_from_video(
-                            record['video_path'],
-                            record.get('timestamp', '')
-                        )
-
-                        if frames:
-                            # 从帧中检测人物
-                            person_images = self._detect_person_in_frames(frames, save_dir=save_dir, camera_id=record.get('camera_id'))
-                            extracted_person_images = person_images  # 保存所有检测到的人物图像
-
-                            if person_images:
-                                # 使用第一个检测到的人物图像作为主要图像
-                                image_data = person_images[0]
-                                logger.info(f"成功从视频中提取人物图像，形状: {image_data.shape}")
-                            else:
-                                logger.warning("未在视频帧中检测到人物")
-                        else:
-                            logger.warning("未能从视频中提取帧")
-                    except Exception as e:
-                        logger.error(f"从视频中提取图像时出错: {e}", exc_info=True)
-
-                # 保存提取到的所有图像帧
-                if extracted_person_images:
-                    record['extracted_frames'] = extracted_person_images
-                    logger.info(f"为记录 {record['id']} 添加了 {len(extracted_person_images)} 个提取的图像帧")
-
-                # 如果成功获取到图像数据，保存到记录中
+                image_data = self._load_record_image(record)
                 if image_data is not None:
-                    record['processed_image'] = image_data.copy()
-                    logger.info(f"为记录 {record['id']} 添加了处理后的图像数据")
+                    tasks.append(('image', idx, record, image_data))
+                elif record.get('video_path'):
+                    logger.info(f"记录 {record['id']} 将从视频中提取图像: {record['video_path']}")
+                    video_groups.setdefault(record['video_path'], []).append((idx, record))
+            for video_path, items in video_groups.items():
+                items.sort(key=lambda item: str(item[1].get('timestamp') or ''))
+                tasks.append(('video', video_path, items))
+
+            jobs = {}
+            done = total_records - sum(1 if task[0] == 'image' else len(task[2]) for task in tasks)
+            for job in self._feature_pipeline(algorithm, save_dir, workers).run(tasks):
+                if isinstance(job, StageError):
+                    # 出错的记录与没有图像数据的记录一样处理
+                    logger.error(f"特征提取流水线在 {job.stage} 阶段出错: {job.error}")
+                    continue
+                jobs[job['index']] = job
+                done += 1
+                logger.info(f"记录 {job['record']['id']} 特征提取完成 ({done}/{total_records})")
+
+                # 更新进度
+                if callback:
+                    progress = int(done / total_records * 100)
+                    logger.info(f"特征提取进度: {progress}%")
+                    callback('featureMatching', progress // 2)  # 前半部分进度
+            if callback and done < total_records:
+                callback('featureMatching', 50)
 
-                # 如果没有图像数据，使用一个默认图像
-                if image_data is None:
+            # 按输入顺序整理结果
+            for idx, record in enumerate(records):
+                job = jobs.get(idx, {})
+                features = job.get('features')
+                if features is None or not len(features) or not np.isfinite(features[0]).all():
                     logger.warning(f"记录 {record['id']} 没有图像数据，使用随机特征")
                     # 生成一个随机特征向量作为占位符
-                    feature_vector = np.random.rand(256).astype(np.float32)
-                    record['feature_vector'] = feature_vector.tolist()
+                    record['feature_vector'] = np.random.rand(256).astype(np.float32)
                     features_records.append(record)
                     logger.info(f"为记录 {record['id']} 添加了随机特征向量")
                     continue
 
-                # 为主图像提取特征向量
-                logger.info(f"为记录 {record['id']} 提取特征向量，使用算法: {algorithm}")
-                feature_vector = self._extract_feature_vector(image_data, algorithm)
+                # 直接提供的图像只有一个特征；视频中检测到的人物以第一个作为主图像，所有人物作为帧特征
+                feature_vector = features[0]
+                frame_features = features if job.get('image') is None else []
 
-                # 将特征向量添加到记录中
-                record['feature_vector'] = feature_vector.tolist()
+                # 将特征向量添加到记录中（float32 数组，序列化时再编码）
+                record['feature_vector'] = feature_vector
 
                 # 如果是查询记录，保存其特征向量
                 if record['id'] == 'query':
                     query_feature = feature_vector
                     logger.info("保存查询特征向量")
 
-                # 提取所有检测到的人物图像的特征
-                if extracted_person_images:
-                    logger.info(f"开始为记录 {record['id']} 的所有 {len(extracted_person_images)} 个检测图像提取特征")
+                # 整理所有检测到的人物图像的特征
+                record_frames_features = []
+                if len(frame_features):
+                    logger.info(f"记录 {record['id']} 的 {len(frame_features)} 个检测图像已批量提取特征")
                     camera_id = record.get('camera_id', 'unknown')
 
-                    # 为每个检测到的人物图像提取特征
-                    for i, person_img in enumerate(extracted_person_images):
-                        try:
-                            person_feature = self._extract_feature_vector(person_img, algorithm)
-                            if person_feature is not None:
-                                frame_info = {
-                                    'frame_index': i,
-                                    'feature_vector': person_feature.tolist(),
-                                    'record_id': record['id'],
-                                    'camera_id': camera_id,
-                                    'timestamp': record.get('timestamp', '')
-                                }
-                                record_frames_features.append(frame_info)
-                                logger.info(f"成功为记录 {record['id']} 的第 {i + 1} 个人物图像提取特征")
-                            else:
-                                logger.warning(f"记录 {record['id']} 的第 {i + 1} 个人物图像特征提取失败")
-                        except Exception as e:
-                            logger.error(f"为记录 {record['id']} 的第 {i + 1} 个人物图像提取特征时出错: {str(e)}")
+                    for i, person_feature in enumerate(frame_features):
+                        if not np.isfinite(person_feature).all():
+                            logger.warning(f"记录 {record['id']} 的第 {i + 1} 个人物图像特征提取失败")
+                            continue
+                        record_frames_features.append({
+                            'frame_index': i,
+                            'feature_vector': person_feature,
+                            'record_id': record['id'],
+                            'camera_id': camera_id,
+                            'timestamp': record.get('timestamp', '')
+                        })
 
                 # 将帧特征按摄像头ID组织
                 if record_frames_features:
@@ -944,20 +1141,9 @@ class ReIDProcessor:
                     logger.info(f"为摄像头 {camera_id} 添加了 {len(record_frames_features)} 个帧特征")
 
                 features_records.append(record)
-                logger.info(f"记录 {record['id']} 特征提取完成")
 
-                # 更新进度
-                if callback:
-                    progress = int((idx + 1) / total_records * 100)
-                    logger.info(f"特征提取进度: {progress}%")
-                    callback('featureMatching', progress // 2)  # 前半部分进度
-
-            # 处理可序列化性
+            # 删除无法序列化的图像数据；特征向量保持 float32 数组，由调用方用 encode_vector 编码
             for record in features_records:
-                if 'feature_vector' in record and isinstance(record['feature_vector'], np.ndarray):
-                    record['feature_vector'] = record['feature_vector'].tolist()
-
-                # 删除无法序列化的图像数据
                 for key in ['image', 'processed_image', 'extracted_frames']:
                     if key in record:
                         del record[key]
@@ -966,7 +1152,7 @@ class ReIDProcessor:
             result = {
                 'records': features_records,
                 'all_frames_features': all_frames_features,
-                'query_feature': query_feature.tolist() if query_feature is not None else None
+                'query_feature': query_feature
             }
 
             logger.info(f"特征提取完成，处理了 {len(features_records)} 条记录")
@@ -981,7 +1167,40 @@ class ReIDProcessor:
             logger.error(traceback.format_exc())
             raise Exception(f"记录缺少必要的字段或提取特征时出错: {str(e)}")
 
-    def match_features(self, records, threshold=0.6, callback=None, save_dir=None):
+    @staticmethod
+    def _make_match_info(record, camera_id, timestamp, similarity):
+        """构造一条主记录匹配结果"""
+        return {
+            'id': record.get('id'),
+            'camera_id': camera_id,
+            'timestamp': timestamp,
+            'student_id': record.get('student_id', ''),
+            'name': record.get('name', ''),
+            'location_x': record.get('location_x', 0),
+            'location_y': record.get('location_y', 0),
+            'confidence': similarity,
+            'video_path': record.get('video_path', ''),
+            'video_start_time': record.get('video_start_time', ''),
+            'video_end_time': record.get('video_end_time', ''),
+            'matched_frames': []  # 用于存储匹配的帧信息
+        }
+
+    @staticmethod
+    def _save_match_image(image, text, path, font_scale=1.0, bbox=None):
+        """在图像上标注匹配信息后保存"""
+        try:
+            img_with_info = image.copy()
+            cv2.putText(img_with_info, text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, font_scale, (0, 255, 0), 2)
+            # 绘制矩形框，如果有边界框信息
+            if bbox is not None:
+                x, y, w, h = bbox
+                cv2.rectangle(img_with_info, (x, y), (x + w, y + h), (0, 255, 0), 2)
+            cv2.imwrite(path, img_with_info)
+            logger.info(f"保存匹配图像: {path}")
+        except Exception as e:
+            logger.error(f"保存匹配图像 {path} 失败: {str(e)}")
+
+    def match_features(self, records, threshold=0.6, callback=None, save_dir=None, top_k=None):
         """
         对特征向量进行相似度匹配，并保存匹配结果图像
 
@@ -990,6 +1209,7 @@ class ReIDProcessor:
             threshold: 相似度阈值，低于此值的匹配将被忽略
             callback: 进度回调函数
             save_dir: 保存匹配结果图像的目录路径
+            top_k: 主记录最多保留相似度最高的 top_k 条（可选），帧级匹配不受限制
 
         Returns:
             匹配结果列表
@@ -1043,174 +1263,113 @@ class ReIDProcessor:
                 logger.error("未找到查询特征向量，无法进行匹配")
                 return []
 
-            # 将查询特征转换为numpy数组
-            if isinstance(query_feature, list):
-                query_feature = np.array(query_feature)
+            # 查询特征做 L2 归一化，之后相似度即为点积
+            query_vector = normalize_vector(query_feature)
+            if query_vector is None:
+                logger.error("查询特征向量无效，无法进行匹配")
+                return []
 
-            # 匹配主记录
+            # 匹配主记录：所有记录的特征堆叠为一个矩阵，一次矩阵-向量乘法得到全部相似度
             logger.info("开始匹配主记录")
             main_matches = []
-            total_records = len(features_records)
-
-            for i, record in enumerate(features_records):
-                if record.get('id') == 'query':
-                    continue  # 跳过查询记录
-
-                try:
-                    if 'feature_vector' in record:
-                        feature_vector = record['feature_vector']
-                        if isinstance(feature_vector, list):
-                            feature_vector = np.array(feature_vector)
-
-                        # 计算相似度
-                        similarity = 1 - cosine(query_feature, feature_vector)
-
-                        if similarity > threshold:
-                            match_info = {
-                                'id': record.get('id'),
-                                'camera_id': record.get('camera_id', 'unknown'),
-                                'timestamp': record.get('timestamp', ''),
-                                'student_id': record.get('student_id', ''),
-                                'name': record.get('name', ''),
-                                'location_x': record.get('location_x', 0),
-                                'location_y': record.get('location_y', 0),
-                                'confidence': float(similarity),
-                                'video_path': record.get('video_path', ''),
-                                'video_start_time': record.get('video_start_time', ''),
-                                'video_end_time': record.get('video_end_time', ''),
-                                'matched_frames': []  # 用于存储匹配的帧信息
-                            }
-                            main_matches.append(match_info)
-                            logger.info(f"找到主记录匹配: ID={record.get('id')}, 相似度={similarity}")
-
-                            # 保存主记录图像(如果有)
-                            if 'processed_image' in record and record['processed_image'] is not None:
-                                record_image = record['processed_image']
-                                if isinstance(record_image, np.ndarray):
-                                    # 添加标注信息
-                                    img_with_info = record_image.copy()
-                                    text = f"ID: {record.get('id')}, 相似度: {similarity:.2f}"
-                                    cv2.putText(img_with_info, text, (10, 30),
-                                                cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-
-                                    # 保存图像（添加相似度到文件名）
-                                    record_img_path = os.path.join(save_dir,
-                                                                   f"record_{record.get('id')}_sim_{similarity:.4f}.jpg")
-                                    cv2.imwrite(record_img_path, img_with_info)
-                                    logger.info(f"保存匹配记录图像: {record_img_path}")
-                            elif 'image' in record and record['image'] is not None:
-                                record_image = record['image']
-                                if isinstance(record_image, np.ndarray):
-                                    # 添加标注信息
-                                    img_with_info = record_image.copy()
-                                    text = f"ID: {record.get('id')}, 相似度: {similarity:.2f}"
-                                    cv2.putText(img_with_info, text, (10, 30),
-                                                cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-
-                                    # 保存图像（添加相似度到文件名）
-                                    record_img_path = os.path.join(save_dir,
-                                                                   f"record_{record.get('id')}_sim_{similarity:.4f}.jpg")
-                                    cv2.imwrite(record_img_path, img_with_info)
-                                    logger.info(f"保存匹配记录图像: {record_img_path}")
-                except Exception as e:
-                    logger.error(f"匹配记录 {record.get('id')} 时出错: {str(e)}")
-
-                # 更新进度
-                if callback:
-                    progress = int((i + 1) / total_records * 100)
-                    callback('featureMatching', 50 + progress // 2)  # 后半部分进度
-
-            # 匹配帧级特征
+            candidates = [record for record in features_records
+                          if record.get('id') != 'query' and 'feature_vector' in record]
+            matrix, valid = stack_normalized([record['feature_vector'] for record in candidates], len(query_vector))
+            scores = cosine_scores(matrix, valid, query_vector)
+            if (~valid).any():
+                logger.warning(f"{int((~valid).sum())} 条记录的特征向量无效或维度不符，已跳过")
+
+            # 按记录原顺序加入，最后统一按相似度排序
+            for i in np.sort(select_matches(scores, threshold, top_k)).tolist():
+                record = candidates[i]
+                similarity = float(scores[i])
+                main_matches.append(self._make_match_info(record, record.get('camera_id', 'unknown'),
+                                                          record.get('timestamp', ''), similarity))
+
+                # 保存主记录图像(如果有)
+                record_image = record.get('processed_image')
+                if record_image is None:
+                    record_image = record.get('image')
+                if save_dir and isinstance(record_image, np.ndarray):
+                    self._save_match_image(
+                        record_image,
+                        f"ID: {record.get('id')}, 相似度: {similarity:.2f}",
+                        os.path.join(save_dir, f"record_{record.get('id')}_sim_{similarity:.4f}.jpg"),
+                        font_scale=1
+                    )
+            logger.info(f"主记录匹配完成: {len(candidates)} 条记录中 {len(main_matches)} 条高于阈值")
+
+            # 更新进度
+            if callback:
+                callback('featureMatching', 100)
+
+            # 匹配帧级特征：所有摄像头的帧展开为一个矩阵一次计算
             logger.info(f"开始匹配各摄像头的帧级特征，共 {len(all_frames_features)} 个摄像头")
-
+            frame_list = []
+            frame_cameras = []
             for camera_id, frames in all_frames_features.items():
                 logger.info(f"处理摄像头 {camera_id} 的 {len(frames)} 个帧特征")
-
                 # 为该摄像头创建单独的保存目录
-                camera_save_dir = os.path.join(save_dir, f"camera_{camera_id}")
-                os.makedirs(camera_save_dir, exist_ok=True)
+                if save_dir:
+                    os.makedirs(os.path.join(save_dir, f"camera_{camera_id}"), exist_ok=True)
+                frame_list.extend(frames)
+                frame_cameras.extend([camera_id] * len(frames))
 
-                # 为每个帧计算与查询特征的相似度
-                for frame_info in frames:
-                    try:
-                        frame_feature = frame_info.get('feature_vector')
-                        if frame_feature:
-                            if isinstance(frame_feature, list):
-                                frame_feature = np.array(frame_feature)
-
-                            # 计算相似度
-                            similarity = 1 - cosine(query_feature, frame_feature)
-
-                            if similarity > threshold:
-                                # 找到对应的主记录
-                                record_id = frame_info.get('record_id')
-                                matched_record = next((r for r in main_matches if r.get('id') == record_id), None)
-
-                                # 如果找不到对应的主记录，可能是因为主记录相似度低于阈值
-                                # 在这种情况下，我们仍然保留高相似度的帧
-                                if matched_record is None:
-                                    # 查找原始记录
-                                    original_record = next((r for r in features_records if r.get('id') == record_id),
-                                                           None)
-
-                                    if original_record:
-                                        # 创建一个新的主匹配记录
-                                        matched_record = {
-                                            'id': record_id,
-                                            'camera_id': camera_id,
-                                            'timestamp': original_record.get('timestamp',
-                                                                             frame_info.get('timestamp', '')),
-                                            'student_id': original_record.get('student_id', ''),
-                                            'name': original_record.get('name', ''),
-                                            'location_x': original_record.get('location_x', 0),
-                                            'location_y': original_record.get('location_y', 0),
-                                            'confidence': float(similarity),  # 使用这个帧的相似度
-                                            'video_path': original_record.get('video_path', ''),
-                                            'video_start_time': original_record.get('video_start_time', ''),
-                                            'video_end_time': original_record.get('video_end_time', ''),
-                                            'matched_frames': []  # 用于存储匹配的帧信息
-                                        }
-                                        main_matches.append(matched_record)
-                                        logger.info(f"基于帧匹配创建新的主记录: ID={record_id}, 相似度={similarity}")
-
-                                # 添加匹配的帧信息
-                                if matched_record:
-                                    frame_match = {
-                                        'frame_index': frame_info.get('frame_index', 0),
-                                        'similarity': float(similarity),
-                                        'camera_id': camera_id,
-                                        'timestamp': frame_info.get('timestamp', '')
-                                    }
-                                    matched_record['matched_frames'].append(frame_match)
-                                    logger.info(
-                                        f"添加帧匹配: 记录ID={record_id}, 帧索引={frame_info.get('frame_index')}, 相似度={similarity}")
-
-                                    # 保存匹配的帧图像
-                                    if 'image' in frame_info and frame_info['image'] is not None:
-                                        frame_image = frame_info['image']
-                                        if isinstance(frame_image, np.ndarray):
-                                            # 添加标注信息
-                                            img_with_info = frame_image.copy()
-                                            text = f"ID: {record_id}, 帧: {frame_info.get('frame_index')}, 相似度: {similarity:.2f}"
-                                            cv2.putText(img_with_info, text, (10, 30),
-                                                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-
-                                            # 绘制矩形框，如果有边界框信息
-                                            if 'bbox' in frame_info and len(frame_info['bbox']) == 4:
-                                                x, y, w, h = frame_info['bbox']
-                                                cv2.rectangle(img_with_info, (x, y), (x + w, y + h), (0, 255, 0), 2)
-
-                                            # 保存图像（添加相似度到文件名）
-                                            frame_img_path = os.path.join(
-                                                camera_save_dir,
-                                                f"match_{record_id}_frame_{frame_info.get('frame_index')}_sim_{similarity:.4f}.jpg"
-                                            )
-                                            cv2.imwrite(frame_img_path, img_with_info)
-                                            logger.info(f"保存匹配帧图像: {frame_img_path}")
-                    except Exception as e:
-                        import traceback
-                        logger.error(f"匹配帧特征时出错: {str(e)}")
-                        logger.error(traceback.format_exc())
+            frame_matrix, frame_valid = stack_normalized(
+                [frame_info.get('feature_vector') for frame_info in frame_list], len(query_vector))
+            frame_scores = cosine_scores(frame_matrix, frame_valid, query_vector)
+
+            # 记录ID到匹配结果/原始记录的索引（相同ID取第一条）
+            matches_by_id = {}
+            for match in main_matches:
+                matches_by_id.setdefault(match['id'], match)
+            records_by_id = {}
+            for record in features_records:
+                records_by_id.setdefault(record.get('id'), record)
+
+            for i in np.sort(select_matches(frame_scores, threshold)).tolist():
+                frame_info = frame_list[i]
+                camera_id = frame_cameras[i]
+                similarity = float(frame_scores[i])
+                record_id = frame_info.get('record_id')
+                matched_record = matches_by_id.get(record_id)
+
+                # 如果找不到对应的主记录，可能是因为主记录相似度低于阈值
+                # 在这种情况下，我们仍然保留高相似度的帧
+                if matched_record is None:
+                    original_record = records_by_id.get(record_id)
+                    if original_record is None:
+                        continue
+                    # 创建一个新的主匹配记录，使用这个帧的相似度
+                    matched_record = self._make_match_info(
+                        original_record, camera_id,
+                        original_record.get('timestamp', frame_info.get('timestamp', '')), similarity)
+                    matched_record['id'] = record_id
+                    main_matches.append(matched_record)
+                    matches_by_id[record_id] = matched_record
+                    logger.info(f"基于帧匹配创建新的主记录: ID={record_id}, 相似度={similarity}")
+
+                # 添加匹配的帧信息
+                matched_record['matched_frames'].append({
+                    'frame_index': frame_info.get('frame_index', 0),
+                    'similarity': similarity,
+                    'camera_id': camera_id,
+                    'timestamp': frame_info.get('timestamp', '')
+                })
+
+                # 保存匹配的帧图像
+                frame_image = frame_info.get('image')
+                if save_dir and isinstance(frame_image, np.ndarray):
+                    bbox = frame_info.get('bbox')
+                    self._save_match_image(
+                        frame_image,
+                        f"ID: {record_id}, 帧: {frame_info.get('frame_index')}, 相似度: {similarity:.2f}",
+                        os.path.join(save_dir, f"camera_{camera_id}",
+                                     f"match_{record_id}_frame_{frame_info.get('frame_index')}_sim_{similarity:.4f}.jpg"),
+                        font_scale=0.7,
+                        bbox=bbox if bbox is not None and len(bbox) == 4 else None
+                    )
+            logger.info(f"帧级匹配完成: {len(frame_list)} 个帧特征")
 
             # 对匹配结果按相似度排序
             main_matches.sort(key=lambda x: x['confidence'], reverse=True)
@@ -1268,12 +1427,6 @@ class ReIDProcessor:
             成功返回轨迹记录ID，失败返回None
         """
         try:
-            # 确保数据库连接有效
-            if db_interface.conn.open is False:
-                db_interface.reconnect()
-
-            cursor = db_interface.conn.cursor()
-
             # 从轨迹数据中提取信息
             student_id = trajectory_data.get('studentId')
             time_range = trajectory_data.get('timeRange', [])
@@ -1331,19 +1484,20 @@ class ReIDProcessor:
             VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
             """
 
-            cursor.execute(insert_sql, (
-                student_id,
-                tracking_session_id,
-                start_time,
-                end_time,
-                path_points_json,
-                camera_sequence_str,
-                total_distance,
-                average_speed
-            ))
-
-            db_interface.conn.commit()
-            trajectory_id = cursor.lastrowid
+            with db_interface.connection() as conn, conn.cursor() as cursor:
+                cursor.execute(insert_sql, (
+                    student_id,
+                    tracking_session_id,
+                    start_time,
+                    end_time,
+                    path_points_json,
+                    camera_sequence_str,
+                    total_distance,
+                    average_speed
+                ))
+
+                conn.commit()
+                trajectory_id = cursor.lastrowid
 
             logger.info(f"已保存学生轨迹: ID={trajectory_id}, 学号={student_id}, 会话ID={tracking_session_id}")
             logger.info(f"轨迹摄像头序列: {camera_sequence_str}")
@@ -1355,9 +1509,6 @@ class ReIDProcessor:
             logger.error(f"保存轨迹数据失败: {str(e)}")
             logger.error(traceback.format_exc())
             return None
-        finally:
-            if 'cursor' in locals():
-                cursor.close()
 
     def get(self, param):
         """
@@ -1373,4 +1524,91 @@ class ReIDProcessor:
             return getattr(self, param)
         else:
             logger.warning(f"参数 {param} 不存在")
-            return None
\ No newline at end of file
+            return None
+
+
+def _warmup_reid_model(algorithm, model):
+    """用一批全零图像跑一次前向计算"""
+    height, width = REID_INPUT_SIZES[algorithm]
+    with torch.inference_mode():
+        model(torch.zeros((2, 3, height, width)))
+
+
+def calibration_image_paths(algorithm, calibration_dir=None):
+    """int8 校准图像的路径列表（按文件名排序，最多 CALIBRATION_MAX_IMAGES 张）"""
+    directory = os.path.join(calibration_dir or REID_CALIBRATION_DIR, algorithm)
+    if not os.path.isdir(directory):
+        return []
+    names = sorted(n for n in os.listdir(directory) if n.lower().endswith(('.jpg', '.jpeg', '.png')))
+    return [os.path.join(directory, n) for n in names[:CALIBRATION_MAX_IMAGES]]
+
+
+def load_calibration_batches(algorithm, calibration_dir=None, batch_size=CALIBRATION_BATCH_SIZE):
+    """
+    读取 int8 校准图像并预处理为模型输入批次
+
+    Args:
+        algorithm: 'mgn'、'agw' 或 'sbs'
+        calibration_dir: 校准图像根目录，默认为 REID_CALIBRATION_DIR，图像放在 <目录>/<算法>/ 下
+        batch_size: 每批图像数
+
+    Returns:
+        (N,3,H,W) 张量列表；可用图像少于 CALIBRATION_MIN_IMAGES 时返回 None
+    """
+    images = [cv2.imread(path) for path in calibration_image_paths(algorithm, calibration_dir)]
+    batch, _ = ReIDProcessor()._preprocess_crops([image for image in images if image is not None], algorithm)
+    if batch is None or len(batch) < CALIBRATION_MIN_IMAGES:
+        count = 0 if batch is None else len(batch)
+        logger.warning(f"{algorithm} 的 int8 校准图像不足: {count} < {CALIBRATION_MIN_IMAGES}")
+        return None
+    return [batch[start:start + batch_size] for start in range(0, len(batch), batch_size)]
+
+
+def build_reid_model(algorithm, backend=None, channels_last=None):
+    """
+    加载重识别模型并转换为指定的推理后端
+
+    Args:
+        algorithm: 'mgn'、'agw' 或 'sbs'
+        backend: 推理后端，默认为 REID_BACKENDS[algorithm]
+        channels_last: 是否使用 channels_last 内存格式，默认为 REID_CHANNELS_LAST
+    """
+    backend = backend or REID_BACKENDS.get(algorithm, 'eager')
+    channels_last = REID_CHANNELS_LAST if channels_last is None else channels_last
+    model = ReIDProcessor._build_model(algorithm)
+    calibration = None
+    if backend == 'int8':
+        calibration = load_calibration_batches(algorithm)
+        if calibration is None:
+            logger.error(f"{algorithm} 没有可用的校准图像（{os.path.join(REID_CALIBRATION_DIR, algorithm)}），"
+                         f"不使用 int8 后端，改用 eager 后端")
+            backend = 'eager'
+    try:
+        return prepare_model(model, backend, REID_INPUT_SIZES[algorithm], channels_last, calibration=calibration)
+    except Exception as e:
+        if backend == 'eager':
+            raise
+        logger.error(f"{algorithm} 模型转换为 {backend} 后端失败，改用 eager 后端: {e}", exc_info=True)
+        return prepare_model(model, 'eager', REID_INPUT_SIZES[algorithm], channels_last)
+
+
+def set_reid_backend(algorithm, backend):
+    """切换重识别模型的推理后端，已加载的模型会被卸载，下次使用时按新后端加载"""
+    if algorithm not in REID_INPUT_SIZES:
+        raise ValueError(f"不支持的算法: {algorithm}")
+    if backend not in BACKENDS:
+        raise ValueError(f"不支持的推理后端: {backend}")
+    if REID_BACKENDS.get(algorithm) != backend:
+        REID_BACKENDS[algorithm] = backend
+        model_registry.unload(f"reid:{algorithm}")
+
+
+def register_reid_models():
+    """在模型注册表中注册所有重识别模型"""
+    for algorithm in REID_INPUT_SIZES:
+        model_registry.register(f"reid:{algorithm}",
+                                functools.partial(build_reid_model, algorithm),
+                                functools.partial(_warmup_reid_model, algorithm))
+
+
+register_reid_models()
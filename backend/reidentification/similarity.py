@@ -0,0 +1,89 @@
+import logging
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+from backend.reidentification.embedding import EmbeddingMatrix, decode_vector
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def normalize_vector(vector) -> Optional[np.ndarray]:
+    """
+    将单个特征向量（np.ndarray、list 或 encode_vector 的编码字符串）转换为 L2 归一化的 float32 数组
+
+    Returns:
+        归一化后的向量；为空、含非有限值或范数为 0 时返回 None
+    """
+    vector = decode_vector(vector)
+    if vector is None or vector.size == 0 or not np.isfinite(vector).all():
+        return None
+    norm = float(np.linalg.norm(vector))
+    if norm == 0:
+        return None
+    return vector / norm
+
+
+def stack_normalized(vectors: Sequence, dim: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    将一组特征向量堆叠为 L2 归一化的连续 float32 矩阵
+
+    Args:
+        vectors: 特征向量序列（list、np.ndarray、encode_vector 的编码字符串或 None）
+        dim: 期望的维度，为 None 时取第一个有效向量的维度
+
+    Returns:
+        ((n, dim) 矩阵, 有效标记)；无效的向量（缺失、维度不符、范数为 0）对应行为 0
+    """
+    matrix = EmbeddingMatrix.from_values(vectors, dim).vectors
+
+    # 平方和同时用于归一化和检查非有限值（含 NaN/inf 的行平方和也不是有限值），避免生成整块临时矩阵
+    squared = np.einsum('ij,ij->i', matrix, matrix)
+    valid = np.isfinite(squared) & (squared > 0)
+    if not valid.all():
+        matrix[~valid] = 0
+    matrix *= np.where(valid, 1.0 / np.sqrt(np.where(valid, squared, 1.0)), 0.0).astype(np.float32)[:, None]
+    return np.ascontiguousarray(matrix), valid
+
+
+def cosine_scores(matrix: np.ndarray, valid: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """
+    一次矩阵-向量乘法计算所有行与查询向量的余弦相似度
+
+    Args:
+        matrix: stack_normalized 返回的归一化矩阵
+        valid: 有效标记
+        query: normalize_vector 返回的归一化查询向量
+
+    Returns:
+        相似度数组，无效行为 NaN
+    """
+    if matrix.shape[1] != query.shape[0]:
+        return np.full(len(matrix), np.nan, dtype=np.float32)
+    scores = matrix @ query
+    scores[~valid] = np.nan
+    return scores
+
+
+def select_matches(scores: np.ndarray, threshold: float, top_k: Optional[int] = None) -> np.ndarray:
+    """
+    选出相似度高于阈值的位置，可选只保留相似度最高的 top_k 个
+
+    Args:
+        scores: 相似度数组（NaN 视为不匹配）
+        threshold: 相似度阈值（严格大于）
+        top_k: 最多保留的数量，为 None 时全部保留
+
+    Returns:
+        位置数组，按相似度从高到低排列（相同相似度按原顺序）
+    """
+    candidates = np.flatnonzero(scores > threshold)
+    if top_k is not None and 0 <= top_k < len(candidates):
+        if top_k == 0:
+            return candidates[:0]
+        # argpartition 只需 O(n) 即可找出最高的 top_k 个
+        part = np.argpartition(-scores[candidates], top_k - 1)[:top_k]
+        candidates = np.sort(candidates[part])
+    order = np.argsort(-scores[candidates], kind='stable')
+    return candidates[order]
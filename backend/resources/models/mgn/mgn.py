@@ -3,6 +3,7 @@ import copy
 import torch
 from torch import nn
 import torch.nn.functional as F
+from torch.nn.utils.fusion import fuse_conv_bn_eval
 from torchvision.models.resnet import resnet50, Bottleneck
 
 def make_model(args):
@@ -172,4 +173,93 @@ class MGN(nn.Module):
         #将输出拼接成predict
         predict = torch.cat([fg_p1, fg_p2, fg_p3, f0_p2, f1_p2, f0_p3, f1_p3, f2_p3], dim=1) # 8*256=2048
 
-        return predict, fg_p1, fg_p2, fg_p3, l_p1, l_p2, l_p3, l0_p2, l1_p2, l0_p3, l1_p3, l2_p3
\ No newline at end of file
+        return predict, fg_p1, fg_p2, fg_p3, l_p1, l_p2, l_p3, l0_p2, l1_p2, l0_p3, l1_p3, l2_p3
+
+
+def _fuse_bottleneck(block):
+    """把 Bottleneck 中每个 BatchNorm 折叠进前面的卷积，BN 换成 Identity"""
+    block.conv1 = fuse_conv_bn_eval(block.conv1, block.bn1)
+    block.conv2 = fuse_conv_bn_eval(block.conv2, block.bn2)
+    block.conv3 = fuse_conv_bn_eval(block.conv3, block.bn3)
+    block.bn1 = nn.Identity()
+    block.bn2 = nn.Identity()
+    block.bn3 = nn.Identity()
+    if block.downsample is not None:
+        block.downsample = fuse_conv_bn_eval(block.downsample[0], block.downsample[1])
+    return block
+
+
+def _fuse_sequential(module):
+    """依次折叠 Sequential 中的 Conv2d + BatchNorm2d，递归处理其中的 Bottleneck"""
+    layers = []
+    children = list(module.children())
+    i = 0
+    while i < len(children):
+        layer = children[i]
+        if isinstance(layer, Bottleneck):
+            layers.append(_fuse_bottleneck(layer))
+        elif isinstance(layer, nn.Sequential):
+            layers.append(_fuse_sequential(layer))
+        elif (isinstance(layer, nn.Conv2d) and i + 1 < len(children)
+              and isinstance(children[i + 1], nn.BatchNorm2d)):
+            layers.append(fuse_conv_bn_eval(layer, children[i + 1]))
+            i += 1
+        else:
+            layers.append(layer)
+        i += 1
+    return nn.Sequential(*layers)
+
+
+class MGNEmbedding(nn.Module):
+    """仅用于推理的 MGN
+
+    与 MGN 共用权重，但 forward 只返回 8 个分支拼接的 2048 维特征，不计算 fc_id_* 分类头；
+    主干和降维模块中的 BatchNorm 都折叠进前面的卷积。只能由训练好的 MGN 转换得到（见 from_mgn）。
+    """
+
+    def __init__(self, mgn):
+        super(MGNEmbedding, self).__init__()
+        mgn = copy.deepcopy(mgn).eval()
+
+        self.backone = _fuse_sequential(mgn.backone)
+        self.p1 = _fuse_sequential(mgn.p1)
+        self.p2 = _fuse_sequential(mgn.p2)
+        self.p3 = _fuse_sequential(mgn.p3)
+
+        self.maxpool_zg_p1 = mgn.maxpool_zg_p1
+        self.maxpool_zg_p2 = mgn.maxpool_zg_p2
+        self.maxpool_zg_p3 = mgn.maxpool_zg_p3
+        self.maxpool_zp2 = mgn.maxpool_zp2
+        self.maxpool_zp3 = mgn.maxpool_zp3
+
+        # 降维模块：Conv + BN 折叠为带偏置的 Conv，后接 ReLU
+        self.reductions = nn.ModuleList(
+            _fuse_sequential(getattr(mgn, f'reduction_{i}')) for i in range(8))
+
+    @classmethod
+    def from_mgn(cls, mgn):
+        return cls(mgn).eval()
+
+    def forward(self, x):
+        x = self.backone(x)
+
+        p1 = self.p1(x)
+        p2 = self.p2(x)
+        p3 = self.p3(x)
+
+        zp2 = self.maxpool_zp2(p2)
+        zp3 = self.maxpool_zp3(p3)
+        parts = [
+            self.maxpool_zg_p1(p1),
+            self.maxpool_zg_p2(p2),
+            self.maxpool_zg_p3(p3),
+            zp2[:, :, 0:1, :],
+            zp2[:, :, 1:2, :],
+            zp3[:, :, 0:1, :],
+            zp3[:, :, 1:2, :],
+            zp3[:, :, 2:3, :],
+        ]
+
+        # 与 MGN.forward 中 predict 的拼接顺序一致：fg_p1, fg_p2, fg_p3, f0_p2, f1_p2, f0_p3, f1_p3, f2_p3
+        return torch.cat([reduction(z).flatten(1) for reduction, z in zip(self.reductions, parts)], dim=1)
+
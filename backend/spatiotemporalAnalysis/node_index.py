@@ -0,0 +1,118 @@
+import logging
+import threading
+import weakref
+from typing import Any, List, Optional, Tuple
+
+import networkx as nx
+import numpy as np
+from scipy.spatial import cKDTree
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS = 6371000  # 地球半径（米）
+
+
+def project_planar(lon: np.ndarray, lat: np.ndarray, ref_lat: float) -> Tuple[np.ndarray, np.ndarray]:
+    """以参考纬度做等距圆柱投影，将经纬度转换为平面坐标（米）；校园尺度下误差远小于1%"""
+    x = np.radians(lon) * EARTH_RADIUS * np.cos(np.radians(ref_lat))
+    y = np.radians(lat) * EARTH_RADIUS
+    return x, y
+
+
+class NodeIndex:
+    """校园图节点的空间索引
+
+    节点坐标投影到平面后建立 KD 树，最近节点查询为 O(log V)，并支持一次查询一批位置。
+    索引对应构建时的图，图被替换时通过 node_index_for() 自动得到新的索引。
+    """
+
+    def __init__(self, graph: nx.Graph):
+        """
+        为校园图构建节点索引
+
+        Args:
+            graph: 节点带有 longitude/latitude 属性的校园图，缺少坐标的节点不参与索引
+        """
+        nodes = [(node, data['longitude'], data['latitude']) for node, data in graph.nodes(data=True)
+                 if data.get('longitude') is not None and data.get('latitude') is not None]
+        self.node_ids: List[Any] = [node for node, _, _ in nodes]
+        lon = np.array([x for _, x, _ in nodes], dtype=np.float64)
+        lat = np.array([y for _, _, y in nodes], dtype=np.float64)
+        self.ref_lat = float(lat.mean()) if len(lat) else 0.0
+        self.node_count = graph.number_of_nodes()
+        self._tree = cKDTree(np.column_stack(project_planar(lon, lat, self.ref_lat))) if nodes else None
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def query(self, points: np.ndarray) -> Tuple[List[Optional[Any]], np.ndarray]:
+        """
+        批量查找最近的图节点
+
+        Args:
+            points: (k, 2) 的经纬度数组
+
+        Returns:
+            (节点列表, 距离数组（米）)，索引为空或坐标缺失时节点为 None、距离为 NaN
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        nodes: List[Optional[Any]] = [None] * len(points)
+        distances = np.full(len(points), np.nan)
+        valid = np.isfinite(points).all(axis=1)
+        if self._tree is None or not valid.any():
+            return nodes, distances
+
+        x, y = project_planar(points[valid, 0], points[valid, 1], self.ref_lat)
+        dist, pos = self._tree.query(np.column_stack([x, y]))
+        distances[valid] = dist
+        for i, p in zip(np.flatnonzero(valid).tolist(), pos.tolist()):
+            nodes[i] = self.node_ids[p]
+        return nodes, distances
+
+    def nearest(self, location: tuple) -> Optional[Any]:
+        """查找距离单个位置 (longitude, latitude) 最近的节点，找不到时返回 None"""
+        return self.query(np.array([location], dtype=np.float64))[0][0]
+
+
+_indexes: 'weakref.WeakKeyDictionary[nx.Graph, NodeIndex]' = weakref.WeakKeyDictionary()
+_indexes_lock = threading.Lock()
+
+
+def node_index_for(graph: nx.Graph) -> NodeIndex:
+    """
+    获取校园图的节点索引，同一个图对象只构建一次
+
+    图对象被替换时自然对应新的索引；节点数量变化时自动重建，
+    只修改节点坐标时需要调用 invalidate_node_index()。
+    """
+    index = _indexes.get(graph)
+    if index is not None and index.node_count == graph.number_of_nodes():
+        return index
+    with _indexes_lock:
+        index = _indexes.get(graph)
+        if index is None or index.node_count != graph.number_of_nodes():
+            index = NodeIndex(graph)
+            _indexes[graph] = index
+            logger.info(f"已构建校园图节点索引: {len(index)} 个节点")
+    return index
+
+
+def invalidate_node_index(graph: nx.Graph):
+    """丢弃校园图的节点索引，下次查询时重建"""
+    with _indexes_lock:
+        _indexes.pop(graph, None)
+
+
+def snap_to_graph(graph: nx.Graph, points: np.ndarray) -> list:
+    """
+    将每个点吸附到最近的图节点
+
+    Args:
+        graph: 节点带有 longitude/latitude 属性的校园图
+        points: (k, 2) 的经纬度数组
+
+    Returns:
+        长度为 k 的节点列表，无法吸附（图为空或坐标缺失）时为 None
+    """
+    return node_index_for(graph).query(points)[0]
@@ -1,28 +1,215 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Tuple, Optional
+from typing import Dict, Iterable, Iterator, List, Any, Tuple, Optional
 import logging
 import networkx as nx
 from scipy.spatial.distance import euclidean
 
+from backend.spatiotemporalAnalysis.node_index import node_index_for
+from backend.spatiotemporalAnalysis.travel_matrix import CameraTravelMatrix, graph_distance_matrix, planar_distance_matrix
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# filter_by_spatiotemporal_constraints 支持的过滤模式
+FILTER_MODES = ('greedy', 'optimal')
+
+
+def _to_epoch_seconds(values) -> np.ndarray:
+    """将时间戳序列转换为 float64 的秒数数组（带时区的先转换为 UTC）"""
+    timestamps = pd.Series(values)
+    if not pd.api.types.is_datetime64_any_dtype(timestamps):
+        timestamps = pd.to_datetime(timestamps)
+    if timestamps.dt.tz is not None:
+        timestamps = timestamps.dt.tz_convert('UTC').dt.tz_localize(None)
+    return timestamps.to_numpy().astype('datetime64[ns]').astype(np.int64) / 1e9
+
+
+def _greedy_feasible(times: np.ndarray, codes: np.ndarray, travel: np.ndarray) -> np.ndarray:
+    """
+    贪心可达性过滤：第一条记录保留，之后每条记录只有在从上一条保留记录出发来得及到达时才保留
+
+    时间、位置编号和行走时间矩阵都已预先用数组运算算好，这里只剩每条记录一次比较；
+    由于每一步都依赖上一条保留记录，逐条比较原生列表比分段调用 NumPy 的开销更小。
+
+    Args:
+        times: 按时间排序的秒数数组
+        codes: 每条记录的位置编号
+        travel: 位置编号之间的最短行走时间矩阵（秒），NaN 表示不可达
+
+    Returns:
+        保留记录的位置索引数组
+    """
+    if len(times) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    t = times.tolist()
+    c = codes.tolist()
+    rows = travel.tolist()
+
+    kept = [0]
+    prev_time = t[0]
+    prev_row = rows[c[0]]
+    for i in range(1, len(t)):
+        # 时间差大于等于最小所需时间（NaN 比较结果为 False，视为不可达）
+        if t[i] - prev_time >= prev_row[c[i]]:
+            kept.append(i)
+            prev_time = t[i]
+            prev_row = rows[c[i]]
+    return np.asarray(kept, dtype=np.int64)
+
+
+def _trajectory_edges(times: np.ndarray, codes: np.ndarray, travel: np.ndarray,
+                      max_time_gap: float, time_scale: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    构建轨迹图的边：只在可达时间窗口内把按时间排序的记录连接起来，图保持稀疏
+
+    记录 i 连向记录 j（i < j）当且仅当 0 <= t_j - t_i <= max_time_gap 且时间差不少于最短行走时间。
+    边的概率为 exp(-(时间差 - 行走时间) / time_scale)，行走越连贯（停留越少）概率越高。
+
+    Args:
+        times: 按时间排序的秒数数组
+        codes: 每条记录的位置编号
+        travel: 位置编号之间的最短行走时间矩阵（秒），NaN 表示不可达
+        max_time_gap: 两条相邻轨迹点之间允许的最大时间间隔（秒）
+        time_scale: 概率随多余时间衰减的尺度（秒）
+
+    Returns:
+        (src, dst, probability)，按 src 升序排列
+    """
+    n = len(times)
+    starts = np.arange(1, n + 1)
+    counts = np.searchsorted(times, times + max_time_gap, side='right') - starts
+    counts = np.maximum(counts, 0)
+
+    # 一次性展开所有时间窗口内的候选记录对 (i, j)
+    src = np.repeat(np.arange(n, dtype=np.int64), counts)
+    offsets = np.arange(len(src), dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+    dst = src + 1 + offsets
+
+    slack = (times[dst] - times[src]) - travel[codes[src], codes[dst]]
+    # NaN（不可达）比较结果为 False
+    feasible = slack >= 0
+    return src[feasible], dst[feasible], np.exp(-slack[feasible] / time_scale)
+
+
+def _best_dag_path(n: int, src: np.ndarray, dst: np.ndarray, weight: np.ndarray) -> List[int]:
+    """
+    在按拓扑序编号（src < dst）的 DAG 上求权重和最大的路径（Viterbi 式动态规划，O(V+E)）
+
+    Args:
+        n: 节点数
+        src, dst, weight: 按 src 升序排列的边
+
+    Returns:
+        最优路径的节点编号列表；没有边时返回第一个节点
+    """
+    if n == 0:
+        return []
+    score = np.zeros(n, dtype=np.float64)
+    pred = np.full(n, -1, dtype=np.int64)
+    bounds = np.searchsorted(src, np.arange(n + 1))
+    for i in range(n):
+        lo, hi = bounds[i], bounds[i + 1]
+        if lo == hi:
+            continue
+        targets = dst[lo:hi]
+        candidate = score[i] + weight[lo:hi]
+        better = candidate > score[targets]
+        if better.any():
+            targets = targets[better]
+            score[targets] = candidate[better]
+            pred[targets] = i
+
+    node = int(np.argmax(score))
+    path = [node]
+    while pred[node] >= 0:
+        node = int(pred[node])
+        path.append(node)
+    return path[::-1]
+
+
+def _optimal_feasible(times: np.ndarray, codes: np.ndarray, travel: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """
+    求权重和最大的时空可达子序列（相邻保留记录之间都来得及到达）
+
+    时间差超过最大行走时间的两条记录一定可达，所以只需在最大行走时间的窗口内逐对检查，
+    窗口之前的记录用前缀最大值一次取得，复杂度为 O(n·k)，k 为窗口内的平均记录数。
+
+    Args:
+        times: 按时间排序的秒数数组
+        codes: 每条记录的位置编号
+        travel: 位置编号之间的最短行走时间矩阵（秒），NaN 表示不可达
+        weights: 每条记录的权重（如 ReID 置信度）
+
+    Returns:
+        保留记录的位置索引数组
+    """
+    n = len(times)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    # 位置缺失（到自身都不可达）的记录不参与
+    valid = np.isfinite(travel[codes, codes])
+    if not valid.any():
+        return np.zeros(0, dtype=np.int64)
+    valid_codes = np.unique(codes[valid])
+    window = float(np.nanmax(travel[np.ix_(valid_codes, valid_codes)]))
+
+    # 窗口内可达的记录对，按终点排序
+    src, dst, _ = _trajectory_edges(times, codes, travel, window, 1.0)
+    order = np.argsort(dst, kind='stable')
+    src = src[order].tolist()
+    bounds = np.searchsorted(dst[order], np.arange(n + 1)).tolist()
+    # 窗口起点：第一个满足 t_i + window >= t_j 的记录，与 _trajectory_edges 的判断互补
+    window_start = np.searchsorted(times + window, times, side='left').tolist()
+
+    w = np.maximum(np.asarray(weights, dtype=np.float64), 1e-6).tolist()
+    valid = valid.tolist()
+    score = [-np.inf] * n
+    pred = [-1] * n
+    prefix_score = [-np.inf] * (n + 1)  # prefix_score[j] = max(score[:j])
+    prefix_arg = [-1] * (n + 1)
+    for j in range(n):
+        if valid[j]:
+            best, best_i = prefix_score[window_start[j]], prefix_arg[window_start[j]]
+            for i in src[bounds[j]:bounds[j + 1]]:
+                if score[i] > best:
+                    best, best_i = score[i], i
+            if best > 0:
+                score[j], pred[j] = best + w[j], best_i
+            else:
+                score[j] = w[j]
+        if score[j] > prefix_score[j]:
+            prefix_score[j + 1], prefix_arg[j + 1] = score[j], j
+        else:
+            prefix_score[j + 1], prefix_arg[j + 1] = prefix_score[j], prefix_arg[j]
+
+    node = prefix_arg[n]
+    kept = []
+    while node >= 0:
+        kept.append(node)
+        node = pred[node]
+    return np.asarray(kept[::-1], dtype=np.int64)
+
 
 class SpatiotemporalAnalysis:
     """时空约束分析模块，通过时空合理性约束对记录进行进一步过滤"""
 
-    def __init__(self, campus_map_graph: Optional[nx.Graph] = None, walking_speed: float = 1.4):
+    def __init__(self, campus_map_graph: Optional[nx.Graph] = None, walking_speed: float = 1.4,
+                 travel_matrix: Optional[CameraTravelMatrix] = None):
         """
         初始化时空约束分析模块
 
         Args:
             campus_map_graph: 校园地图的图形表示（可选），如果为None则使用欧几里得距离
             walking_speed: 平均步行速度，单位为米/秒，默认1.4m/s
+            travel_matrix: 预先计算的摄像头步行时间矩阵（可选），记录带有 camera_id 时直接查表
         """
         self.campus_graph = campus_map_graph
         self.walking_speed = walking_speed  # 平均步行速度 (m/s)
+        self.travel_matrix = travel_matrix
 
     def calculate_travel_time(self,
                               location1: tuple,
@@ -40,10 +227,10 @@ class SpatiotemporalAnalysis:
         if self.campus_graph is not None:
             # 如果有校园地图图形，使用最短路径距离
             try:
-                # 找到最近的节点
-                # 将方法名从 _find_nearest_node 改为 _find_closest_node
-                node1 = self._find_closest_node(location1)
-                node2 = self._find_closest_node(location2)
+                # 一次批量查询两个位置的最近节点
+                node1, node2 = self._find_closest_nodes([location1, location2])
+                if node1 is None or node2 is None:
+                    raise ValueError("无法找到最近的节点")
 
                 # 计算最短路径距离
                 path = nx.shortest_path(self.campus_graph, node1, node2, weight='weight')
@@ -96,24 +283,174 @@ class SpatiotemporalAnalysis:
         Returns:
             最近节点的ID
         """
-        min_distance = float('inf')
-        closest_node = None
-
-        for node, data in self.campus_graph.nodes(data=True):
-            node_location = (data['longitude'], data['latitude'])
-            distance = self._calculate_fallback_distance(location, node_location)
-
-            if distance < min_distance:
-                min_distance = distance
-                closest_node = node
+        closest_node = node_index_for(self.campus_graph).nearest(location)
 
         if closest_node is None:
             raise ValueError("无法找到最近的节点")
 
         return closest_node
 
-    def filter_by_spatiotemporal_constraints(self, records):
-        """基于时空约束过滤记录"""
+    def _find_closest_nodes(self, locations) -> list:
+        """
+        批量查找距离各位置最近的图节点
+
+        Args:
+            locations: (k, 2) 的经纬度数组或 (longitude, latitude) 序列
+
+        Returns:
+            长度为 k 的节点列表，无法找到时为 None
+        """
+        return node_index_for(self.campus_graph).query(np.asarray(locations, dtype=np.float64))[0]
+
+    def _location_travel_times(self, lon: np.ndarray, lat: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        对记录中出现的位置去重，计算位置之间的最短行走时间矩阵
+
+        Args:
+            lon: 每条记录的经度
+            lat: 每条记录的纬度
+
+        Returns:
+            (codes, travel)，codes 为每条记录的位置编号，travel[i, j] 为位置 i 到位置 j 的行走时间（秒）
+        """
+        # 经纬度合成一个复数作为键去重，比按行去重快得多
+        keys = np.asarray(lon, dtype=np.float64) + 1j * np.asarray(lat, dtype=np.float64)
+        unique_keys, codes = np.unique(keys, return_inverse=True)
+        unique = np.column_stack([unique_keys.real, unique_keys.imag])
+        codes = codes.ravel()
+
+        distance = planar_distance_matrix(unique)
+        if self.campus_graph is not None:
+            distance = graph_distance_matrix(self.campus_graph, unique, distance)
+
+        return codes, distance / self.walking_speed
+
+    def _travel_codes(self, lon: np.ndarray, lat: np.ndarray,
+                      camera_ids: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        获取每条记录的位置编号和位置之间的行走时间矩阵
+
+        记录带有 camera_id 且都在摄像头步行时间矩阵中时直接使用该矩阵，否则按坐标现场计算。
+
+        Returns:
+            (codes, travel)，含义同 _location_travel_times
+        """
+        if self.travel_matrix is not None and camera_ids is not None:
+            try:
+                camera_ids = np.asarray(camera_ids, dtype=np.float64)
+                if np.isfinite(camera_ids).all():
+                    codes, found = self.travel_matrix.indices(camera_ids.astype(np.int64))
+                    if found.all():
+                        return codes, self.travel_matrix.times
+            except Exception as e:
+                logger.warning(f"使用摄像头步行时间矩阵失败，按坐标计算: {e}")
+        return self._location_travel_times(lon, lat)
+
+    def _greedy_feasible_indices(self, sorted_records: pd.DataFrame, last: Optional[tuple] = None):
+        """
+        贪心选择时空上可达的记录：依次保留从上一条保留记录出发来得及到达的记录
+
+        Args:
+            sorted_records: 按时间排序的记录
+            last: 上一块最后保留记录的 (秒数, 经度, 纬度, 摄像头ID)，为 None 时保留第一条记录
+
+        Returns:
+            (保留记录的位置索引列表, 最后保留记录的 (秒数, 经度, 纬度, 摄像头ID))
+        """
+        times = _to_epoch_seconds(sorted_records['timestamp'])
+        lon = sorted_records['location_x'].to_numpy(dtype=np.float64)
+        lat = sorted_records['location_y'].to_numpy(dtype=np.float64)
+        camera_ids = None
+        if 'camera_id' in sorted_records.columns:
+            camera_ids = pd.to_numeric(sorted_records['camera_id'], errors='coerce').to_numpy(dtype=np.float64)
+
+        if last is not None:
+            # 把上一块最后保留的记录放在最前面，作为贪心的起点
+            times = np.concatenate([[last[0]], times])
+            lon = np.concatenate([[last[1]], lon])
+            lat = np.concatenate([[last[2]], lat])
+            if camera_ids is not None:
+                camera_ids = np.concatenate([[last[3]], camera_ids])
+
+        codes, travel = self._travel_codes(lon, lat, camera_ids)
+        kept = _greedy_feasible(times, codes, travel)
+        tail = kept[-1]
+        new_last = (times[tail], lon[tail], lat[tail], camera_ids[tail] if camera_ids is not None else np.nan)
+
+        if last is not None:
+            kept = kept[1:] - 1
+        return kept.tolist(), new_last
+
+    def iter_spatiotemporal_filter(self, chunks: Iterable[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+        """
+        对按时间顺序到达的记录块增量执行时空约束过滤
+
+        与 filter_by_spatiotemporal_constraints 的贪心规则相同，块与块之间只保留上一条
+        有效记录的时间和位置，可以直接消费 QueryFilter.iter_filtered_records 的输出。
+
+        Args:
+            chunks: 按时间顺序排列的记录块，每块需包含 timestamp、location_x、location_y
+
+        Yields:
+            每块中通过时空约束的记录
+        """
+        last = None
+        kept = 0
+        for chunk in chunks:
+            if chunk.empty:
+                continue
+            chunk = chunk.sort_values('timestamp').reset_index(drop=True)
+            indices, last = self._greedy_feasible_indices(chunk, last)
+            kept += len(indices)
+            if indices:
+                filtered = chunk.iloc[indices].copy()
+                if 'camera_id' in filtered.columns:
+                    names = filtered['name'] if 'name' in filtered.columns else pd.Series(index=filtered.index, dtype=object)
+                    filtered['name'] = [
+                        name if pd.notna(name) else f"摄像头{camera_id}"
+                        for camera_id, name in zip(filtered['camera_id'], names)
+                    ]
+                yield filtered
+
+        logger.info(f"流式时空约束过滤保留 {kept} 条记录")
+
+    @staticmethod
+    def _record_weights(sorted_records: pd.DataFrame) -> np.ndarray:
+        """记录的权重：优先使用 ReID 置信度（confidence/similarity 列），缺失时取已知值的均值，没有时为 1"""
+        for column in ('confidence', 'similarity'):
+            if column in sorted_records.columns:
+                weights = pd.to_numeric(sorted_records[column], errors='coerce')
+                if weights.notna().any():
+                    return weights.fillna(weights.mean()).to_numpy(dtype=np.float64)
+        return np.ones(len(sorted_records), dtype=np.float64)
+
+    def _optimal_feasible_indices(self, sorted_records: pd.DataFrame) -> list:
+        """求权重和最大的时空可达子序列，返回保留记录的位置索引列表"""
+        times = _to_epoch_seconds(sorted_records['timestamp'])
+        lon = sorted_records['location_x'].to_numpy(dtype=np.float64)
+        lat = sorted_records['location_y'].to_numpy(dtype=np.float64)
+        camera_ids = None
+        if 'camera_id' in sorted_records.columns:
+            camera_ids = pd.to_numeric(sorted_records['camera_id'], errors='coerce').to_numpy(dtype=np.float64)
+
+        codes, travel = self._travel_codes(lon, lat, camera_ids)
+        return _optimal_feasible(times, codes, travel, self._record_weights(sorted_records)).tolist()
+
+    def filter_by_spatiotemporal_constraints(self, records, mode: str = 'greedy'):
+        """
+        基于时空约束过滤记录
+
+        Args:
+            records: 记录DataFrame，需包含 timestamp、location_x、location_y
+            mode: 'greedy' 保留第一条记录并依次保留可达的记录；
+                  'optimal' 保留权重（ReID 置信度）之和最大的可达子序列，不会因为开头的一条误检丢掉后面的整段轨迹
+
+        Returns:
+            通过时空约束的记录
+        """
+        if mode not in FILTER_MODES:
+            raise ValueError(f"不支持的过滤模式: {mode}")
+
         if records.empty:
             return records
 
@@ -124,63 +461,100 @@ class SpatiotemporalAnalysis:
         # 先保存原始的摄像头ID和名称映射关系
         camera_names = {}
         if 'camera_id' in records.columns and 'name' in records.columns:
-            for _, row in records.iterrows():
-                if pd.notna(row['camera_id']) and pd.notna(row['name']):
-                    camera_names[row['camera_id']] = row['name']
+            named = records[records['camera_id'].notna() & records['name'].notna()]
+            named = named.drop_duplicates('camera_id', keep='last')
+            camera_names = dict(zip(named['camera_id'], named['name']))
 
         logger.info(f"提取的摄像头名称映射: {camera_names}")
 
         # 确保记录按时间排序
         sorted_records = records.sort_values('timestamp').reset_index(drop=True)
 
-        # 记录时间戳和位置信息
-        timestamps = pd.to_datetime(sorted_records['timestamp'])
-        locations = sorted_records.apply(lambda row: (row['location_x'], row['location_y']), axis=1)
-
-        # 创建结果列表
-        result_indices = []
-        # 初始化第一个记录
-        result_indices.append(0)
-        prev_timestamp = timestamps.iloc[0]
-        prev_location = locations.iloc[0]
-        for i in range(1, len(sorted_records)):
-            curr_timestamp = timestamps.iloc[i]
-            curr_location = locations.iloc[i]
-            # 计算时间差（秒）
-            time_diff = (curr_timestamp - prev_timestamp).total_seconds()
-            # 计算最小所需时间
-            min_required_time = self.calculate_travel_time(prev_location, curr_location)
-            # 如果时间差大于等于最小所需时间，则该记录是有效的
-            if time_diff >= min_required_time:
-                result_indices.append(i)
-                prev_timestamp = curr_timestamp
-                prev_location = curr_location
+        if mode == 'optimal':
+            result_indices = self._optimal_feasible_indices(sorted_records)
+        else:
+            result_indices, _ = self._greedy_feasible_indices(sorted_records)
 
         # 选择有效的记录 - 使用.copy()创建副本，确保不修改原始记录
         filtered_records = sorted_records.iloc[result_indices].copy()
 
         # 直接将名称重新应用到过滤后的记录中
         if 'camera_id' in filtered_records.columns:
-            filtered_records['name'] = filtered_records['camera_id'].apply(
-                lambda x: camera_names.get(x, f"摄像头{x}")
-            )
+            filtered_records['name'] = [camera_names.get(x, f"摄像头{x}") for x in filtered_records['camera_id'].tolist()]
 
         logger.info(f"过滤后记录列: {filtered_records.columns.tolist()}")
         logger.info(f"过滤后记录示例: {filtered_records.iloc[0].to_dict() if len(filtered_records) > 0 else '无记录'}")
 
         return filtered_records
 
+    def _prepare_trajectory(self, records: pd.DataFrame, max_time_gap: float, time_scale: float):
+        """按时间排序记录并计算轨迹图的边，返回 (排序后的记录, src, dst, probability)"""
+        sorted_records = records.sort_values('timestamp', kind='stable').reset_index(drop=True)
+        times = _to_epoch_seconds(sorted_records['timestamp'])
+        lon = sorted_records['location_x'].to_numpy(dtype=np.float64)
+        lat = sorted_records['location_y'].to_numpy(dtype=np.float64)
+        camera_ids = None
+        if 'camera_id' in sorted_records.columns:
+            camera_ids = pd.to_numeric(sorted_records['camera_id'], errors='coerce').to_numpy(dtype=np.float64)
+
+        codes, travel = self._travel_codes(lon, lat, camera_ids)
+        src, dst, probability = _trajectory_edges(times, codes, travel, max_time_gap, time_scale)
+        return sorted_records, src, dst, probability
+
+    @staticmethod
+    def _record_ids(sorted_records: pd.DataFrame) -> list:
+        if 'id' in sorted_records.columns:
+            return sorted_records['id'].tolist()
+        return sorted_records.index.tolist()
+
+    def create_trajectory_graph(self,
+                                records: pd.DataFrame,
+                                max_time_gap: float = 1800.0,
+                                time_scale: float = 300.0) -> nx.DiGraph:
+        """
+        创建轨迹图：节点为按时间排序的记录，边连接时间窗口内时空可达的记录对
+
+        Args:
+            records: 学生记录DataFrame，需包含 timestamp、location_x、location_y
+            max_time_gap: 相邻轨迹点之间允许的最大时间间隔（秒）
+            time_scale: 边概率随多余时间衰减的尺度（秒）
+
+        Returns:
+            有向无环图，节点编号即时间顺序，节点属性包含 record_id、timestamp、camera_id，
+            边属性 probability 为转移概率
+        """
+        G = nx.DiGraph()
+        if records.empty:
+            return G
+
+        sorted_records, src, dst, probability = self._prepare_trajectory(records, max_time_gap, time_scale)
+        record_ids = self._record_ids(sorted_records)
+        camera_ids = sorted_records['camera_id'].tolist() if 'camera_id' in sorted_records.columns else [None] * len(record_ids)
+        G.add_nodes_from(
+            (i, {'record_id': record_id, 'timestamp': timestamp, 'camera_id': camera_id})
+            for i, (record_id, timestamp, camera_id) in enumerate(
+                zip(record_ids, sorted_records['timestamp'].tolist(), camera_ids))
+        )
+        G.add_weighted_edges_from(zip(src.tolist(), dst.tolist(), probability.tolist()), weight='probability')
+        return G
+
     def find_most_likely_trajectory(self,
                                     records: pd.DataFrame,
                                     start_time: Optional[datetime] = None,
-                                    end_time: Optional[datetime] = None) -> List[int]:
+                                    end_time: Optional[datetime] = None,
+                                    max_time_gap: float = 1800.0,
+                                    time_scale: float = 300.0) -> List[int]:
         """
         找出最可能的学生轨迹
 
+        在轨迹图上按时间顺序做一次动态规划，求转移概率之和最大的路径。
+
         Args:
             records: 学生记录DataFrame
             start_time: 开始时间（可选）
             end_time: 结束时间（可选）
+            max_time_gap: 相邻轨迹点之间允许的最大时间间隔（秒）
+            time_scale: 边概率随多余时间衰减的尺度（秒）
 
         Returns:
             最可能轨迹的记录ID列表
@@ -189,7 +563,7 @@ class SpatiotemporalAnalysis:
             return []
 
         # 时间过滤
-        filtered_records = records.copy()
+        filtered_records = records
         if start_time is not None:
             filtered_records = filtered_records[filtered_records['timestamp'] >= start_time]
         if end_time is not None:
@@ -198,45 +572,14 @@ class SpatiotemporalAnalysis:
         if filtered_records.empty:
             return []
 
-        # 创建轨迹图
-        G = self.create_trajectory_graph(filtered_records)
-
-        if len(G.nodes) == 0:
-            return []
-
-        # 找到最早和最晚的节点
-        nodes_data = list(G.nodes(data=True))
-        sorted_nodes = sorted(nodes_data, key=lambda x: x[1]['timestamp'])
-        start_nodes = [node[0] for node in sorted_nodes[:3]]  # 考虑几个可能的起点
-        end_nodes = [node[0] for node in sorted_nodes[-3:]]  # 考虑几个可能的终点
-
-        # 找到最可能的路径
-        best_path = None
-        best_score = -float('inf')
-
-        for start_node in start_nodes:
-            for end_node in end_nodes:
-                try:
-                    # 使用最短路径（考虑概率作为权重）
-                    path = nx.dijkstra_path(G, start_node, end_node, weight=lambda u, v, d: 1 - d['probability'])
-
-                    # 计算路径得分
-                    path_score = sum(G[path[i]][path[i + 1]]['probability'] for i in range(len(path) - 1))
-
-                    if path_score > best_score:
-                        best_score = path_score
-                        best_path = path
-                except nx.NetworkXNoPath:
-                    continue
-
-        if best_path is None:
-            logger.warning("No valid trajectory found")
-            return []
+        # 直接在边数组上求解，不经过 networkx
+        sorted_records, src, dst, probability = self._prepare_trajectory(filtered_records, max_time_gap, time_scale)
+        best_path = _best_dag_path(len(sorted_records), src, dst, probability)
+        logger.info(f"轨迹图: {len(sorted_records)} 个节点, {len(src)} 条边, 最优路径 {len(best_path)} 个点")
 
         # 从路径节点提取记录ID
-        record_ids = [G.nodes[node]['record_id'] for node in best_path]
-        return record_ids
-
+        record_ids = self._record_ids(sorted_records)
+        return [record_ids[node] for node in best_path]
 
     def analyze_anomalies(self, records: pd.DataFrame) -> List[Dict[str, Any]]:
         """
@@ -256,40 +599,46 @@ class SpatiotemporalAnalysis:
         # 确保按时间排序
         sorted_records = records.sort_values(by='timestamp').reset_index()
 
-        for i in range(1, len(sorted_records)):
-            prev_record = sorted_records.iloc[i - 1]
-            curr_record = sorted_records.iloc[i]
-
-            # 计算时间差（秒）
-            time_diff = (curr_record['timestamp'] - prev_record['timestamp']).total_seconds()
-
-            # 获取位置坐标
-            prev_loc = (prev_record['location_x'], prev_record['location_y'])
-            curr_loc = (curr_record['location_x'], curr_record['location_y'])
-
-            # 计算估计行走时间
-            estimated_travel_time = self.calculate_travel_time(prev_loc, curr_loc)
-
-            # 检查是否有异常
-            # 1. 移动速度异常快
-            if time_diff < estimated_travel_time * 0.5:  # 速度比预期快一倍以上
+        # 相邻记录之间的时间差和估计行走时间（秒）
+        times = _to_epoch_seconds(sorted_records['timestamp'])
+        camera_ids = None
+        if 'camera_id' in sorted_records.columns:
+            camera_ids = pd.to_numeric(sorted_records['camera_id'], errors='coerce').to_numpy(dtype=np.float64)
+        codes, travel = self._travel_codes(sorted_records['location_x'].to_numpy(dtype=np.float64),
+                                           sorted_records['location_y'].to_numpy(dtype=np.float64),
+                                           camera_ids)
+        time_diff = np.diff(times)
+        estimated = travel[codes[:-1], codes[1:]]
+
+        with np.errstate(invalid='ignore'):
+            # 1. 移动速度异常快：速度比预期快一倍以上
+            high_speed = time_diff < estimated * 0.5
+            # 2. 速度比预期慢三倍以上
+            low_speed = ~high_speed & (time_diff > estimated * 3)
+
+        time_diff = time_diff.tolist()
+        estimated = estimated.tolist()
+        high_speed_list = high_speed.tolist()
+        for k in np.flatnonzero(high_speed | low_speed).tolist():
+            dt = time_diff[k]
+            est = estimated[k]
+            if high_speed_list[k]:
                 anomalies.append({
                     'type': 'high_speed',
-                    'prev_record_idx': prev_record.name,
-                    'curr_record_idx': curr_record.name,
-                    'time_diff': time_diff,
-                    'estimated_travel_time': estimated_travel_time,
-                    'speed_ratio': estimated_travel_time / time_diff if time_diff > 0 else float('inf')  # 速度比 = 预期时间 / 实际时间
+                    'prev_record_idx': k,
+                    'curr_record_idx': k + 1,
+                    'time_diff': dt,
+                    'estimated_travel_time': est,
+                    'speed_ratio': est / dt if dt > 0 else float('inf')  # 速度比 = 预期时间 / 实际时间
                 })
-
-            elif time_diff > estimated_travel_time * 3:  # 速度比预期慢三倍以上
+            else:
                 anomalies.append({
                     'type': 'low_speed',
-                    'prev_record_idx': prev_record.name,
-                    'curr_record_idx': curr_record.name,
-                    'time_diff': time_diff,
-                    'estimated_travel_time': estimated_travel_time,
-                    'speed_ratio': time_diff / estimated_travel_time if estimated_travel_time > 0 else float('inf')
+                    'prev_record_idx': k,
+                    'curr_record_idx': k + 1,
+                    'time_diff': dt,
+                    'estimated_travel_time': est,
+                    'speed_ratio': dt / est if est > 0 else float('inf')
                 })
 
         return anomalies
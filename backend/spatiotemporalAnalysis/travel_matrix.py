@@ -0,0 +1,208 @@
+import hashlib
+import logging
+import os
+import threading
+from typing import Optional, Sequence, Tuple
+
+import networkx as nx
+import numpy as np
+
+from backend.spatiotemporalAnalysis.node_index import invalidate_node_index, project_planar, snap_to_graph
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(__file__), '../resources/cache/travel_matrix')
+
+
+def planar_distance_matrix(points: np.ndarray) -> np.ndarray:
+    """
+    计算点集两两之间的平面距离
+
+    Args:
+        points: (k, 2) 的经纬度数组
+
+    Returns:
+        (k, k) 距离矩阵（米），坐标缺失的点对应 NaN
+    """
+    lat = points[:, 1]
+    ref_lat = np.nanmean(lat) if np.isfinite(lat).any() else 0.0
+    x, y = project_planar(points[:, 0], lat, ref_lat)
+    return np.hypot(x[:, None] - x[None, :], y[:, None] - y[None, :])
+
+
+def graph_distance_matrix(graph: nx.Graph, points: np.ndarray, fallback: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    计算点集两两之间沿校园图的最短路径距离，每个点只运行一次单源 Dijkstra
+
+    Args:
+        graph: 校园图，边权 weight 为距离（米）
+        points: (k, 2) 的经纬度数组
+        fallback: 无法在图上计算（无法吸附或不连通）时使用的距离矩阵，默认平面距离
+
+    Returns:
+        (k, k) 距离矩阵（米）
+    """
+    distance = planar_distance_matrix(points) if fallback is None else fallback.copy()
+    nodes = snap_to_graph(graph, points)
+
+    lengths_by_node = {}
+    for i, source in enumerate(nodes):
+        if source is None:
+            continue
+        if source not in lengths_by_node:
+            lengths_by_node[source] = nx.single_source_dijkstra_path_length(graph, source, weight='weight')
+        lengths = lengths_by_node[source]
+        for j, target in enumerate(nodes):
+            if target is not None and target in lengths:
+                distance[i, j] = lengths[target]
+    return distance
+
+
+def graph_hash(graph: Optional[nx.Graph]) -> str:
+    """根据节点坐标和边权计算校园图的指纹，图有任何变化都会得到不同的值"""
+    digest = hashlib.sha1()
+    if graph is not None:
+        for line in sorted(repr((node, data.get('longitude'), data.get('latitude')))
+                           for node, data in graph.nodes(data=True)):
+            digest.update(line.encode('utf-8'))
+        digest.update(b'|')
+        for line in sorted(repr(tuple(sorted((repr(u), repr(v)))) + (data.get('weight'),))
+                           for u, v, data in graph.edges(data=True)):
+            digest.update(line.encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+class CameraTravelMatrix:
+    """摄像头两两之间的步行时间矩阵
+
+    每个摄像头只吸附到校园图一次、只运行一次 Dijkstra，结果保存为 float32 的
+    n_cameras x n_cameras 矩阵，并以 (图指纹, 摄像头指纹, 步行速度) 为键缓存到 .npy 文件，
+    请求时查询任意两个摄像头的步行时间只需数组索引。
+    """
+
+    def __init__(self, graph: Optional[nx.Graph], walking_speed: float = 1.4,
+                 camera_registry=None, cache_dir: Optional[str] = DEFAULT_CACHE_DIR):
+        """
+        初始化步行时间矩阵
+
+        Args:
+            graph: 校园图（可选），为 None 或无法到达时使用平面距离
+            walking_speed: 平均步行速度（米/秒）
+            camera_registry: 摄像头缓存（CameraRegistry），提供摄像头坐标；缓存刷新后矩阵自动更新
+            cache_dir: .npy 缓存目录，为 None 时不落盘
+        """
+        self.graph = graph
+        self.walking_speed = walking_speed
+        self.camera_registry = camera_registry
+        self.cache_dir = cache_dir
+        self.camera_ids = np.zeros(0, dtype=np.int64)
+        self.times = np.zeros((0, 0), dtype=np.float32)
+        self._graph_hash = None
+        self._key = None
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.camera_ids)
+
+    def invalidate_graph(self):
+        """校园图被修改后调用，下次使用时重新计算图指纹并重建节点索引"""
+        self._graph_hash = None
+        if self.graph is not None:
+            invalidate_node_index(self.graph)
+
+    def _cache_path(self, key: str) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        return os.path.join(self.cache_dir, f"travel_{key}.npy")
+
+    def _make_key(self, camera_ids: np.ndarray, points: np.ndarray) -> str:
+        if self._graph_hash is None:
+            self._graph_hash = graph_hash(self.graph)
+        digest = hashlib.sha1()
+        digest.update(camera_ids.astype('<i8').tobytes())
+        digest.update(np.ascontiguousarray(points, dtype='<f8').tobytes())
+        digest.update(repr(float(self.walking_speed)).encode('utf-8'))
+        return f"{self._graph_hash}_{digest.hexdigest()[:16]}"
+
+    def build(self, camera_ids: Sequence[int], lon: Sequence[float], lat: Sequence[float]):
+        """
+        为给定的摄像头加载或计算步行时间矩阵
+
+        Args:
+            camera_ids: 摄像头ID
+            lon: 摄像头经度
+            lat: 摄像头纬度
+        """
+        order = np.argsort(np.asarray(camera_ids, dtype=np.int64), kind='stable')
+        camera_ids = np.asarray(camera_ids, dtype=np.int64)[order]
+        points = np.column_stack([np.asarray(lon, dtype=np.float64)[order],
+                                  np.asarray(lat, dtype=np.float64)[order]])
+
+        key = self._make_key(camera_ids, points)
+        if key == self._key:
+            return
+
+        path = self._cache_path(key)
+        times = None
+        if path and os.path.exists(path):
+            try:
+                times = np.load(path)
+                if times.shape != (len(camera_ids), len(camera_ids)):
+                    logger.warning(f"步行时间矩阵缓存形状不匹配，重新计算: {path}")
+                    times = None
+                else:
+                    logger.info(f"已加载步行时间矩阵缓存: {path}")
+            except Exception as e:
+                logger.warning(f"读取步行时间矩阵缓存失败，重新计算: {e}")
+                times = None
+
+        if times is None:
+            distance = planar_distance_matrix(points)
+            if self.graph is not None and self.graph.number_of_nodes() > 0:
+                distance = graph_distance_matrix(self.graph, points, distance)
+            times = (distance / self.walking_speed).astype(np.float32)
+            logger.info(f"已计算 {len(camera_ids)} 个摄像头的步行时间矩阵")
+            if path:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+                np.save(tmp_path, times)
+                os.replace(tmp_path, path)
+
+        self.camera_ids = camera_ids
+        self.times = times
+        self._key = key
+
+    def ensure(self):
+        """根据摄像头缓存的当前快照更新矩阵（快照未变化时不做任何事）"""
+        if self.camera_registry is None:
+            return
+        snapshot = self.camera_registry.snapshot()
+        if snapshot is self._snapshot:
+            return
+        with self._lock:
+            if snapshot is not self._snapshot:
+                self.build(snapshot.ids, snapshot.lon, snapshot.lat)
+                self._snapshot = snapshot
+
+    def indices(self, camera_ids) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        摄像头ID到矩阵行号的映射
+
+        Returns:
+            (行号数组, 是否存在的布尔数组)
+        """
+        self.ensure()
+        camera_ids = np.asarray(camera_ids, dtype=np.int64)
+        if len(self.camera_ids) == 0:
+            return np.zeros(camera_ids.shape, dtype=np.int64), np.zeros(camera_ids.shape, dtype=bool)
+        pos = np.minimum(np.searchsorted(self.camera_ids, camera_ids), len(self.camera_ids) - 1)
+        return pos, self.camera_ids[pos] == camera_ids
+
+    def travel_time(self, camera_a: int, camera_b: int) -> float:
+        """两个摄像头之间的步行时间（秒），摄像头不存在时返回 NaN"""
+        pos, found = self.indices([camera_a, camera_b])
+        if not found.all():
+            return float('nan')
+        return float(self.times[pos[0], pos[1]])
@@ -30,6 +30,26 @@ create table camera_videos
 create index camera_id
     on camera_videos (camera_id);
 
+create index idx_videos_camera_date
+    on camera_videos (camera_id, date, start_time);
+
+create table video_catalog
+(
+    video_path  varchar(255) not null
+        primary key,
+    fps         double       null,
+    frame_count int          null,
+    duration    double       null,
+    width       int          null,
+    height      int          null,
+    codec       varchar(16)  null,
+    start_time  datetime     null comment '录像开始时间',
+    keyframes   mediumblob   null comment '关键帧 (帧号, 字节偏移) 的 int64 小端数组',
+    file_size   bigint       null,
+    file_mtime  double       null,
+    updated_at  datetime     null
+);
+
 create table students
 (
     student_id      varchar(50)               not null
@@ -68,6 +88,24 @@ create table student_records
             on update cascade on delete cascade
 );
 
+create index idx_records_camera_time
+    on student_records (camera_id, timestamp);
+
+create index idx_records_student_time
+    on student_records (student_id, timestamp);
+
+-- /filter 的覆盖索引
+create index idx_records_filter
+    on student_records (timestamp, has_backpack, has_umbrella, clothing_color, camera_id, student_id);
+
+-- student_records.feature_vector 的变更日志，写入特征时在同一事务中追加，检索库按 seq 增量同步
+create table feature_changes
+(
+    seq       bigint auto_increment
+        primary key,
+    record_id int not null
+);
+
 create table student_trajectories
 (
     id                  int auto_increment
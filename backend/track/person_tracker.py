@@ -4,10 +4,11 @@ import cv2
 import os
 import torch
 import numpy as np
-from ultralytics import YOLO
 from ultralytics.utils.plotting import Annotator
 from collections import defaultdict
 
+from backend.reidentification.model_registry import model_registry, yolo_model_name
+
 
 class PersonTracker:
     def __init__(self, model_path="yolov8m.pt",
@@ -32,7 +33,9 @@ class PersonTracker:
         if not os.path.exists(self.tracker_config):
             raise FileNotFoundError(f"跟踪器配置文件未找到: {self.tracker_config}")
 
-        self.model = YOLO(model_path)
+        # 模型由进程内的注册表共享，只从磁盘加载一次
+        self.model_name = yolo_model_name(model_path, purpose='track')
+        self.model = model_registry.get(self.model_name)
         self.tracker_config = tracker_config
         self.conf = conf
         self.device = device
@@ -59,7 +62,7 @@ class PersonTracker:
     def stop_tracking(self):
         self.is_running = False
 
-    def track_people(self, source=0, show=True, max_trace_length=30, save_dir=None):
+    def track_people(self, source=0, show=True, max_trace_length=30, save_dir=None, metadata=None):
         """
         跟踪视频中的行人
 
@@ -68,6 +71,7 @@ class PersonTracker:
             show: 是否显示跟踪结果
             max_trace_length: 轨迹最大长度
             save_dir: 保存结果的目录
+            metadata: 录像目录中的元数据（VideoMetadata，可选），提供时使用其中的分辨率、帧率和精确帧数
 
         返回:
             处理后的视频路径
@@ -89,11 +93,16 @@ class PersonTracker:
             print(f"错误: 无法打开视频源 {source}")
             return None
 
-        # 获取视频属性
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        # 获取视频属性（优先使用录像目录中的元数据）
+        if metadata is not None and metadata.fps > 0 and metadata.width and metadata.height:
+            width, height = metadata.width, metadata.height
+            fps = metadata.fps
+            total_frames = metadata.frame_count
+        else:
+            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            fps = cap.get(cv2.CAP_PROP_FPS)
+            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
 
         # 设置输出视频编码器为H.264
         if platform.system() == 'Darwin':  # macOS
@@ -134,93 +143,101 @@ class PersonTracker:
         print(f"开始处理视频，总帧数: {total_frames}")
         self.is_running = True  # 重置运行状态
 
-        while cap.isOpened() and self.is_running:  # 添加运行状态检查
-            # 在每次循环开始检查是否应该继续
-            if not self.is_running:
-                print("接收到停止信号，中断处理")
-                break
-
-            ret, frame = cap.read()
-
-            # 检查是否成功读取帧
-            if not ret:
-                print("视频帧读取结束或出错")
-                break
-
-            # 调整图像大小进行处理
-            process_frame = cv2.resize(frame, (self.img_size[0], self.img_size[1]))
-
-            # 运行YOLO检测和跟踪
-            results = self.model.track(process_frame, persist=True, **model_kwargs)
-
-            # 获取跟踪结果
-            if results[0].boxes.id is not None:
-                boxes = results[0].boxes.xyxy.cpu().numpy()
-                track_ids = results[0].boxes.id.int().cpu().numpy()
-                confs = results[0].boxes.conf.cpu().numpy()
-
-                # 创建注释器
-                annotator = Annotator(frame)
-
-                # 处理每个跟踪目标
-                for box, track_id, conf in zip(boxes, track_ids, confs):
-                    x1, y1, x2, y2 = box
-
-                    # 调整回原始图像尺寸
-                    x1 = int(x1 * width / self.img_size[0])
-                    y1 = int(y1 * height / self.img_size[1])
-                    x2 = int(x2 * width / self.img_size[0])
-                    y2 = int(y2 * height / self.img_size[1])
-
-                    # 计算中心点
-                    center_x = int((x1 + x2) / 2)
-                    center_y = int((y1 + y2) / 2)
-
-                    # 获取该ID的唯一颜色
-                    color = self._get_color(track_id)
-
-                    # 添加到轨迹
-                    self.tracks[track_id].append((center_x, center_y))
-
-                    # 限制轨迹长度
-                    if len(self.tracks[track_id]) > max_trace_length:
-                        self.tracks[track_id] = self.tracks[track_id][-max_trace_length:]
-
-                    # 绘制边界框
-                    annotator.box_label([x1, y1, x2, y2], f"student:{track_id} {conf:.2f}", color=color)
-
-                    # 绘制轨迹
-                    points = self.tracks[track_id]
-                    for i in range(1, len(points)):
-                        cv2.line(frame, points[i - 1], points[i], color, 2)
-
-            # 添加帧计数
-            cv2.putText(frame, f"Frame: {frame_idx}/{total_frames}", (10, 30),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-
-            # 显示处理进度
-            if frame_idx % progress_interval == 0 or frame_idx == total_frames - 1:
-                progress = (frame_idx + 1) / total_frames * 100
-                print(f"进度: {progress:.1f}% ({frame_idx + 1}/{total_frames})")
-
-            # 写入输出视频
-            out.write(frame)
-
-            # 显示结果
-            if show:
-                try:
-                    cv2.imshow("Tracking", frame)
-                    cv2.waitKey(1)
-                except cv2.error:
-                    # 如果 imshow 失败，可以保存帧到临时文件
-                    if not hasattr(self, 'frame_count'):
-                        self.frame_count = 0
-                    # 每隔几帧保存一次，避免保存太多图片
-                    if self.frame_count % 5 == 0:
-                        cv2.imwrite(f"temp_frame_{self.frame_count}.jpg", frame)
-                    self.frame_count += 1
-
-            frame_idx += 1
+        # 所有 PersonTracker 共享同一个跟踪模型，persist=True 的跟踪器状态保存在模型的 predictor 上，
+        # 整段视频处理期间持有模型锁，避免并发的 /track 请求交错更新同一个跟踪器
+        with model_registry.use_lock(self.model_name):
+            # 重新开始跟踪，清除上一段视频留下的跟踪器状态
+            predictor = getattr(self.model, 'predictor', None)
+            if predictor is not None and hasattr(predictor, 'trackers'):
+                del predictor.trackers
+
+            while cap.isOpened() and self.is_running:  # 添加运行状态检查
+                # 在每次循环开始检查是否应该继续
+                if not self.is_running:
+                    print("接收到停止信号，中断处理")
+                    break
+
+                ret, frame = cap.read()
+
+                # 检查是否成功读取帧
+                if not ret:
+                    print("视频帧读取结束或出错")
+                    break
+
+                # 调整图像大小进行处理
+                process_frame = cv2.resize(frame, (self.img_size[0], self.img_size[1]))
+
+                # 运行YOLO检测和跟踪
+                results = self.model.track(process_frame, persist=True, **model_kwargs)
+
+                # 获取跟踪结果
+                if results[0].boxes.id is not None:
+                    boxes = results[0].boxes.xyxy.cpu().numpy()
+                    track_ids = results[0].boxes.id.int().cpu().numpy()
+                    confs = results[0].boxes.conf.cpu().numpy()
+
+                    # 创建注释器
+                    annotator = Annotator(frame)
+
+                    # 处理每个跟踪目标
+                    for box, track_id, conf in zip(boxes, track_ids, confs):
+                        x1, y1, x2, y2 = box
+
+                        # 调整回原始图像尺寸
+                        x1 = int(x1 * width / self.img_size[0])
+                        y1 = int(y1 * height / self.img_size[1])
+                        x2 = int(x2 * width / self.img_size[0])
+                        y2 = int(y2 * height / self.img_size[1])
+
+                        # 计算中心点
+                        center_x = int((x1 + x2) / 2)
+                        center_y = int((y1 + y2) / 2)
+
+                        # 获取该ID的唯一颜色
+                        color = self._get_color(track_id)
+
+                        # 添加到轨迹
+                        self.tracks[track_id].append((center_x, center_y))
+
+                        # 限制轨迹长度
+                        if len(self.tracks[track_id]) > max_trace_length:
+                            self.tracks[track_id] = self.tracks[track_id][-max_trace_length:]
+
+                        # 绘制边界框
+                        annotator.box_label([x1, y1, x2, y2], f"student:{track_id} {conf:.2f}", color=color)
+
+                        # 绘制轨迹
+                        points = self.tracks[track_id]
+                        for i in range(1, len(points)):
+                            cv2.line(frame, points[i - 1], points[i], color, 2)
+
+                # 添加帧计数
+                cv2.putText(frame, f"Frame: {frame_idx}/{total_frames}", (10, 30),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+
+                # 显示处理进度
+                if frame_idx % progress_interval == 0 or frame_idx == total_frames - 1:
+                    progress = (frame_idx + 1) / total_frames * 100
+                    print(f"进度: {progress:.1f}% ({frame_idx + 1}/{total_frames})")
+
+                # 写入输出视频
+                out.write(frame)
+
+                # 显示结果
+                if show:
+                    try:
+                        cv2.imshow("Tracking", frame)
+                        cv2.waitKey(1)
+                    except cv2.error:
+                        # 如果 imshow 失败，可以保存帧到临时文件
+                        if not hasattr(self, 'frame_count'):
+                            self.frame_count = 0
+                        # 每隔几帧保存一次，避免保存太多图片
+                        if self.frame_count % 5 == 0:
+                            cv2.imwrite(f"temp_frame_{self.frame_count}.jpg", frame)
+                        self.frame_count += 1
+
+                frame_idx += 1
 
         # 保存最后一帧作为结果图像
         cv2.imwrite('./tracking_results/images/results.jpg', frame)